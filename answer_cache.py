@@ -0,0 +1,243 @@
+"""
+Redis-backed cache of expert answers for repeated questions
+
+Answers are keyed by expert name, a hash of the expert's instructions (so
+editing experts.yaml invalidates them) and the normalized question. Each
+expert namespace keeps its answers, their normalized questions and an
+insertion index in three keys; a Lua script stores an answer and evicts
+expired and excess entries atomically. Near-duplicate questions can
+optionally be matched by character shingle Jaccard similarity against the
+most recently stored questions.
+
+The cache ignores conversation history, so only enable it where the same
+question deserves the same answer.
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+
+import redis.asyncio as redis
+
+from expert_router import normalize
+from redis_session import RedisSessionManager
+
+DEFAULT_ANSWER_TTL = 86400  # 1 day
+
+# KEYS[1]: answers hash, KEYS[2]: questions hash, KEYS[3]: index zset
+# ARGV[1]: question hash, ARGV[2]: entry JSON, ARGV[3]: normalized question,
+# ARGV[4]: now (seconds), ARGV[5]: TTL in seconds, ARGV[6]: max entries
+# Returns: number of evicted entries
+_PUT_ANSWER_SCRIPT = """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[1])
+local stale = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', tonumber(ARGV[4]) - tonumber(ARGV[5]))
+local excess = redis.call('ZCARD', KEYS[3]) - #stale - tonumber(ARGV[6])
+if excess > 0 then
+    for _, member in ipairs(redis.call('ZRANGE', KEYS[3], #stale, #stale + excess - 1)) do
+        table.insert(stale, member)
+    end
+end
+for i = 1, #stale, 1000 do
+    local batch = {unpack(stale, i, math.min(i + 999, #stale))}
+    redis.call('ZREM', KEYS[3], unpack(batch))
+    redis.call('HDEL', KEYS[1], unpack(batch))
+    redis.call('HDEL', KEYS[2], unpack(batch))
+end
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+redis.call('EXPIRE', KEYS[3], ARGV[5])
+return #stale
+"""
+
+
+class CachedAnswer(NamedTuple):
+    """An answer served from the cache"""
+    answer: str
+    latency_ms: float
+    similarity: float
+
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    """Character shingles of a normalized question (whitespace ignored)"""
+    compact = text.replace(" ", "")
+    if len(compact) <= size:
+        return {compact} if compact else set()
+    return {compact[i:i + size] for i in range(len(compact) - size + 1)}
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def cached_turn_items(question: str, answer: str) -> List[Dict[str, Any]]:
+    """Session items recording a turn answered from the cache"""
+    return [
+        {"role": "user", "content": question},
+        {"role": "assistant", "content": answer}
+    ]
+
+
+class AnswerCache:
+    """Caches expert answers in Redis"""
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        ttl_seconds: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        similarity: Optional[float] = None,
+        max_candidates: Optional[int] = None
+    ):
+        """
+        Initialize answer cache
+
+        Args:
+            client: Redis client (binary, as created by RedisSessionManager)
+            ttl_seconds: Lifetime of a cached answer
+                (defaults to ANSWER_CACHE_TTL env var, 1 day)
+            max_entries: Maximum answers kept per expert; the oldest are evicted
+                (defaults to ANSWER_CACHE_MAX_ENTRIES env var, 1000)
+            similarity: Minimum shingle Jaccard similarity for a near-duplicate
+                match; 0 disables it (defaults to ANSWER_CACHE_SIMILARITY env var, 0)
+            max_candidates: Number of most recent questions compared for a
+                near-duplicate match, which bounds the cost of a lookup
+                (defaults to ANSWER_CACHE_MAX_CANDIDATES env var, 200)
+        """
+        self.client = client
+        self.ttl_seconds = ttl_seconds or int(os.getenv("ANSWER_CACHE_TTL", str(DEFAULT_ANSWER_TTL)))
+        self.max_entries = max_entries or int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+        self.similarity = similarity if similarity is not None else float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
+        self.max_candidates = max_candidates or int(os.getenv("ANSWER_CACHE_MAX_CANDIDATES", "200"))
+        self._put_script = client.register_script(_PUT_ANSWER_SCRIPT)
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.latency_saved_ms = 0.0
+
+    def _keys(self, expert_name: str, instructions: str) -> List[str]:
+        digest = hashlib.sha256(instructions.encode("utf-8")).hexdigest()[:16]
+        # The hash tag keeps the three keys in one Redis Cluster slot for the store script
+        namespace = f"openai_agent_answer:{{{expert_name}:{digest}}}"
+        return [f"{namespace}:answers", f"{namespace}:questions", f"{namespace}:index"]
+
+    @staticmethod
+    def _question_hash(normalized: str) -> str:
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def _decode(self, raw: Optional[bytes]) -> Optional[Dict[str, Any]]:
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        # Entries past their TTL are evicted lazily by the next store
+        if time.time() - entry["stored_at"] > self.ttl_seconds:
+            return None
+        return entry
+
+    async def get(self, expert_name: str, instructions: str, question: str) -> Optional[CachedAnswer]:
+        """
+        Look up a cached answer
+
+        Returns:
+            The cached answer, or None on a miss
+        """
+        answers_key, questions_key, index_key = self._keys(expert_name, instructions)
+        normalized = normalize(question)
+        question_hash = self._question_hash(normalized)
+
+        if self.similarity > 0:
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.hget(answers_key, question_hash)
+                pipe.zrevrange(index_key, 0, self.max_candidates - 1)
+                raw, recent = await pipe.execute()
+        else:
+            raw, recent = await self.client.hget(answers_key, question_hash), []
+
+        entry = self._decode(raw)
+        similarity = 1.0
+        if entry is None and recent:
+            # Fall back to the most similar of the newest stored questions
+            candidates = await self.client.hmget(questions_key, recent)
+            target = shingles(normalized)
+            best_hash, similarity = None, 0.0
+            for candidate_hash, candidate in zip(recent, candidates):
+                if candidate is None:
+                    continue
+                score = jaccard(target, shingles(candidate.decode("utf-8")))
+                if score > similarity:
+                    best_hash, similarity = candidate_hash, score
+            if best_hash is not None and similarity >= self.similarity:
+                entry = self._decode(await self.client.hget(answers_key, best_hash))
+
+        if entry is None:
+            self.misses += 1
+            return None
+        if similarity < 1.0:
+            self.near_hits += 1
+        else:
+            self.hits += 1
+        self.latency_saved_ms += entry["latency_ms"]
+        return CachedAnswer(entry["answer"], entry["latency_ms"], similarity)
+
+    async def put(
+        self,
+        expert_name: str,
+        instructions: str,
+        question: str,
+        answer: str,
+        latency_ms: float
+    ) -> None:
+        """
+        Store an answer
+
+        Args:
+            expert_name: Expert that answered
+            instructions: The expert's instructions
+            question: The question as asked
+            answer: The expert's final output
+            latency_ms: Time the model took to answer (credited on later hits)
+        """
+        normalized = normalize(question)
+        if not normalized:
+            return
+        now = time.time()
+        entry = json.dumps({
+            "question": question,
+            "answer": answer,
+            "latency_ms": latency_ms,
+            "stored_at": now
+        }, ensure_ascii=False)
+        evicted = await self._put_script(
+            keys=self._keys(expert_name, instructions),
+            args=[self._question_hash(normalized), entry, normalized, now, self.ttl_seconds, self.max_entries],
+            client=self.client
+        )
+        self.stores += 1
+        self.evictions += evicted
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit, miss and latency-saved counters"""
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "latency_saved_ms": self.latency_saved_ms
+        }
+
+
+def create_answer_cache(manager: RedisSessionManager, redis_url: Optional[str] = None) -> Optional[AnswerCache]:
+    """Create an AnswerCache on the manager's pool if ANSWER_CACHE is enabled"""
+    if os.getenv("ANSWER_CACHE", "").lower() not in ("1", "true"):
+        return None
+    return AnswerCache(manager.get_client(redis_url))
@@ -0,0 +1,281 @@
+"""
+質問ファイルをトリアージ形式または会議形式でまとめて実行するバッチランナー
+
+入力は1行1件のJSON:
+    {"question": "...", "session_id": "...", "expert": "...", "id": "..."}
+session_id、expert（専門家を指定してトリアージ/司会者を省略）、idは省略できる。
+session_idを共有する質問はファイルの順番どおりに同じ会話として実行し、
+session_idのない質問は使い捨てのセッションで独立に実行する。
+
+結果は完了した順に出力ファイルへ1行ずつ書き込む。出力ファイルがそのまま
+チェックポイントになり、--resumeを付けると完了済みの質問を飛ばして再開する。
+
+使い方:
+    python batch_runner.py questions.jsonl results.jsonl [--mode triage|conference]
+        [--concurrency 8] [--rate 0] [--resume] [--keep-sessions] [--json]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set
+
+import main as triage_app
+import main_conference as conference_app
+from answer_cache import create_answer_cache
+from expert_router import ExpertRouter
+from redis_session import RedisSession, get_session_manager
+from session_views import HistoryProjection
+from telemetry import configure_telemetry
+
+
+def _silent(text: str) -> None:
+    pass
+
+
+def percentile(values: List[float], percent: float) -> Optional[float]:
+    """最近傍順位法によるパーセンタイル"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(len(ordered) * percent / 100) - 1, 0)
+    return ordered[rank]
+
+
+class RateLimiter:
+    """質問の開始を1秒あたりrate件までに制限する（0は無制限）"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            if self._next_start > now:
+                await asyncio.sleep(self._next_start - now)
+                now = self._next_start
+            self._next_start = now + self.interval
+
+
+def load_completed(output_path: str) -> Set[int]:
+    """出力ファイルから完了済みの質問の行番号を読む（途中で切れた行は無視）"""
+    completed: Set[int] = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["index"])
+    return completed
+
+
+class BatchRunner:
+    """質問を同時実行数とレートの上限を守りながら実行する"""
+
+    def __init__(
+        self,
+        mode: str,
+        output,
+        concurrency: int = 8,
+        rate: float = 0,
+        keep_sessions: bool = False,
+        config_path: str = "experts.yaml"
+    ):
+        self.mode = mode
+        self.output = output
+        self.keep_sessions = keep_sessions
+        self.run_id = uuid.uuid4().hex[:8]
+        self._slots = asyncio.Semaphore(concurrency)
+        self._rate_limiter = RateLimiter(rate)
+        self._session_locks: Dict[str, asyncio.Lock] = {}
+
+        self.session_manager = get_session_manager()
+        self.history_max_tokens = int(os.getenv("HISTORY_MAX_TOKENS", "0")) or None
+        self.answer_cache = create_answer_cache(self.session_manager)
+
+        if mode == "triage":
+            config, expert_agents, self.triage_agent = triage_app.build_agents(config_path)
+            self.router = ExpertRouter.from_config(config) if triage_app.LOCAL_ROUTER else None
+        else:
+            config, expert_agents, self.facilitator = conference_app.build_agents(config_path)
+            # 専門家ごとに絞り込む会話履歴の規則（experts.yamlのhistory）
+            self.projection = HistoryProjection.from_config(config)
+        self.experts_by_name = {agent.name: agent for agent in expert_agents}
+
+        self.latencies_ms: List[float] = []
+        self.errors = 0
+
+    async def run_question(self, index: int, question: Dict[str, Any]) -> None:
+        """1件の質問を実行して結果を書き込む"""
+        session_id = question.get("session_id") or f"batch-{self.run_id}-{index}"
+        # 同じセッションの質問はファイルの順番どおりに実行する（ロックは先着順）
+        lock = self._session_locks.setdefault(session_id, asyncio.Lock())
+        async with lock, self._slots:
+            await self._rate_limiter.wait()
+            record: Dict[str, Any] = {
+                "index": index,
+                "id": question.get("id"),
+                "session_id": session_id if question.get("session_id") else None,
+                "mode": self.mode,
+                "question": question.get("question"),
+            }
+            start = time.perf_counter()
+            session = self.session_manager.session(session_id)
+            try:
+                record.update(await self._answer(session, session_id, question))
+                record["status"] = "ok"
+            except Exception as e:
+                record["status"] = "error"
+                record["error"] = f"{type(e).__name__}: {e}"
+                self.errors += 1
+            finally:
+                if not question.get("session_id") and not self.keep_sessions:
+                    await session.clear_session()
+                await session.close()
+            record["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            if record["status"] == "ok":
+                self.latencies_ms.append(record["latency_ms"])
+
+        self.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.output.flush()
+        print(f"[{index}] {record['status']} {record['latency_ms']:.0f}ms {', '.join(record.get('experts', []))}")
+
+    async def _answer(self, session: RedisSession, session_id: str, question: Dict[str, Any]) -> Dict[str, Any]:
+        text = question.get("question")
+        if not isinstance(text, str) or not text.strip():
+            raise ValueError("questionがありません")
+        expert = question.get("expert")
+        if expert and expert not in self.experts_by_name:
+            raise ValueError(f"専門家 '{expert}' は存在しません")
+
+        if self.mode == "triage":
+            agent_name, answer = await triage_app.run_turn(
+                self.triage_agent, self.experts_by_name, session, session_id, text,
+                self.history_max_tokens, self.router, self.answer_cache,
+                stream=False, write=_silent, expert=expert
+            )
+            return {"experts": [agent_name], "answers": {agent_name: answer}}
+
+        if expert:
+            # 司会者を省略して指定された専門家だけが回答する
+            items, authors = await conference_app.read_history(session, self.history_max_tokens, self.projection)
+            panel = conference_app.ExpertPanel(
+                self.experts_by_name, session_id, conference_app.OrderedOutput(write=_silent), self.answer_cache,
+                self.projection, self.history_max_tokens, session.summary_present, session.token_counter
+            )
+            panel.start({"expert": expert, "question": text}, items, authors)
+            facilitator_text, answers = None, await panel.finish(session)
+        else:
+            facilitator_text, answers = await conference_app.run_streamed_turn(
+                self.facilitator, self.experts_by_name, session, session_id, text,
+                self.history_max_tokens, self.answer_cache, write=_silent, projection=self.projection
+            )
+        return {
+            "facilitator": facilitator_text,
+            "experts": [name for name, _ in answers],
+            "answers": dict(answers)
+        }
+
+    async def close(self) -> None:
+        await self.session_manager.close()
+
+
+def summarize(output_path: str, latencies_ms: List[float], elapsed: float, errors: int) -> Dict[str, Any]:
+    """今回の実行のスループットとレイテンシ、出力ファイル全体の振り分け件数"""
+    routing: Counter = Counter()
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok":
+                routing.update(record.get("experts", []))
+    completed = len(latencies_ms)
+    return {
+        "completed": completed,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 2),
+        "questions_per_second": round(completed / elapsed, 3) if elapsed > 0 else None,
+        "latency_ms": {
+            "p50": percentile(latencies_ms, 50),
+            "p90": percentile(latencies_ms, 90),
+            "p99": percentile(latencies_ms, 99),
+            "max": max(latencies_ms) if latencies_ms else None
+        },
+        "routing": dict(routing.most_common())
+    }
+
+
+async def run_batch(args: argparse.Namespace) -> Dict[str, Any]:
+    with open(args.input, "r", encoding="utf-8") as f:
+        questions = [json.loads(line) for line in f if line.strip()]
+
+    completed = load_completed(args.output) if args.resume else set()
+    pending = [(index, question) for index, question in enumerate(questions) if index not in completed]
+    print(f"質問数: {len(questions)}（完了済み: {len(questions) - len(pending)}、実行: {len(pending)}）")
+
+    with open(args.output, "a" if args.resume else "w", encoding="utf-8") as output:
+        runner = BatchRunner(
+            args.mode, output,
+            concurrency=args.concurrency, rate=args.rate, keep_sessions=args.keep_sessions
+        )
+        start = time.perf_counter()
+        try:
+            # タスクはファイルの順番に作るので、同じセッションのロックも順番どおりに取得される
+            await asyncio.gather(*[runner.run_question(index, question) for index, question in pending])
+        finally:
+            elapsed = time.perf_counter() - start
+            await runner.close()
+
+    return summarize(args.output, runner.latencies_ms, elapsed, runner.errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="質問ファイルのバッチ実行")
+    parser.add_argument("input", help="質問ファイル（JSONL）")
+    parser.add_argument("output", help="結果ファイル（JSONL、チェックポイントを兼ねる）")
+    parser.add_argument("--mode", choices=["triage", "conference"], default="triage", help="実行する形式")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時に実行する質問の最大数")
+    parser.add_argument("--rate", type=float, default=0, help="1秒あたりに開始する質問の最大数（0は無制限）")
+    parser.add_argument("--resume", action="store_true", help="結果ファイルの完了済みの質問を飛ばして再開")
+    parser.add_argument("--keep-sessions", action="store_true", help="session_idのない質問の会話履歴を残す")
+    parser.add_argument("--json", action="store_true", help="サマリーをJSONで出力")
+    args = parser.parse_args()
+
+    configure_telemetry("expert-agent-batch")
+    try:
+        summary = asyncio.run(run_batch(args))
+    except KeyboardInterrupt:
+        print("\n中断しました。--resumeを付けて実行すると続きから再開できます。")
+        return
+
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        return
+
+    latency = summary["latency_ms"]
+    print(f"\n完了: {summary['completed']}件 / エラー: {summary['errors']}件 / {summary['elapsed_seconds']}秒")
+    if summary["questions_per_second"] is not None:
+        print(f"スループット: {summary['questions_per_second']}件/秒")
+    if latency["p50"] is not None:
+        print(f"レイテンシ(ms): p50={latency['p50']:.0f} p90={latency['p90']:.0f} p99={latency['p99']:.0f} max={latency['max']:.0f}")
+    print("\n専門家ごとの回答数:")
+    for expert, count in summary["routing"].items():
+        print(f"  {expert}: {count}")
+
+
+if __name__ == "__main__":
+    main()
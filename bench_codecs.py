@@ -0,0 +1,124 @@
+"""
+RedisSessionのコーデック比較ベンチマーク
+
+会議形式の会話履歴（司会者の発言、専門家の長文回答）を模したアイテムで
+エンコード/デコード時間と保存サイズを比較する
+
+使い方:
+    python bench_codecs.py [--turns 50] [--repeat 5] [--json]
+"""
+import argparse
+import json
+import time
+import uuid
+from typing import Any, Dict, List
+
+import yaml
+
+from session_codec import CODECS, decode_item, zstandard
+
+
+def build_conference_transcript(turns: int, experts_file: str = "experts.yaml") -> List[Dict[str, Any]]:
+    """experts.yamlの専門家を使って会議形式の会話履歴を生成"""
+    with open(experts_file, "r", encoding="utf-8") as f:
+        experts = yaml.safe_load(f)["experts"]
+
+    items: List[Dict[str, Any]] = []
+    for turn in range(turns):
+        expert = experts[turn % len(experts)]
+        question = f"{expert['description']}として、{turn + 1}つ目の論点について詳しく教えてください。"
+        items.append({"role": "user", "content": question})
+
+        facilitator_text = (
+            f"司会者です。{expert['description']}に関するご質問ですね。"
+            "技術的な詳細が必要ですので、専門家にお聞きしましょう。\n\n"
+            "【専門家指名】\n"
+            + json.dumps({"expert": expert["name"], "question": question}, ensure_ascii=False, indent=2)
+        )
+        items.append(_assistant_message(facilitator_text))
+
+        # 専門家の回答はインストラクションを繰り返して数KBの長文にする
+        answer_lines = [f"{expert['name']}です。"]
+        for section in range(6):
+            answer_lines.append(f"\n## ポイント{section + 1}\n")
+            answer_lines.append(expert["instructions"])
+            answer_lines.append("```python\ndef example():\n    return {'turn': %d, 'section': %d}\n```" % (turn, section))
+        items.append(_assistant_message("\n".join(answer_lines)))
+    return items
+
+
+def _assistant_message(text: str) -> Dict[str, Any]:
+    """Agents SDKが保存するアシスタントメッセージと同じ形式"""
+    return {
+        "id": f"msg_{uuid.uuid4().hex}",
+        "type": "message",
+        "role": "assistant",
+        "status": "completed",
+        "content": [{"type": "output_text", "text": text, "annotations": []}]
+    }
+
+
+def bench_codec(codec, items: List[Dict[str, Any]], repeat: int) -> Dict[str, Any]:
+    """1つのコーデックでエンコード/デコードを計測"""
+    encode_times = []
+    decode_times = []
+    encoded: List[bytes] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encoded = [codec.encode(item) for item in items]
+        encode_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        decoded = [decode_item(entry) for entry in encoded]
+        decode_times.append(time.perf_counter() - start)
+    assert decoded == items, f"{codec.name}: round trip mismatch"
+
+    return {
+        "codec": codec.name,
+        "compress_threshold": codec.compress_threshold,
+        "items": len(items),
+        "encode_us_per_item": min(encode_times) / len(items) * 1e6,
+        "decode_us_per_item": min(decode_times) / len(items) * 1e6,
+        "bytes": sum(len(entry) for entry in encoded)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RedisSessionコーデック比較")
+    parser.add_argument("--turns", type=int, default=50, help="会議のターン数（1ターン3アイテム）")
+    parser.add_argument("--repeat", type=int, default=5, help="計測の繰り返し回数（最小値を採用）")
+    parser.add_argument("--threshold", type=int, default=1024, help="圧縮を行う最小バイト数")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args()
+
+    items = build_conference_transcript(args.turns)
+
+    results = []
+    for name, codec_class in CODECS.items():
+        thresholds = [0] + ([args.threshold] if zstandard is not None else [])
+        for threshold in thresholds:
+            try:
+                codec = codec_class(compress_threshold=threshold)
+            except RuntimeError as e:
+                print(f"スキップ: {name} ({e})")
+                break
+            results.append(bench_codec(codec, items, args.repeat))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    baseline = results[0]["bytes"]
+    print(f"\n会議ログ: {args.turns}ターン / {len(items)}アイテム / JSON {baseline:,}バイト\n")
+    print(f"{'codec':<10}{'zstd':>8}{'encode(us)':>14}{'decode(us)':>14}{'bytes':>14}{'ratio':>8}")
+    for result in results:
+        zstd_label = f">={result['compress_threshold']}" if result["compress_threshold"] else "-"
+        print(
+            f"{result['codec']:<10}{zstd_label:>8}"
+            f"{result['encode_us_per_item']:>14.1f}{result['decode_us_per_item']:>14.1f}"
+            f"{result['bytes']:>14,}{result['bytes'] / baseline:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+"""
+RedisSessionの操作ごとのマイクロベンチマーク
+
+会話履歴のアイテム数・アイテムサイズ・同時実行数を変えながら、
+get_items / add_items / pop_item / get_session_info / extend_ttl の
+スループット、レイテンシ（p50/p99）、1操作あたりの往復回数と転送バイト数を計測する。
+--backends list,streamでRedisSession（リスト）とRedisStreamSession（Redis Streams）を
+同じ条件で比較できる。get_tailは直近10件の読み込み（リストはlimit、
+Streamsはget_items_sinceによる差分読み込み）。
+ローカルのredis-serverか、--fakeでプロセス内のfakeredisに対して実行できる。
+
+結果はJSONで保存でき、--baselineに別ブランチの結果を渡すと
+往復回数の増加やレイテンシの悪化を検出して終了コード1で終わる。
+
+使い方:
+    python bench_redis_session.py [--fake] [--items 10,100,1000,10000]
+        [--item-bytes 256,4096] [--concurrency 1,16] [--backends list,stream] [--seconds 2]
+        [--output results.json] [--baseline main.json] [--json]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Union
+
+import redis.asyncio as redis
+
+from redis_session import _SCRIPTS, RedisSession, SessionItemCache
+from redis_stream_session import _SCRIPTS as _STREAM_SCRIPTS, RedisStreamSession
+from session_ttl import TTLPolicy
+
+try:
+    import fakeredis
+except ImportError:  # optional dependency
+    fakeredis = None
+
+OPERATIONS = ("get_items", "get_items_budget", "get_tail", "add_items", "pop_item", "get_session_info", "extend_ttl")
+BACKENDS = ("list", "stream")
+# Streamsのセッションにない操作
+_UNSUPPORTED = {"stream": {"get_items_budget"}}
+# get_tailで読む件数
+_TAIL_ITEMS = 10
+
+
+class TrafficStats:
+    """Redisとの往復回数と送受信バイト数"""
+
+    def __init__(self):
+        self.round_trips = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "round_trips": self.round_trips,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received
+        }
+
+
+def _payload_size(response: Any) -> int:
+    """応答に含まれる文字列のバイト数（プロトコルのヘッダーは含まない）"""
+    if isinstance(response, (bytes, bytearray, memoryview)):
+        return len(response)
+    if isinstance(response, str):
+        return len(response.encode("utf-8"))
+    if isinstance(response, (list, tuple)):
+        return sum(_payload_size(item) for item in response)
+    if isinstance(response, dict):
+        return sum(_payload_size(key) + _payload_size(value) for key, value in response.items())
+    if isinstance(response, (int, float)):
+        return len(str(response))
+    return 0
+
+
+def instrument_client(client: redis.Redis, stats: TrafficStats) -> redis.Redis:
+    """
+    接続プールの接続クラスを差し替えて通信量を数える
+
+    パイプラインは1回の送信にまとめられるので、送信回数がそのまま往復回数になる。
+    接続が作られる前に呼び出す必要がある。
+    """
+    pool = client.connection_pool
+    base = pool.connection_class
+
+    class CountingConnection(base):
+        async def send_packed_command(self, command, check_health=True):
+            stats.round_trips += 1
+            if isinstance(command, (bytes, bytearray, memoryview, str)):
+                command = [command]
+            stats.bytes_sent += sum(len(chunk) for chunk in command)
+            return await super().send_packed_command(command, check_health)
+
+        async def read_response(self, *args, **kwargs):
+            response = await super().read_response(*args, **kwargs)
+            stats.bytes_received += _payload_size(response)
+            return response
+
+    pool.connection_class = CountingConnection
+    return client
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """最近傍順位法によるパーセンタイル"""
+    ordered = sorted(values)
+    rank = max(math.ceil(len(ordered) * percent / 100) - 1, 0)
+    return ordered[rank]
+
+
+def make_item(index: int, item_bytes: int) -> Dict[str, Any]:
+    """おおよそitem_bytesバイトの会話アイテム"""
+    role = "user" if index % 2 == 0 else "assistant"
+    prefix = f"{role} {index}: "
+    return {"role": role, "content": prefix + "x" * max(item_bytes - len(prefix) - 32, 0)}
+
+
+class SessionBenchmark:
+    """1つのRedisクライアントに対して設定の組み合わせを順に計測する"""
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        stats: TrafficStats,
+        seconds: float = 2.0,
+        max_ops: int = 1000,
+        use_cache: bool = False,
+        backend: str = "list"
+    ):
+        self.client = client
+        self.stats = stats
+        self.seconds = seconds
+        self.max_ops = max_ops
+        self.use_cache = use_cache
+        self.backend = backend
+
+    def _session(self, session_id: str) -> Union[RedisSession, RedisStreamSession]:
+        # touch_interval=0でextend_ttlを毎回Redisまで届かせる
+        ttl_policy = TTLPolicy(mode="sliding", touch_interval=0)
+        if self.backend == "stream":
+            return RedisStreamSession(session_id, client=self.client, ttl_policy=ttl_policy)
+        return RedisSession(
+            session_id,
+            client=self.client,
+            cache=SessionItemCache() if self.use_cache else None,
+            ttl_policy=ttl_policy
+        )
+
+    async def _prefill(self, session: Union[RedisSession, RedisStreamSession], items: int, item_bytes: int) -> None:
+        batch = 500
+        for start in range(0, items, batch):
+            await session.add_items([make_item(i, item_bytes) for i in range(start, min(start + batch, items))])
+
+    async def _operation(
+        self,
+        session: Union[RedisSession, RedisStreamSession],
+        op: str,
+        item_bytes: int
+    ) -> Callable[[], Awaitable[Any]]:
+        if op == "get_items":
+            return lambda: session.get_items()
+        if op == "get_items_budget":
+            # 直近の数千トークン分だけを読む（Runnerに渡す履歴と同じ使い方）
+            return lambda: session.get_items(max_tokens=4000)
+        if op == "get_tail":
+            # 最後に処理した位置から新しい分だけを読む読み手を想定する
+            if isinstance(session, RedisStreamSession):
+                entries = await session.get_entries(limit=_TAIL_ITEMS + 1)
+                since = entries[0][0] if len(entries) > _TAIL_ITEMS else None
+                return lambda: session.get_items_since(since)
+            return lambda: session.get_items(limit=_TAIL_ITEMS)
+        if op == "add_items":
+            return lambda: session.add_items([make_item(0, item_bytes)])
+        if op == "pop_item":
+            return session.pop_item
+        if op == "get_session_info":
+            return session.get_session_info
+        if op == "extend_ttl":
+            return session.extend_ttl
+        raise ValueError(f"Unknown operation '{op}'")
+
+    async def _measure(self, call: Callable[[], Awaitable[Any]], concurrency: int, max_ops: int) -> Dict[str, Any]:
+        latencies: List[float] = []
+        deadline = time.perf_counter() + self.seconds
+
+        async def worker():
+            while len(latencies) < max_ops and time.perf_counter() < deadline:
+                start = time.perf_counter()
+                await call()
+                latencies.append(time.perf_counter() - start)
+
+        before = self.stats.snapshot()
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+        after = self.stats.snapshot()
+
+        ops = len(latencies)
+        return {
+            "ops": ops,
+            "ops_per_sec": round(ops / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "round_trips_per_op": round((after["round_trips"] - before["round_trips"]) / ops, 2),
+            "bytes_sent_per_op": round((after["bytes_sent"] - before["bytes_sent"]) / ops),
+            "bytes_received_per_op": round((after["bytes_received"] - before["bytes_received"]) / ops)
+        }
+
+    async def run_case(self, items: int, item_bytes: int, concurrency: int, operations: List[str]) -> List[Dict[str, Any]]:
+        """アイテム数×サイズ×同時実行数の1ケースで全操作を計測"""
+        session = self._session(f"bench-{uuid.uuid4().hex}")
+        results = []
+        try:
+            await self._prefill(session, items, item_bytes)
+            added = 0
+            for op in operations:
+                if op in _UNSUPPORTED.get(self.backend, ()):
+                    continue
+                # pop_itemはadd_itemsで追加した分だけ取り除き、アイテム数をそろえる
+                max_ops = (added or min(self.max_ops, items)) if op == "pop_item" else self.max_ops
+                if self.use_cache:
+                    # キャッシュを温めてから計測する
+                    await session.get_items()
+                call = await self._operation(session, op, item_bytes)
+                result = await self._measure(call, concurrency, max_ops)
+                if op == "add_items":
+                    added = result["ops"]
+                results.append({
+                    "backend": self.backend,
+                    "operation": op,
+                    "items": items,
+                    "item_bytes": item_bytes,
+                    "concurrency": concurrency,
+                    **result
+                })
+        finally:
+            await session.clear_session()
+            await session.close()
+        return results
+
+
+def result_key(result: Dict[str, Any]) -> str:
+    # backendのない古い結果はリストのセッションの結果として扱う
+    return f"{result.get('backend', 'list')}/{result['operation']}/items={result['items']}/bytes={result['item_bytes']}/c={result['concurrency']}"
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """
+    ベースラインと比べた悪化を列挙する
+
+    往復回数は実行環境によらず決まるので少しでも増えたら悪化とし、
+    p50レイテンシはtolerance倍を超えたら悪化とする。
+    """
+    baseline_by_key = {result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        base = baseline_by_key.get(result_key(result))
+        if base is None:
+            continue
+        if result["round_trips_per_op"] > base["round_trips_per_op"]:
+            regressions.append(
+                f"{result_key(result)}: 往復回数 {base['round_trips_per_op']} → {result['round_trips_per_op']}"
+            )
+        if base["p50_ms"] > 0 and result["p50_ms"] / base["p50_ms"] > tolerance:
+            regressions.append(
+                f"{result_key(result)}: p50 {base['p50_ms']}ms → {result['p50_ms']}ms"
+            )
+    return regressions
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part]
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    stats = TrafficStats()
+    if args.fake:
+        if fakeredis is None:
+            raise RuntimeError("--fakeにはfakeredisが必要です（pip install fakeredis）")
+        client = fakeredis.FakeAsyncRedis()
+        backend = "fakeredis"
+    else:
+        client = redis.from_url(args.redis_url, decode_responses=False)
+        backend = args.redis_url
+    instrument_client(client, stats)
+    # 初回のEVALSHAがNOSCRIPTで往復を増やさないよう、スクリプトを先に登録しておく
+    for source in [*_SCRIPTS.values(), *_STREAM_SCRIPTS.values()]:
+        await client.script_load(source)
+
+    results: List[Dict[str, Any]] = []
+    try:
+        for items in args.items:
+            for item_bytes in args.item_bytes:
+                for concurrency in args.concurrency:
+                    for backend_name in args.backends:
+                        bench = SessionBenchmark(
+                            client,
+                            stats,
+                            seconds=args.seconds,
+                            max_ops=args.max_ops,
+                            use_cache=args.cache,
+                            backend=backend_name
+                        )
+                        case_results = await bench.run_case(items, item_bytes, concurrency, args.operations)
+                        results.extend(case_results)
+                        if not args.json:
+                            for result in case_results:
+                                _print_result(result)
+    finally:
+        await client.close()
+
+    return {
+        "backend": backend,
+        "cache": args.cache,
+        "codec": os.getenv("REDIS_SESSION_CODEC", "json"),
+        "results": results
+    }
+
+
+def _print_header() -> None:
+    print(
+        f"{'backend':<8}{'operation':<18}{'items':>7}{'bytes':>7}{'conc':>6}"
+        f"{'ops/s':>11}{'p50(ms)':>10}{'p99(ms)':>10}{'rt/op':>7}{'sent/op':>10}{'recv/op':>12}"
+    )
+
+
+def _print_result(result: Dict[str, Any]) -> None:
+    print(
+        f"{result['backend']:<8}{result['operation']:<18}{result['items']:>7}{result['item_bytes']:>7}{result['concurrency']:>6}"
+        f"{result['ops_per_sec']:>11,.0f}{result['p50_ms']:>10.3f}{result['p99_ms']:>10.3f}"
+        f"{result['round_trips_per_op']:>7}{result['bytes_sent_per_op']:>10,}{result['bytes_received_per_op']:>12,}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RedisSession操作のマイクロベンチマーク")
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379"), help="計測するRedis")
+    parser.add_argument("--fake", action="store_true", help="redis-serverの代わりにfakeredisを使う")
+    parser.add_argument("--items", type=_int_list, default=[10, 100, 1000, 10000], help="会話履歴のアイテム数（カンマ区切り）")
+    parser.add_argument("--item-bytes", type=_int_list, default=[256, 4096], help="アイテムのサイズ（カンマ区切り）")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 16], help="同時実行数（カンマ区切り）")
+    parser.add_argument("--operations", type=lambda value: value.split(","), default=list(OPERATIONS),
+                        help=f"計測する操作（カンマ区切り: {','.join(OPERATIONS)}）")
+    parser.add_argument("--backends", type=lambda value: value.split(","), default=["list"],
+                        help=f"計測するセッションの実装（カンマ区切り: {','.join(BACKENDS)}）")
+    parser.add_argument("--seconds", type=float, default=2.0, help="1操作あたりの最大計測時間（秒）")
+    parser.add_argument("--max-ops", type=int, default=1000, help="1操作あたりの最大実行回数")
+    parser.add_argument("--cache", action="store_true", help="SessionItemCacheを有効にする")
+    parser.add_argument("--output", help="結果をJSONで保存するファイル")
+    parser.add_argument("--baseline", help="比較するベースラインの結果ファイル（JSON）")
+    parser.add_argument("--tolerance", type=float, default=1.2, help="p50レイテンシの許容倍率")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args()
+
+    unknown = [op for op in args.operations if op not in OPERATIONS]
+    if unknown:
+        parser.error(f"不明な操作: {', '.join(unknown)}")
+    unknown = [backend for backend in args.backends if backend not in BACKENDS]
+    if unknown:
+        parser.error(f"不明な実装: {', '.join(unknown)}")
+
+    if not args.json:
+        _print_header()
+    report = asyncio.run(run_benchmark(args))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report["results"], baseline["results"], args.tolerance)
+        if regressions:
+            print("\nベースラインからの悪化:", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            sys.exit(1)
+        if not args.json:
+            print("\nベースラインからの悪化はありません")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+起動時間のベンチマーク
+
+python -X importtime で各エントリポイントを読み込み、モジュールの読み込み時間の
+合計と重いモジュールの内訳を表示する。読み込み時間の予算（--budget-ms）と、
+起動時に読み込んではいけないモジュール（--forbid）を検査し、
+違反があれば終了コード1で終わるのでCIに組み込める。
+
+使い方:
+    python bench_startup.py [--modules main,main_conference] [--repeat 5]
+        [--budget-ms 600] [--forbid agents,logfire,yaml,openai] [--top 10] [--json]
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+# 起動時に読み込まないモジュール（初回の質問までに別スレッドや関数内で読み込む）
+DEFAULT_FORBIDDEN = ("agents", "logfire", "yaml", "openai")
+
+# "import time: self [us] | cumulative | imported package" の各行
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def parse_importtime(output: str) -> List[Dict[str, Any]]:
+    """-X importtimeの出力をモジュールごとの読み込み時間に変換"""
+    entries = []
+    for line in output.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append({
+                "module": module,
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+                # インデントが深いほど内側のimport
+                "depth": (len(indent) - 1) // 2
+            })
+    return entries
+
+
+def measure_import(module: str) -> List[Dict[str, Any]]:
+    """新しいプロセスでmoduleを読み込み、importtimeの結果を返す"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        # 解析済みの設定のキャッシュなどは読み込み時間に影響しないようにそのまま使う
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE="")
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{module}の読み込みに失敗しました:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def bench_module(module: str, repeat: int, forbidden: List[str], top: int) -> Dict[str, Any]:
+    runs = [measure_import(module) for _ in range(repeat)]
+    totals_ms = []
+    for entries in runs:
+        target = [entry for entry in entries if entry["module"] == module]
+        totals_ms.append(target[-1]["cumulative_us"] / 1000 if target else 0.0)
+
+    # 内訳は最も速かった回を使う（ディスクキャッシュなどの揺らぎを除く）
+    fastest = runs[totals_ms.index(min(totals_ms))]
+    loaded = {entry["module"] for entry in fastest}
+    heaviest = sorted(
+        (entry for entry in fastest if entry["depth"] == 1),
+        key=lambda entry: entry["cumulative_us"],
+        reverse=True
+    )[:top]
+    return {
+        "module": module,
+        "median_ms": round(statistics.median(totals_ms), 1),
+        "min_ms": round(min(totals_ms), 1),
+        "max_ms": round(max(totals_ms), 1),
+        "forbidden_loaded": sorted(
+            name for name in forbidden
+            if name in loaded or any(loaded_name.startswith(name + ".") for loaded_name in loaded)
+        ),
+        "heaviest": [
+            {"module": entry["module"], "cumulative_ms": round(entry["cumulative_us"] / 1000, 1)}
+            for entry in heaviest
+        ]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="起動時間のベンチマーク")
+    parser.add_argument("--modules", default="main,main_conference", help="計測するモジュール（カンマ区切り）")
+    parser.add_argument("--repeat", type=int, default=5, help="計測の繰り返し回数（中央値で判定）")
+    parser.add_argument("--budget-ms", type=float, default=600, help="読み込み時間の予算（ミリ秒、0で検査しない）")
+    parser.add_argument("--forbid", default=",".join(DEFAULT_FORBIDDEN), help="起動時に読み込んではいけないモジュール")
+    parser.add_argument("--top", type=int, default=10, help="表示する重いモジュールの数")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args()
+
+    forbidden = [name for name in args.forbid.split(",") if name]
+    results = [
+        bench_module(module, args.repeat, forbidden, args.top)
+        for module in args.modules.split(",") if module
+    ]
+
+    violations = []
+    for result in results:
+        if args.budget_ms and result["median_ms"] > args.budget_ms:
+            violations.append(f"{result['module']}: {result['median_ms']}ms（予算 {args.budget_ms:.0f}ms）")
+        if result["forbidden_loaded"]:
+            violations.append(f"{result['module']}: 起動時に読み込まれた: {', '.join(result['forbidden_loaded'])}")
+
+    if args.json:
+        print(json.dumps({"results": results, "violations": violations}, ensure_ascii=False, indent=2))
+    else:
+        for result in results:
+            print(f"\n{result['module']}: 中央値 {result['median_ms']}ms（最小 {result['min_ms']}ms / 最大 {result['max_ms']}ms）")
+            for entry in result["heaviest"]:
+                print(f"  {entry['cumulative_ms']:>9.1f}ms  {entry['module']}")
+        if violations:
+            print("\n起動時間の予算違反:")
+            for violation in violations:
+                print(f"  {violation}")
+        else:
+            print("\n予算内です")
+
+    if violations:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+server.pyに接続するターミナルクライアント
+
+使い方:
+    python client.py [--url http://127.0.0.1:8080] [--mode triage|conference] [--session-id ID]
+"""
+import argparse
+import json
+import uuid
+
+import httpx
+
+
+def stream_turn(client: httpx.Client, url: str, mode: str, session_id: str, message: str) -> None:
+    """1ターン分のSSEを受信して表示"""
+    with client.stream("POST", f"{url}/sessions/{session_id}/{mode}", json={"message": message}) as response:
+        if response.status_code != 200:
+            response.read()
+            print(f"\nエラーが発生しました（{response.status_code}）: {response.text}")
+            return
+
+        event = None
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "delta":
+                    print(data["text"], end="", flush=True)
+                elif event == "error":
+                    print(f"\nエラーが発生しました: {data['message']}")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="専門家エージェントシステムのクライアント")
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="server.pyのURL")
+    parser.add_argument("--mode", choices=["triage", "conference"], default="triage", help="対話の形式")
+    parser.add_argument("--session-id", help="再開するセッションID（省略時は新規）")
+    args = parser.parse_args()
+
+    session_id = args.session_id or str(uuid.uuid4())
+    # 回答の生成には時間がかかるため読み取りのタイムアウトは設けない
+    with httpx.Client(timeout=httpx.Timeout(10.0, read=None)) as client:
+        if args.session_id:
+            session_info = client.get(f"{args.url}/sessions/{session_id}").json()
+            if session_info["exists"]:
+                print(f"\nセッション {session_id} を再開します（{session_info['item_count']}メッセージ）")
+            else:
+                print("過去の会話が見つかりませんでした。新規セッションとして開始します。")
+        else:
+            print(f"\n新規セッション {session_id} を開始します...")
+
+        print("\n質問を入力してください（'exit'で終了）:\n")
+        while True:
+            user_input = input("\nあなた: ").strip()
+            if user_input.lower() == "exit":
+                print(f"\nセッションID: {session_id}")
+                print("このIDを使用して、後で会話を再開できます。")
+                break
+            if not user_input:
+                continue
+            print()
+            stream_turn(client, args.url, args.mode, session_id, user_input)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+ローカル専門家ルーターのオフライン評価
+
+ラベル付きの質問ファイル（1行1件のJSON: {"question": ..., "expert": ...}）で
+ローカル振り分けの割合と正解率を計測する。expertがnullの質問は
+「トリアージに任せるべき質問」として扱う。
+
+使い方:
+    python eval_router.py [--questions router_eval.jsonl] [--threshold 0.15] [--min-margin 0.04] [--sweep] [--json]
+"""
+import argparse
+import json
+from typing import Any, Dict, List
+
+import yaml
+
+from expert_router import ExpertRouter
+
+
+def load_questions(file_path: str) -> List[Dict[str, Any]]:
+    with open(file_path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(router: ExpertRouter, questions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """ルーターを質問セットで評価する"""
+    labelled = [q for q in questions if q.get("expert")]
+    routed = correct = top1_correct = false_routes = 0
+    errors = []
+    for question in questions:
+        decision = router.classify(question["question"])
+        expected = question.get("expert")
+        if expected and decision.candidate == expected:
+            top1_correct += 1
+        if decision.expert is None:
+            continue
+        routed += 1
+        if decision.expert == expected:
+            correct += 1
+        elif expected is None:
+            false_routes += 1
+        else:
+            errors.append({
+                "question": question["question"],
+                "expected": expected,
+                "routed": decision.expert,
+                "score": round(decision.score, 3)
+            })
+
+    return {
+        "threshold": router.threshold,
+        "min_margin": router.min_margin,
+        "questions": len(questions),
+        # ローカルで振り分けた割合（トリアージのLLM呼び出しを省けた割合）
+        "hit_rate": routed / len(questions) if questions else 0.0,
+        # ローカルで振り分けた質問のうち正しい専門家だった割合
+        "precision": correct / routed if routed else None,
+        # 閾値を無視した場合の1位候補の正解率
+        "top1_accuracy": top1_correct / len(labelled) if labelled else None,
+        # 専門家のいない質問をローカルで振り分けてしまった数
+        "false_routes": false_routes,
+        "errors": errors
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ローカル専門家ルーターの評価")
+    parser.add_argument("--questions", default="router_eval.jsonl", help="ラベル付き質問ファイル（JSONL）")
+    parser.add_argument("--config", default="experts.yaml", help="専門家設定ファイル")
+    parser.add_argument("--threshold", type=float, default=None, help="ローカル振り分けの最小類似度")
+    parser.add_argument("--min-margin", type=float, default=None, help="1位と2位の類似度の最小差")
+    parser.add_argument("--sweep", action="store_true", help="閾値を変えながら評価")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    questions = load_questions(args.questions)
+
+    if args.sweep:
+        thresholds = [round(0.04 * step, 2) for step in range(1, 11)]
+    else:
+        thresholds = [args.threshold]
+    results = [
+        evaluate(ExpertRouter.from_config(config, threshold=threshold, min_margin=args.min_margin), questions)
+        for threshold in thresholds
+    ]
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    print(f"\n質問数: {len(questions)}（専門家ラベルなし: {sum(1 for q in questions if not q.get('expert'))}）\n")
+    print(f"{'threshold':>10}{'margin':>8}{'hit_rate':>10}{'precision':>11}{'top1':>8}{'false':>7}")
+    for result in results:
+        precision = f"{result['precision']:.2f}" if result["precision"] is not None else "-"
+        top1 = f"{result['top1_accuracy']:.2f}" if result["top1_accuracy"] is not None else "-"
+        print(
+            f"{result['threshold']:>10.2f}{result['min_margin']:>8.2f}"
+            f"{result['hit_rate']:>10.2f}{precision:>11}{top1:>8}{result['false_routes']:>7}"
+        )
+
+    if not args.sweep:
+        for error in results[0]["errors"]:
+            print(f"\n誤り: {error['question']}")
+            print(f"  正解: {error['expected']} / 振り分け先: {error['routed']} (score={error['score']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+experts.yamlの読み込みとエージェント構築のキャッシュ
+
+設定はファイル内容のSHA-256をキーにキャッシュする。プロセス内では解析済みの設定と
+構築済みのエージェントを再利用し、プロセスをまたいでは解析結果をJSONで保存して
+次回の起動でyamlの読み込みと解析を省く。プロセス内のキャッシュは再読み込みで
+置き換わった古い設定の分を捨て、直近の設定だけを残す。
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# 解析済みの設定を保存するディレクトリ（空文字で無効）
+CONFIG_CACHE_DIR = os.getenv("EXPERTS_CONFIG_CACHE_DIR", os.path.join(".cache", "experts"))
+
+# プロセス内に残す設定の数（現在の設定と、再読み込み前の実行中のターンが使う設定）
+MAX_CACHED_CONFIGS = 2
+
+_configs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_agents: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+
+def _remember(cache: "OrderedDict[str, Any]", digest: str, value: Any) -> Any:
+    """digestを最新として記録し、古い設定の分を捨てる"""
+    cache[digest] = value
+    cache.move_to_end(digest)
+    while len(cache) > MAX_CACHED_CONFIGS:
+        cache.popitem(last=False)
+    return value
+
+
+def config_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def read_experts_config(file_path: str = "experts.yaml") -> Tuple[str, Dict[str, Any]]:
+    """
+    設定ファイルを読み込む
+
+    Returns:
+        (ファイル内容のハッシュ, 解析済みの設定)
+    """
+    with open(file_path, "rb") as f:
+        data = f.read()
+    digest = config_digest(data)
+
+    config = _configs.get(digest)
+    if config is None:
+        config = _load_cached(digest)
+        if config is None:
+            # yamlの読み込みは重いので、キャッシュがないときだけ行う
+            import yaml
+            config = yaml.safe_load(data.decode("utf-8"))
+            _save_cached(digest, config)
+    _remember(_configs, digest, config)
+    return digest, config
+
+
+def load_experts_config(file_path: str = "experts.yaml") -> Dict[str, Any]:
+    return read_experts_config(file_path)[1]
+
+
+def cached_build(digest: str, kind: str, build: Callable[[], T]) -> T:
+    """
+    同じ設定から作ったエージェントを再利用する
+
+    Args:
+        digest: read_experts_configが返した設定のハッシュ
+        kind: 作るもの（"triage"、"conference"など）
+        build: キャッシュがないときに呼ぶ構築関数
+    """
+    built = _remember(_agents, digest, _agents.get(digest, {}))
+    if kind not in built:
+        built[kind] = build()
+    return built[kind]
+
+
+def _cache_path(digest: str) -> Optional[str]:
+    if not CONFIG_CACHE_DIR:
+        return None
+    return os.path.join(CONFIG_CACHE_DIR, f"{digest}.json")
+
+
+def _load_cached(digest: str) -> Optional[Dict[str, Any]]:
+    path = _cache_path(digest)
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _save_cached(digest: str, config: Dict[str, Any]) -> None:
+    path = _cache_path(digest)
+    if path is None:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 書きかけのファイルを読まないよう、一時ファイルから置き換える
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError):
+        # キャッシュは最適化なので、保存できなくても起動は続ける
+        pass
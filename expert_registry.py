@@ -0,0 +1,224 @@
+"""
+experts.yamlの変更を再起動なしで反映する専門家レジストリ
+
+設定ファイルのmtimeとサイズを定期的に確認し、変わっていれば内容のハッシュを比べて
+読み直す。内容が変わった専門家のエージェントだけを作り直し、トリアージエージェントと
+司会者を新しい専門家の一覧で作った新しいスナップショットに差し替える。
+実行中のターンは開始時に受け取ったスナップショットのエージェントで最後まで動く。
+検証に失敗した設定は適用せず、最後に読み込めた設定を使い続ける。
+"""
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, TYPE_CHECKING
+
+import main as triage_app
+import main_conference as conference_app
+from expert_config import read_experts_config
+from expert_router import ExpertRouter
+from session_views import HistoryProjection, HistoryRule
+
+if TYPE_CHECKING:
+    from agents import Agent
+    from facilitator_agent import FacilitatorAgent
+
+# エージェントの作成に使う設定項目（keywordsなどの変更ではエージェントを作り直さない）
+_AGENT_FIELDS = ("name", "description", "instructions")
+
+
+class ExpertSnapshot(NamedTuple):
+    """ある時点の設定から作ったエージェント一式（作成後は変更しない）"""
+    version: int
+    digest: str
+    config: Dict[str, Any]
+    experts_by_name: Dict[str, "Agent"]
+    triage_agent: "Agent"
+    conference_experts: Dict[str, "Agent"]
+    facilitator: "FacilitatorAgent"
+    router: Optional[ExpertRouter]
+    history: HistoryProjection
+
+
+def validate_experts_config(config: Any) -> None:
+    """設定の形式を検査する（不正ならValueError）"""
+    if not isinstance(config, dict) or not isinstance(config.get("experts"), list) or not config["experts"]:
+        raise ValueError("expertsに専門家のリストが必要です")
+    settings = config.get("settings") or {}
+    if not isinstance(settings, dict):
+        raise ValueError("settingsはオブジェクトである必要があります")
+    try:
+        default_history = HistoryRule.from_config(settings.get("history"))
+    except ValueError as e:
+        raise ValueError(f"settingsの{e}") from None
+    names = set()
+    for index, expert in enumerate(config["experts"]):
+        if not isinstance(expert, dict):
+            raise ValueError(f"experts[{index}]がオブジェクトではありません")
+        for field in _AGENT_FIELDS:
+            if not isinstance(expert.get(field), str) or not expert[field].strip():
+                raise ValueError(f"experts[{index}]に{field}がありません")
+        if expert["name"] in names:
+            raise ValueError(f"専門家 '{expert['name']}' が重複しています")
+        names.add(expert["name"])
+        # keywords: と値を書かなかった場合（null）はキーワードなし
+        keywords = expert.get("keywords") or []
+        if not isinstance(keywords, list) or not all(isinstance(keyword, str) for keyword in keywords):
+            raise ValueError(f"experts[{index}]のkeywordsは文字列のリストである必要があります")
+        try:
+            HistoryRule.from_config(expert.get("history"), default_history)
+        except ValueError as e:
+            raise ValueError(f"experts[{index}]の{e}") from None
+
+
+def _agent_key(expert: Dict[str, Any]) -> str:
+    fields = {field: expert[field] for field in _AGENT_FIELDS}
+    return hashlib.sha256(json.dumps(fields, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ExpertRegistry:
+    """experts.yamlを監視して最新のエージェント一式を提供する"""
+
+    def __init__(
+        self,
+        config_path: str = "experts.yaml",
+        poll_interval: Optional[float] = None,
+        local_router: bool = False
+    ):
+        """
+        Args:
+            config_path: 専門家設定ファイル
+            poll_interval: 設定ファイルの変更を確認する間隔（秒、0で監視しない）
+                (デフォルトは環境変数EXPERTS_RELOAD_INTERVAL、5)
+            local_router: 設定からローカルルーターも作る
+        """
+        self.config_path = config_path
+        self.poll_interval = (
+            poll_interval if poll_interval is not None
+            else float(os.getenv("EXPERTS_RELOAD_INTERVAL", "5"))
+        )
+        self.local_router = local_router
+        # (種類, 専門家の設定のハッシュ) → 作成済みのエージェント
+        self._agents: Dict[Tuple[str, str], "Agent"] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_error: Optional[str] = None
+
+        # 起動時の設定が不正なら例外をそのまま返す
+        self._file_state = self._stat()
+        digest, config = read_experts_config(config_path)
+        validate_experts_config(config)
+        self._snapshot = self._build(1, digest, config)
+
+    def current(self) -> ExpertSnapshot:
+        """最新のスナップショット（ターンの開始時に1回取得して使い続ける）"""
+        return self._snapshot
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.config_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self) -> bool:
+        """設定ファイルが変わっていれば読み直す（mtimeとサイズが同じなら何もしない）"""
+        state = self._stat()
+        if state is None or state == self._file_state:
+            return False
+        self._file_state = state
+        return self.reload()
+
+    def reload(self) -> bool:
+        """
+        設定ファイルを読み直してスナップショットを差し替える
+
+        Returns:
+            新しい設定を適用したらTrue（内容が同じ、または不正な設定ならFalse）
+        """
+        try:
+            digest, config = read_experts_config(self.config_path)
+            if digest == self._snapshot.digest:
+                return False
+            validate_experts_config(config)
+            snapshot = self._build(self._snapshot.version + 1, digest, config)
+        except Exception as e:
+            self.failed_reloads += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"{self.config_path}の読み込みに失敗したため、以前の設定を使い続けます: {self.last_error}")
+            return False
+
+        self._snapshot = snapshot
+        self.reloads += 1
+        self.last_error = None
+        print(f"{self.config_path}を読み込みました（{len(snapshot.experts_by_name)}人の専門家、バージョン{snapshot.version}）")
+        return True
+
+    def _build(self, version: int, digest: str, config: Dict[str, Any]) -> ExpertSnapshot:
+        from facilitator_agent import FacilitatorAgent
+
+        experts = config["experts"]
+        agents: Dict[Tuple[str, str], "Agent"] = {}
+        triage_experts: List["Agent"] = []
+        conference_experts: List["Agent"] = []
+        for expert in experts:
+            key = _agent_key(expert)
+            # 変わっていない専門家は作成済みのエージェントをそのまま使う
+            for kind, create, built in (
+                ("triage", triage_app.create_expert_agents, triage_experts),
+                ("conference", conference_app.create_expert_agents, conference_experts),
+            ):
+                agent = self._agents.get((kind, key)) or create({"experts": [expert]})[0]
+                agents[(kind, key)] = agent
+                built.append(agent)
+
+        snapshot = ExpertSnapshot(
+            version=version,
+            digest=digest,
+            config=config,
+            experts_by_name={agent.name: agent for agent in triage_experts},
+            triage_agent=triage_app.create_triage_agent(triage_experts),
+            conference_experts={agent.name: agent for agent in conference_experts},
+            facilitator=FacilitatorAgent(conference_experts),
+            router=ExpertRouter.from_config(config) if self.local_router else None,
+            history=HistoryProjection.from_config(config)
+        )
+        # 削除・変更された専門家のエージェントは手放す
+        self._agents = agents
+        return snapshot
+
+    async def start(self) -> None:
+        """設定ファイルの監視を開始"""
+        if self.poll_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                # 設定の解析とエージェントの作成でイベントループを止めない
+                await asyncio.to_thread(self.check)
+            except Exception as e:
+                print(f"{self.config_path}の確認に失敗しました: {e}")
+
+    async def close(self) -> None:
+        """監視を停止"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version,
+            "digest": snapshot.digest[:12],
+            "experts": list(snapshot.experts_by_name),
+            "reloads": self.reloads,
+            "failed_reloads": self.failed_reloads,
+            "last_error": self.last_error
+        }
@@ -0,0 +1,151 @@
+"""
+トリアージの前段で動くローカルな専門家ルーター
+
+experts.yamlの name / description / instructions（と任意の keywords）から
+文字n-gramのTF-IDFベクトルを作り、質問とのコサイン類似度で専門家を選ぶ。
+分かち書きが不要なので日本語の質問にもそのまま使える。
+確信度が閾値に届かない質問はトリアージエージェントに任せる。
+"""
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, NamedTuple, Optional
+
+# 類似度の計算に使う文字n-gramの長さ
+NGRAM_SIZES = (2, 3)
+
+_SEPARATORS = re.compile(r"[\s\W_]+")
+
+
+class RouteDecision(NamedTuple):
+    """ルーティング結果（expertがNoneならトリアージに任せる）"""
+    expert: Optional[str]
+    candidate: str
+    score: float
+    margin: float
+
+
+def normalize(text: str) -> str:
+    """全角/半角と大文字/小文字を揃え、記号と空白を区切りに置き換える"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return _SEPARATORS.sub(" ", text).strip()
+
+
+def char_ngrams(text: str) -> Counter:
+    """単語境界をまたがない文字n-gramの出現回数"""
+    grams: Counter = Counter()
+    for word in normalize(text).split():
+        padded = f" {word} "
+        for n in NGRAM_SIZES:
+            for i in range(len(padded) - n + 1):
+                grams[padded[i:i + n]] += 1
+    return grams
+
+
+class ExpertRouter:
+    """文字n-gram TF-IDFによる専門家ルーター"""
+
+    def __init__(
+        self,
+        experts: List[Dict[str, Any]],
+        threshold: Optional[float] = None,
+        min_margin: Optional[float] = None
+    ):
+        """
+        Args:
+            experts: experts.yamlのexpertsリスト
+            threshold: ローカルで振り分ける最小の類似度
+                (デフォルトは環境変数LOCAL_ROUTER_THRESHOLD、0.15)
+            min_margin: 1位と2位の類似度の最小差
+                (デフォルトは環境変数LOCAL_ROUTER_MIN_MARGIN、0.04)
+        """
+        self.threshold = threshold if threshold is not None else float(os.getenv("LOCAL_ROUTER_THRESHOLD", "0.15"))
+        self.min_margin = min_margin if min_margin is not None else float(os.getenv("LOCAL_ROUTER_MIN_MARGIN", "0.04"))
+        self.expert_names = [expert["name"] for expert in experts]
+
+        documents = [
+            char_ngrams(" ".join([
+                expert["name"],
+                expert.get("description", ""),
+                expert.get("instructions", ""),
+                # キーワードは説明文より重視する
+                " ".join((expert.get("keywords") or []) * 3),
+            ]))
+            for expert in experts
+        ]
+        document_frequency: Counter = Counter()
+        for grams in documents:
+            document_frequency.update(grams.keys())
+        count = len(documents)
+        self._idf = {
+            gram: math.log((1 + count) / (1 + frequency)) + 1
+            for gram, frequency in document_frequency.items()
+        }
+        self._vectors = [self._vectorize(grams) for grams in documents]
+
+        self.routed = 0
+        self.fallbacks = 0
+        self.shadow_checked = 0
+        self.shadow_agreed = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], **kwargs) -> "ExpertRouter":
+        return cls(config.get("experts", []), **kwargs)
+
+    def _vectorize(self, grams: Counter) -> Dict[str, float]:
+        vector = {
+            gram: (1 + math.log(frequency)) * self._idf[gram]
+            for gram, frequency in grams.items()
+            if gram in self._idf
+        }
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        if norm == 0:
+            return {}
+        return {gram: weight / norm for gram, weight in vector.items()}
+
+    def scores(self, question: str) -> List[float]:
+        """各専門家との類似度（expert_namesの順）"""
+        query = self._vectorize(char_ngrams(question))
+        return [
+            sum(weight * vector.get(gram, 0.0) for gram, weight in query.items())
+            for vector in self._vectors
+        ]
+
+    def classify(self, question: str) -> RouteDecision:
+        """統計を更新せずに判定する（評価用）"""
+        scores = self.scores(question)
+        ranked = sorted(range(len(scores)), key=scores.__getitem__, reverse=True)
+        best = ranked[0]
+        margin = scores[best] - (scores[ranked[1]] if len(ranked) > 1 else 0.0)
+        confident = scores[best] >= self.threshold and margin >= self.min_margin
+        candidate = self.expert_names[best]
+        return RouteDecision(candidate if confident else None, candidate, scores[best], margin)
+
+    def route(self, question: str) -> RouteDecision:
+        """質問を判定し、ローカル振り分け/フォールバックの回数を記録する"""
+        decision = self.classify(question)
+        if decision.expert is not None:
+            self.routed += 1
+        else:
+            self.fallbacks += 1
+        return decision
+
+    def record_triage_choice(self, decision: RouteDecision, triage_expert: str) -> None:
+        """フォールバック時にトリアージが選んだ専門家と候補を突き合わせる（影の正解率）"""
+        self.shadow_checked += 1
+        if decision.candidate == triage_expert:
+            self.shadow_agreed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット率と、トリアージとの一致率"""
+        total = self.routed + self.fallbacks
+        return {
+            "questions": total,
+            "routed_locally": self.routed,
+            "fallbacks": self.fallbacks,
+            "hit_rate": self.routed / total if total else 0.0,
+            "shadow_checked": self.shadow_checked,
+            "shadow_accuracy": self.shadow_agreed / self.shadow_checked if self.shadow_checked else None,
+        }
@@ -3,7 +3,7 @@
 """
 from typing import List, Dict, Any, Optional
 from agents import Agent
-import json
+from nomination_parser import parse_nominations
 
 
 class FacilitatorAgent(Agent):
@@ -31,7 +31,15 @@ class FacilitatorAgent(Agent):
      "question": "具体的な質問内容"
    }}
 
-4. 一般的な内容や会議進行に関することは、あなたが直接回答してください
+4. 複数の分野にまたがる質問の場合は、JSON配列で複数の専門家を同時に指名できます：
+
+   【専門家指名】
+   [
+     {{"expert": "専門家名1", "question": "専門家1への質問内容"}},
+     {{"expert": "専門家名2", "question": "専門家2への質問内容"}}
+   ]
+
+5. 一般的な内容や会議進行に関することは、あなたが直接回答してください
 
 回答例1（自分で回答する場合）：
 「司会者です。ご質問ありがとうございます。その点については、一般的に...（回答内容）」
@@ -53,26 +61,10 @@ class FacilitatorAgent(Agent):
         )
     
     def parse_expert_request(self, response: str) -> Optional[Dict[str, str]]:
-        """司会者の応答から専門家への依頼を抽出"""
-        if "【専門家指名】" not in response:
-            return None
-        
-        try:
-            # 【専門家指名】以降のJSON部分を抽出
-            parts = response.split("【専門家指名】")
-            if len(parts) < 2:
-                return None
-            
-            json_str = parts[1].strip()
-            # JSONの開始と終了を見つける
-            start = json_str.find('{')
-            end = json_str.rfind('}') + 1
-            
-            if start == -1 or end == 0:
-                return None
-            
-            json_data = json_str[start:end]
-            return json.loads(json_data)
-        except Exception as e:
-            print(f"専門家指名の解析エラー: {e}")
-            return None
\ No newline at end of file
+        """司会者の応答から専門家への依頼を抽出（最初の1件）"""
+        requests = self.parse_expert_requests(response)
+        return requests[0] if requests else None
+    
+    def parse_expert_requests(self, response: str) -> List[Dict[str, str]]:
+        """司会者の応答から専門家への依頼をすべて抽出（指名順）"""
+        return parse_nominations(response)
@@ -2,42 +2,40 @@
 RedisSessionを使用した専門家エージェントシステム
 """
 import asyncio
-import yaml
 import uuid
 import os
-import base64
-from typing import List, Dict, Any, Optional
-from agents import Agent, Runner
-from redis_session import RedisSession, create_redis_session
+import time
+from typing import Callable, List, Dict, Any, Optional, Tuple, TYPE_CHECKING
+from answer_cache import AnswerCache, cached_turn_items, create_answer_cache
+from expert_config import cached_build, read_experts_config
+from expert_router import ExpertRouter
+from redis_session import RedisSession, create_redis_session, get_session_manager
+from startup import preload
+from streaming import stream_text
+from tiered_session import create_tiered_store
 from dotenv import load_dotenv
-import logfire
+
+# agentsとlogfireは読み込みに時間がかかるため、使う関数の中でimportする
+if TYPE_CHECKING:
+    from agents import Agent
 
 # 環境変数を読み込む
 load_dotenv()
 
-# OpenTelemetryエンドポイントをLangfuseに設定
-if os.getenv("LANGFUSE_PUBLIC_KEY") and os.getenv("LANGFUSE_SECRET_KEY"):
-    LANGFUSE_AUTH = base64.b64encode(
-        f"{os.environ.get('LANGFUSE_PUBLIC_KEY')}:{os.environ.get('LANGFUSE_SECRET_KEY')}".encode()
-    ).decode()
-    os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"] = os.environ.get("LANGFUSE_HOST", "https://cloud.langfuse.com") + "/api/public/otel"
-    os.environ["OTEL_EXPORTER_OTLP_HEADERS"] = f"Authorization=Basic {LANGFUSE_AUTH}"
+# 回答をトークン単位で逐次表示する
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "").lower() in ("1", "true")
 
-# Langfuse統合をセットアップ
-logfire.configure(
-    service_name='expert-agent-system',
-    send_to_logfire=False
-    # scrubbingパラメータを省略することでデフォルト（マスキング有効）になる
-)
-logfire.instrument_openai_agents()
+# 明らかな質問はトリアージのLLM呼び出しを省いて専門家に直接振り分ける
+LOCAL_ROUTER = os.getenv("LOCAL_ROUTER", "").lower() in ("1", "true")
 
 
 def load_experts_config(file_path: str = "experts.yaml") -> Dict[str, Any]:
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
+    return read_experts_config(file_path)[1]
 
 
-def create_expert_agents(config: Dict[str, Any]) -> List[Agent]:
+def create_expert_agents(config: Dict[str, Any]) -> List["Agent"]:
+    from agents import Agent
+    
     expert_agents = []
     for expert in config.get('experts', []):
         agent = Agent(
@@ -49,7 +47,9 @@ def create_expert_agents(config: Dict[str, Any]) -> List[Agent]:
     return expert_agents
 
 
-def create_triage_agent(expert_agents: List[Agent], context: Optional[str] = None) -> Agent:
+def create_triage_agent(expert_agents: List["Agent"], context: Optional[str] = None) -> "Agent":
+    from agents import Agent
+    
     expert_list = "\n".join([f"- {agent.name}: {agent.handoff_description}" for agent in expert_agents])
     
     instructions = f"""あなたはユーザーの質問を分析して、最適な専門家を選択するトリアージエージェントです。
@@ -71,6 +71,18 @@ def create_triage_agent(expert_agents: List[Agent], context: Optional[str] = Non
     )
 
 
+def build_agents(file_path: str = "experts.yaml") -> Tuple[Dict[str, Any], List["Agent"], "Agent"]:
+    """設定ファイルから専門家とトリアージエージェントを作る（同じ内容の設定なら作成済みのものを返す）"""
+    digest, config = read_experts_config(file_path)
+    
+    def build() -> Tuple[List["Agent"], "Agent"]:
+        expert_agents = create_expert_agents(config)
+        return expert_agents, create_triage_agent(expert_agents)
+    
+    expert_agents, triage_agent = cached_build(digest, "triage", build)
+    return config, expert_agents, triage_agent
+
+
 async def display_recent_conversation(session: RedisSession, display_count: int = 6):
     """最近の会話履歴を表示"""
     items = await session.get_items(limit=display_count)
@@ -113,9 +125,120 @@ async def display_recent_conversation(session: RedisSession, display_count: int
     print("="*50)
 
 
+def _print(text: str) -> None:
+    print(text, end="", flush=True)
+
+
+async def run_turn(
+    triage_agent: "Agent",
+    experts_by_name: Dict[str, "Agent"],
+    session: RedisSession,
+    session_id: str,
+    user_input: str,
+    history_max_tokens: Optional[int] = None,
+    router: Optional[ExpertRouter] = None,
+    answer_cache: Optional[AnswerCache] = None,
+    stream: bool = STREAM_RESPONSES,
+    write: Callable[[str], None] = _print,
+    expert: Optional[str] = None
+) -> Tuple[str, str]:
+    """1つの質問に専門家が回答する（回答はwriteに出力）
+    
+    expertを指定するとトリアージを行わずにその専門家が回答する
+    
+    Returns:
+        回答したエージェントの名前と回答
+    """
+    import logfire
+    from agents import Runner
+    
+    # ローカルで振り分けられればトリアージを省略
+    decision = router.route(user_input) if router and not expert else None
+    if expert:
+        agent = experts_by_name[expert]
+    else:
+        agent = experts_by_name[decision.expert] if decision and decision.expert else triage_agent
+    
+    # Langfuseのsession_idを設定
+    with logfire.span("user-interaction") as span:
+        span.set_attribute("langfuse.session.id", session_id)
+        if decision:
+            span.set_attribute("router.local", decision.expert is not None)
+            span.set_attribute("router.candidate", decision.candidate)
+            span.set_attribute("router.score", decision.score)
+        
+        # 専門家が決まっていれば、同じ質問への回答をキャッシュから探す
+        cached = None
+        if answer_cache and agent is not triage_agent:
+            cached = await answer_cache.get(agent.name, agent.instructions, user_input)
+            span.set_attribute("answer_cache.hit", cached is not None)
+        
+        start = time.perf_counter()
+        if cached:
+            # キャッシュから回答した場合も会話履歴には記録する
+            await session.add_items(cached_turn_items(user_input, cached.answer))
+        elif stream:
+            result = Runner.run_streamed(
+                agent,
+                user_input,
+                session=session.with_token_budget(history_max_tokens)  # type: ignore
+            )
+            # 応答を到着順に表示
+            write("専門家の回答:\n")
+            await stream_text(result, write=write, span=span)
+            write("\n")
+        else:
+            result = await Runner.run(
+                agent,
+                user_input,
+                session=session.with_token_budget(history_max_tokens)  # type: ignore
+            )
+    
+    if cached:
+        write(f"専門家の回答（キャッシュ）:\n{cached.answer}\n")
+        return agent.name, cached.answer
+    
+    if decision and decision.expert is None:
+        # トリアージの選択と照らし合わせてルーターの精度を記録
+        router.record_triage_choice(decision, result.last_agent.name)
+    
+    # キャッシュを読むのは実行前に専門家が決まる場合だけなので、ルーターも専門家の指定もなければ保存しない
+    if answer_cache and (router or expert) and result.last_agent.name in experts_by_name:
+        await answer_cache.put(
+            result.last_agent.name,
+            result.last_agent.instructions,
+            user_input,
+            str(result.final_output),
+            (time.perf_counter() - start) * 1000
+        )
+    
+    if not stream:
+        # 応答を表示
+        write(f"\n専門家の回答:\n{result.final_output}\n")
+    return result.last_agent.name, str(result.final_output)
+
+
 async def main():
+    # テレメトリの設定とエージェントの作成（FAST_STARTUPなら入力を待つ間に別スレッドで行う）
+    startup = preload("expert-agent-system", build_agents)
+    
     print("専門家エージェントシステムを起動中...")
     
+    # 接続プールを共有するセッションマネージャー
+    session_manager = get_session_manager()
+    
+    # 書き込みをローカルに記録してからRedisに送る（オプション）
+    tiered_store = create_tiered_store(session_manager)
+    
+    # 長くなった会話履歴をバックグラウンドで要約（オプション）
+    compactor = None
+    if os.getenv("REDIS_SESSION_COMPACTION", "").lower() in ("1", "true"):
+        from session_compaction import SessionCompactor
+        compactor = SessionCompactor(manager=session_manager)
+    
+    # モデルに渡す会話履歴のトークン予算（0は無制限）
+    history_max_tokens = int(os.getenv("HISTORY_MAX_TOKENS", "0")) or None
+    
     # 既存のセッションIDがあるか確認
     resume_session_id = input("既存のセッションを再開しますか？ セッションIDを入力（新規の場合はEnter）: ").strip()
     
@@ -124,7 +247,7 @@ async def main():
         print(f"\nセッション {session_id} を再開します...")
         
         # RedisSessionを作成（既存データを復元）
-        session = await create_redis_session(session_id, restore_existing=True)
+        session = await create_redis_session(session_id, restore_existing=True, manager=session_manager, tiered=tiered_store, compactor=compactor)
         
         # セッション情報を確認
         session_info = await session.get_session_info()
@@ -145,17 +268,18 @@ async def main():
         print(f"\n新規セッション {session_id} を開始します...")
         
         # 新しいRedisSessionを作成
-        session = await create_redis_session(session_id, restore_existing=False)
-    
-    # 設定ファイルを読み込み
-    config = load_experts_config()
+        session = await create_redis_session(session_id, restore_existing=False, manager=session_manager, tiered=tiered_store, compactor=compactor)
     
-    # 専門家エージェントを作成
-    expert_agents = create_expert_agents(config)
+    # 設定ファイルから作った専門家とトリアージエージェント
+    config, expert_agents, triage_agent = await asyncio.wrap_future(startup)
     print(f"{len(expert_agents)}人の専門家を読み込みました")
     
-    # トリアージエージェントを作成
-    triage_agent = create_triage_agent(expert_agents)
+    # ローカルルーター（確信度が低い質問はトリアージエージェントに任せる）
+    router = ExpertRouter.from_config(config) if LOCAL_ROUTER else None
+    experts_by_name = {agent.name: agent for agent in expert_agents}
+    
+    # 専門家の回答キャッシュ（オプション）
+    answer_cache = create_answer_cache(session_manager)
     
     print("\n質問を入力してください（'exit'で終了）:\n")
     
@@ -174,6 +298,12 @@ async def main():
                 if session_info['ttl_seconds']:
                     days = session_info['ttl_seconds'] // 86400
                     print(f"有効期限: 約{days}日後")
+                if router:
+                    stats = router.stats()
+                    print(f"ローカル振り分け: {stats['routed_locally']}/{stats['questions']}件")
+                if answer_cache:
+                    stats = answer_cache.stats()
+                    print(f"回答キャッシュ: {stats['hits'] + stats['near_hits']}件ヒット（約{stats['latency_saved_ms'] / 1000:.1f}秒短縮）")
                 break
             
             if not user_input:
@@ -183,18 +313,13 @@ async def main():
                 # エージェントを実行
                 print("\n専門家が回答を準備中...\n")
                 
-                # Langfuseのsession_idを設定
-                with logfire.span("user-interaction") as span:
-                    span.set_attribute("langfuse.session.id", session_id)
-                    result = await Runner.run(
-                        triage_agent,
-                        user_input,
-                        session=session  # type: ignore
+                # ターン中の書き込みはまとめて1回で保存（失敗したターンは保存しない）
+                async with session.turn():
+                    await run_turn(
+                        triage_agent, experts_by_name, session, session_id, user_input,
+                        history_max_tokens, router, answer_cache
                     )
                 
-                # 応答を表示
-                print(f"\n専門家の回答:\n{result.final_output}")
-                
                 # TTLを延長（アクティビティがあったため）
                 await session.extend_ttl()
                     
@@ -203,8 +328,14 @@ async def main():
                 continue
                 
     finally:
-        # セッションを閉じる
+        # 実行中の要約を待ってからセッションを閉じる（接続はプールに返却）
+        if compactor:
+            await compactor.wait()
         await session.close()
+        if tiered_store:
+            # 未送信の書き込みをRedisに送ってから接続を閉じる
+            await tiered_store.close()
+        await session_manager.close()
 
 
 if __name__ == "__main__":
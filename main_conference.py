@@ -3,43 +3,44 @@
 司会者と専門家の発言を明確に分離して表示
 """
 import asyncio
-import yaml
 import uuid
 import os
-import base64
-from typing import List, Dict, Any, Optional
-from agents import Agent, Runner
-from redis_session import RedisSession, create_redis_session
-from facilitator_agent import FacilitatorAgent
+import time
+from typing import Callable, List, Dict, Any, Optional, Tuple, TYPE_CHECKING
+from answer_cache import AnswerCache, cached_turn_items, create_answer_cache
+from expert_config import cached_build, read_experts_config
+from redis_session import RedisSession, create_redis_session, get_session_manager
+from nomination_parser import NOMINATION_MARKER, NominationStreamParser
+from session_views import USER_AUTHOR, HistoryProjection, SessionView, project
+from startup import preload
+from streaming import OrderedOutput, stream_text
+from token_estimator import TokenCounter, estimate_item_tokens
+from tiered_session import create_tiered_store
 from dotenv import load_dotenv
-import logfire
+
+# agentsとlogfireは読み込みに時間がかかるため、使う関数の中でimportする
+if TYPE_CHECKING:
+    from agents import Agent
+    from facilitator_agent import FacilitatorAgent
 
 # 環境変数を読み込む
 load_dotenv()
 
-# OpenTelemetryエンドポイントをLangfuseに設定
-if os.getenv("LANGFUSE_PUBLIC_KEY") and os.getenv("LANGFUSE_SECRET_KEY"):
-    LANGFUSE_AUTH = base64.b64encode(
-        f"{os.environ.get('LANGFUSE_PUBLIC_KEY')}:{os.environ.get('LANGFUSE_SECRET_KEY')}".encode()
-    ).decode()
-    os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"] = os.environ.get("LANGFUSE_HOST", "https://cloud.langfuse.com") + "/api/public/otel"
-    os.environ["OTEL_EXPORTER_OTLP_HEADERS"] = f"Authorization=Basic {LANGFUSE_AUTH}"
+# 同時に回答する専門家の最大数
+MAX_PARALLEL_EXPERTS = int(os.getenv("CONFERENCE_MAX_PARALLEL_EXPERTS", "3"))
 
-# Langfuse統合をセットアップ
-logfire.configure(
-    service_name='conference-agent-system',
-    send_to_logfire=False
-)
-logfire.instrument_openai_agents()
+# 発言をトークン単位で逐次表示する
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "").lower() in ("1", "true")
 
 
 def load_experts_config(file_path: str = "experts.yaml") -> Dict[str, Any]:
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
+    return read_experts_config(file_path)[1]
 
 
-def create_expert_agents(config: Dict[str, Any]) -> List[Agent]:
+def create_expert_agents(config: Dict[str, Any]) -> List["Agent"]:
     """専門家エージェントを作成"""
+    from agents import Agent
+    
     expert_agents = []
     for expert in config.get('experts', []):
         # 専門家としての発言を促すインストラクション
@@ -62,6 +63,20 @@ def create_expert_agents(config: Dict[str, Any]) -> List[Agent]:
     return expert_agents
 
 
+def build_agents(file_path: str = "experts.yaml") -> Tuple[Dict[str, Any], List["Agent"], "FacilitatorAgent"]:
+    """設定ファイルから専門家と司会者を作る（同じ内容の設定なら作成済みのものを返す）"""
+    from facilitator_agent import FacilitatorAgent
+    
+    digest, config = read_experts_config(file_path)
+    
+    def build() -> Tuple[List["Agent"], "FacilitatorAgent"]:
+        expert_agents = create_expert_agents(config)
+        return expert_agents, FacilitatorAgent(expert_agents)
+    
+    expert_agents, facilitator = cached_build(digest, "conference", build)
+    return config, expert_agents, facilitator
+
+
 async def save_message(session: RedisSession, role: str, content: str, speaker: Optional[str] = None):
     """発言をセッションに保存（Runner.runが自動保存しない場合のみ使用）"""
     # 注意: Runner.runを使用する場合、入力と出力は自動的に保存されるため、
@@ -117,10 +132,351 @@ async def display_recent_conversation(session: RedisSession, display_count: int
     print("="*50)
 
 
+async def run_expert(
+    expert_agent: "Agent",
+    question: str,
+    history: List[Dict[str, Any]],
+    semaphore: asyncio.Semaphore,
+    session_id: str,
+    output: Optional[OrderedOutput] = None,
+    index: int = 0,
+    answer_cache: Optional[AnswerCache] = None
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """専門家1人に質問（会話履歴はスナップショットを渡し、セッションには直接書き込まない）
+    
+    outputを渡すとストリーミング実行し、発言をoutputのindex番目として表示する
+    
+    Returns:
+        専門家の発言と、セッションに保存するアイテム（質問を含む）
+    """
+    import logfire
+    from agents import Runner
+    
+    expert_input = history + [{"role": "user", "content": question}]
+    async with semaphore:
+        with logfire.span("expert-response") as span:
+            span.set_attribute("langfuse.session.id", session_id)
+            span.set_attribute("expert.name", expert_agent.name)
+            
+            # 同じ専門家への同じ質問はキャッシュから回答
+            if answer_cache is not None:
+                cached = await answer_cache.get(expert_agent.name, expert_agent.instructions, question)
+                span.set_attribute("answer_cache.hit", cached is not None)
+                if cached:
+                    if output is not None:
+                        output.write(index, f"【{expert_agent.name}】:\n{cached.answer}\n\n")
+                        output.finish(index)
+                    return cached.answer, cached_turn_items(question, cached.answer)
+            
+            start = time.perf_counter()
+            if output is None:
+                result = await Runner.run(expert_agent, expert_input)
+            else:
+                try:
+                    result = Runner.run_streamed(expert_agent, expert_input)
+                    output.write(index, f"【{expert_agent.name}】:\n")
+                    await stream_text(result, write=lambda text: output.write(index, text), span=span)
+                    output.write(index, "\n\n")
+                except Exception as e:
+                    output.write(index, f"【{expert_agent.name}】: 回答中にエラーが発生しました: {e}\n\n")
+                    raise
+                finally:
+                    output.finish(index)
+            
+            answer = str(result.final_output)
+            if answer_cache is not None:
+                await answer_cache.put(
+                    expert_agent.name, expert_agent.instructions, question, answer,
+                    (time.perf_counter() - start) * 1000
+                )
+            items = [{"role": "user", "content": question}]
+            items.extend(item.to_input_item() for item in result.new_items)
+            return answer, items
+
+
+class ExpertPanel:
+    """指名された専門家を並行実行し、指名順に表示・保存する"""
+    
+    def __init__(
+        self,
+        expert_dict: Dict[str, "Agent"],
+        session_id: str,
+        output: Optional[OrderedOutput] = None,
+        answer_cache: Optional[AnswerCache] = None,
+        projection: Optional[HistoryProjection] = None,
+        history_max_tokens: Optional[int] = None,
+        summary: bool = False,
+        token_counter: TokenCounter = estimate_item_tokens
+    ):
+        self.expert_dict = expert_dict
+        self.session_id = session_id
+        self.output = output
+        self.answer_cache = answer_cache
+        # 専門家ごとの会話履歴の規則（上限のない規則にはhistory_max_tokensを使う）
+        self.projection = projection or HistoryProjection()
+        self.history_max_tokens = history_max_tokens
+        self.summary = summary
+        self.token_counter = token_counter
+        self._semaphore = asyncio.Semaphore(MAX_PARALLEL_EXPERTS)
+        self._runs: List[Tuple[str, str, asyncio.Task]] = []
+    
+    def start(self, nomination: Dict[str, Any], items: List[Dict[str, Any]], authors: List[Optional[str]]) -> bool:
+        """指名された専門家の実行を開始（存在しない専門家や質問のない指名は無視）
+        
+        itemsとauthorsは共有の会話履歴と各アイテムの発言者で、専門家の規則で絞り込んで渡す
+        """
+        expert_name = nomination.get("expert")
+        question = nomination.get("question")
+        if expert_name not in self.expert_dict or not question:
+            return False
+        
+        history = items
+        if self.projection.configured:
+            rule = self.projection.rule_for(expert_name)
+            if rule.max_tokens is None:
+                rule = rule._replace(max_tokens=self.history_max_tokens)
+            history = project(items, authors, expert_name, rule, self.summary, self.token_counter)
+        
+        if self.output is None:
+            print(f"\n（{expert_name}に発言を依頼中...）")
+        index = self.output.add() if self.output is not None else 0
+        task = asyncio.create_task(run_expert(
+            self.expert_dict[expert_name], question, history, self._semaphore,
+            self.session_id, self.output, index, self.answer_cache
+        ))
+        self._runs.append((expert_name, question, task))
+        return True
+    
+    def cancel(self) -> None:
+        for _, _, task in self._runs:
+            task.cancel()
+    
+    async def finish(self, session: RedisSession) -> List[Tuple[str, str]]:
+        """全員の回答を待ち、指名順に1回の書き込みでセッションに保存
+        
+        Returns:
+            回答できた専門家の名前と発言（指名順）
+        """
+        if not self._runs:
+            return []
+        if self.output is None:
+            print()
+        
+        # 先に指名された専門家から順に、完了し次第表示
+        new_items: List[Dict[str, Any]] = []
+        authors: List[Optional[str]] = []
+        answers: List[Tuple[str, str]] = []
+        for expert_name, question, task in self._runs:
+            try:
+                answer, items = await task
+            except Exception as e:
+                if self.output is None:
+                    print(f"【{expert_name}】: 回答中にエラーが発生しました: {e}\n")
+                continue
+            
+            if self.output is None:
+                # 専門家の発言を表示
+                print(f"【{expert_name}】:")
+                print(answer)
+                print()
+            
+            # 専門家への質問も含めて、その専門家の発言として記録
+            new_items.extend(items)
+            authors.extend([expert_name] * len(items))
+            answers.append((expert_name, answer))
+        
+        await session.add_items(new_items, authors)
+        return answers
+
+
+async def read_history(
+    session: RedisSession,
+    history_max_tokens: Optional[int],
+    projection: Optional[HistoryProjection]
+) -> Tuple[List[Dict[str, Any]], List[Optional[str]]]:
+    """専門家に渡す会話履歴と各アイテムの発言者を読む
+    
+    規則がなければ、これまでどおりトークン予算の範囲だけを読む
+    """
+    if projection is not None and projection.configured:
+        return await session.get_authored_items()
+    items = await session.get_items(max_tokens=history_max_tokens)
+    return items, [None] * len(items)
+
+
+def print_nominations(nominations: List[Dict[str, Any]], write=print):
+    """専門家への依頼を自然な日本語で表示"""
+    for nomination in nominations:
+        write(f"\nでは、{nomination.get('expert')}さん、{nomination.get('question')}\n")
+
+
+async def run_turn(
+    facilitator: "FacilitatorAgent",
+    expert_dict: Dict[str, "Agent"],
+    session: RedisSession,
+    session_id: str,
+    user_input: str,
+    history_max_tokens: Optional[int] = None,
+    answer_cache: Optional[AnswerCache] = None,
+    projection: Optional[HistoryProjection] = None
+) -> Tuple[str, List[Tuple[str, str]]]:
+    """司会者の発言が完了してから、指名された専門家が応答する
+    
+    専門家にはprojectionの規則で絞り込んだ会話履歴を渡す（Noneなら全員が同じ履歴）
+    
+    Returns:
+        司会者の発言と、専門家の名前と発言のリスト
+    """
+    import logfire
+    from agents import Runner
+    
+    # 司会者が応答（会話履歴を含めて実行）
+    with logfire.span("facilitator-response") as span:
+        span.set_attribute("langfuse.session.id", session_id)
+        
+        result = await Runner.run(
+            facilitator,
+            user_input,
+            # 会話履歴を含める（保存するアイテムに発言者を記録）
+            session=SessionView(session.with_token_budget(history_max_tokens), facilitator.name)  # type: ignore
+        )
+    
+    facilitator_response = result.final_output
+    
+    # 専門家への依頼をチェック（表示前に解析）
+    expert_requests = facilitator.parse_expert_requests(facilitator_response)
+    
+    # 司会者の発言を表示・保存
+    print("\n【司会者】:")
+    if expert_requests:
+        # 専門家への依頼がある場合は、JSON部分を自然な日本語に変換
+        # JSON部分より前のテキストを取得
+        json_start = facilitator_response.find(NOMINATION_MARKER)
+        if json_start > 0:
+            pre_text = facilitator_response[:json_start].strip()
+            if pre_text:
+                print(pre_text)
+        
+        # 自然な日本語で専門家への依頼を表示
+        print_nominations(expert_requests, write=lambda text: print(text, end=""))
+    else:
+        # 専門家への依頼がない場合はそのまま表示
+        print(facilitator_response)
+    
+    # 司会者の応答は Runner.run が自動的に保存するため、ここでは保存しない
+    # await save_message(session, "assistant", facilitator_response, "司会者")
+    
+    # 指名された専門家が並行して応答（全員が司会者の発言までの会話履歴を参照する）
+    items, authors = await read_history(session, history_max_tokens, projection)
+    panel = ExpertPanel(
+        expert_dict, session_id, answer_cache=answer_cache,
+        projection=projection, history_max_tokens=history_max_tokens, summary=session.summary_present,
+        token_counter=session.token_counter
+    )
+    for expert_request in expert_requests:
+        panel.start(expert_request, items, authors)
+    return facilitator_response, await panel.finish(session)
+
+
+async def run_streamed_turn(
+    facilitator: "FacilitatorAgent",
+    expert_dict: Dict[str, "Agent"],
+    session: RedisSession,
+    session_id: str,
+    user_input: str,
+    history_max_tokens: Optional[int] = None,
+    answer_cache: Optional[AnswerCache] = None,
+    write: Optional[Callable[[str], None]] = None,
+    projection: Optional[HistoryProjection] = None
+) -> Tuple[str, List[Tuple[str, str]]]:
+    """司会者の発言をストリーミングし、指名が確定した専門家から順に実行を開始する（writeを渡すと発言をそこに出力）
+    
+    Returns:
+        司会者の発言と、専門家の名前と発言のリスト
+    """
+    import logfire
+    from agents import Runner
+    
+    # 専門家にはこのターンより前の会話履歴 + ユーザーの発言 + 指名時点までの司会者の発言を渡す
+    items, authors = await read_history(session, history_max_tokens, projection)
+    items.append({"role": "user", "content": user_input})
+    authors.append(USER_AUTHOR)
+    
+    # 司会者の発言を先頭に、専門家の発言を指名順に表示する
+    output = OrderedOutput(write=write) if write is not None else OrderedOutput()
+    facilitator_index = output.add()
+    panel = ExpertPanel(
+        expert_dict, session_id, output, answer_cache,
+        projection, history_max_tokens, session.summary_present, session.token_counter
+    )
+    parser = NominationStreamParser()
+    facilitator_text: List[str] = []
+    
+    def on_text(delta: str):
+        facilitator_text.append(delta)
+        for nomination in parser.feed(delta):
+            panel.start(
+                nomination,
+                items + [{"role": "assistant", "content": "".join(facilitator_text)}],
+                authors + [facilitator.name]
+            )
+    
+    try:
+        with logfire.span("facilitator-response") as span:
+            span.set_attribute("langfuse.session.id", session_id)
+            
+            # 専門家指名のJSON部分は表示せず、自然な日本語に変換して表示
+            output.write(facilitator_index, "\n【司会者】:\n")
+            result = Runner.run_streamed(
+                facilitator,
+                user_input,
+                # 会話履歴を含める（保存するアイテムに発言者を記録）
+                session=SessionView(session.with_token_budget(history_max_tokens), facilitator.name)  # type: ignore
+            )
+            await stream_text(
+                result,
+                write=lambda text: output.write(facilitator_index, text),
+                span=span,
+                hide_from=NOMINATION_MARKER,
+                on_text=on_text
+            )
+            span.set_attribute("conference.nominations", len(parser.nominations))
+    except BaseException:
+        panel.cancel()
+        raise
+    
+    parser.close()
+    for error in parser.errors:
+        output.write(facilitator_index, f"\n専門家指名の解析エラー: {error}")
+    print_nominations(parser.nominations, write=lambda text: output.write(facilitator_index, text))
+    output.write(facilitator_index, "\n")
+    output.finish(facilitator_index)
+    
+    return "".join(facilitator_text), await panel.finish(session)
+
+
 async def main():
+    # テレメトリの設定とエージェントの作成（FAST_STARTUPなら入力を待つ間に別スレッドで行う）
+    startup = preload("conference-agent-system", build_agents)
+    
     print("会議形式専門家システムを起動中...")
     print("司会者と専門家が順番に発言します")
     
+    # 接続プールを共有するセッションマネージャー
+    session_manager = get_session_manager()
+    
+    # 書き込みをローカルに記録してからRedisに送る（オプション）
+    tiered_store = create_tiered_store(session_manager)
+    
+    # 長くなった会話履歴をバックグラウンドで要約（オプション）
+    compactor = None
+    if os.getenv("REDIS_SESSION_COMPACTION", "").lower() in ("1", "true"):
+        from session_compaction import SessionCompactor
+        compactor = SessionCompactor(manager=session_manager)
+    
+    # モデルに渡す会話履歴のトークン予算（0は無制限）
+    history_max_tokens = int(os.getenv("HISTORY_MAX_TOKENS", "0")) or None
+    
     # 既存のセッションIDがあるか確認
     resume_session_id = input("\n既存の会議を再開しますか？ セッションIDを入力（新規の場合はEnter）: ").strip()
     
@@ -129,7 +485,7 @@ async def main():
         print(f"\n会議セッション {session_id} を再開します...")
         
         # RedisSessionを作成（既存データを復元）
-        session = await create_redis_session(session_id, restore_existing=True)
+        session = await create_redis_session(session_id, restore_existing=True, manager=session_manager, tiered=tiered_store, compactor=compactor)
         
         # セッション情報を確認
         session_info = await session.get_session_info()
@@ -150,22 +506,22 @@ async def main():
         print(f"\n新規会議セッション {session_id} を開始します...")
         
         # 新しいRedisSessionを作成
-        session = await create_redis_session(session_id, restore_existing=False)
+        session = await create_redis_session(session_id, restore_existing=False, manager=session_manager, tiered=tiered_store, compactor=compactor)
     
-    # 設定ファイルを読み込み
-    config = load_experts_config()
-    
-    # 専門家エージェントを作成
-    expert_agents = create_expert_agents(config)
+    # 設定ファイルから作った専門家と司会者
+    config, expert_agents, facilitator = await asyncio.wrap_future(startup)
     expert_dict = {agent.name: agent for agent in expert_agents}
     
+    # 専門家ごとに絞り込む会話履歴の規則（experts.yamlのhistory）
+    projection = HistoryProjection.from_config(config)
+    
     print(f"\n参加者：")
     print(f"- 司会者")
     for agent in expert_agents:
         print(f"- {agent.name}")
     
-    # 司会者エージェントを作成
-    facilitator = FacilitatorAgent(expert_agents)
+    # 専門家の回答キャッシュ（オプション）
+    answer_cache = create_answer_cache(session_manager)
     
     print("\n会議を開始します。質問や議題を入力してください（'exit'で終了）:\n")
     
@@ -184,6 +540,9 @@ async def main():
                 if session_info['ttl_seconds']:
                     days = session_info['ttl_seconds'] // 86400
                     print(f"記録の有効期限: 約{days}日後")
+                if answer_cache:
+                    stats = answer_cache.stats()
+                    print(f"回答キャッシュ: {stats['hits'] + stats['near_hits']}件ヒット（約{stats['latency_saved_ms'] / 1000:.1f}秒短縮）")
                 break
             
             if not user_input:
@@ -195,71 +554,18 @@ async def main():
                 
                 print("\n" + "-"*50)
                 
-                # 司会者が応答（会話履歴を含めて実行）
-                with logfire.span("facilitator-response") as span:
-                    span.set_attribute("langfuse.session.id", session_id)
-                    
-                    result = await Runner.run(
-                        facilitator,
-                        user_input,
-                        session=session  # type: ignore  # 会話履歴を含める
-                    )
-                
-                facilitator_response = result.final_output
-                
-                # 専門家への依頼をチェック（表示前に解析）
-                expert_request = facilitator.parse_expert_request(facilitator_response)
-                
-                # 司会者の発言を表示・保存
-                print("\n【司会者】:")
-                if expert_request:
-                    # 専門家への依頼がある場合は、JSON部分を自然な日本語に変換
-                    expert_name = expert_request.get("expert")
-                    question = expert_request.get("question")
-                    
-                    # JSON部分より前のテキストを取得
-                    json_start = facilitator_response.find("【専門家指名】")
-                    if json_start > 0:
-                        pre_text = facilitator_response[:json_start].strip()
-                        if pre_text:
-                            print(pre_text)
-                    
-                    # 自然な日本語で専門家への依頼を表示
-                    print(f"\nでは、{expert_name}さん、{question}")
-                else:
-                    # 専門家への依頼がない場合はそのまま表示
-                    print(facilitator_response)
-                
-                # 司会者の応答は Runner.run が自動的に保存するため、ここでは保存しない
-                # await save_message(session, "assistant", facilitator_response, "司会者")
-                
-                if expert_request:
-                    expert_name = expert_request.get("expert")
-                    question = expert_request.get("question")
-                    
-                    if expert_name in expert_dict:
-                        print(f"\n（{expert_name}に発言を依頼中...）\n")
-                        
-                        # 専門家が応答
-                        with logfire.span("expert-response") as span:
-                            span.set_attribute("langfuse.session.id", session_id)
-                            span.set_attribute("expert.name", expert_name)
-                            
-                            # 質問がある場合のみ実行
-                            if question:
-                                expert_result = await Runner.run(
-                                    expert_dict[expert_name],
-                                    question,
-                                    session=session  # type: ignore  # 会話履歴を含める
-                                )
-                                
-                                expert_response = expert_result.final_output
-                        
-                                # 専門家の発言を表示
-                                print(f"【{expert_name}】:")
-                                print(expert_response)
-                                # 専門家の応答も Runner.run が自動的に保存するため、ここでは保存しない
-                                # await save_message(session, "assistant", expert_response, expert_name)
+                # 司会者と専門家の発言はまとめて1回で保存（失敗したターンは保存しない）
+                async with session.turn():
+                    if STREAM_RESPONSES:
+                        await run_streamed_turn(
+                            facilitator, expert_dict, session, session_id, user_input, history_max_tokens, answer_cache,
+                            projection=projection
+                        )
+                    else:
+                        await run_turn(
+                            facilitator, expert_dict, session, session_id, user_input, history_max_tokens, answer_cache,
+                            projection
+                        )
                 
                 # TTLを延長
                 await session.extend_ttl()
@@ -271,8 +577,14 @@ async def main():
                 continue
                 
     finally:
-        # セッションを閉じる
+        # 実行中の要約を待ってからセッションを閉じる（接続はプールに返却）
+        if compactor:
+            await compactor.wait()
         await session.close()
+        if tiered_store:
+            # 未送信の書き込みをRedisに送ってから接続を閉じる
+            await tiered_store.close()
+        await session_manager.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,133 @@
+"""
+司会者の発言から専門家指名を逐次抽出するパーサー
+
+ストリーミングで届くテキストを少しずつ渡すと、【専門家指名】以降のJSONオブジェクトが
+閉じた時点で指名を返す。指名は単一のオブジェクト、オブジェクトの配列、
+{"experts": [...]} のいずれの形式でもよい。
+"""
+import json
+from typing import Any, Dict, List
+
+NOMINATION_MARKER = "【専門家指名】"
+
+
+class NominationStreamParser:
+    """【専門家指名】ブロックのJSONを逐次解析する"""
+
+    def __init__(self, marker: str = NOMINATION_MARKER):
+        self.marker = marker
+        self.nominations: List[Dict[str, Any]] = []
+        self.errors: List[str] = []
+        # マーカー探索中に保持するテキスト（マーカーが分割されて届く場合に備える）
+        self._window = ""
+        self._in_block = False
+        self._in_array = False
+        # 解析中のJSONオブジェクト
+        self._object: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """
+        テキストの断片を追加する
+
+        Returns:
+            この断片で確定した指名（指名順）
+        """
+        completed: List[Dict[str, Any]] = []
+        while text:
+            if not self._in_block:
+                text = self._search_marker(text)
+            else:
+                text = self._consume_block(text, completed)
+        return completed
+
+    def close(self) -> List[Dict[str, Any]]:
+        """ストリームの終了を通知する（未完了のJSONはエラーとして記録）"""
+        if self._depth > 0:
+            self.errors.append("専門家指名のJSONが閉じられていません")
+        self._reset_object()
+        self._in_block = False
+        self._in_array = False
+        self._window = ""
+        return []
+
+    def _search_marker(self, text: str) -> str:
+        window = self._window + text
+        position = window.find(self.marker)
+        if position == -1:
+            # 末尾はマーカーの一部かもしれないので残す
+            self._window = window[-(len(self.marker) - 1):]
+            return ""
+        self._window = ""
+        self._in_block = True
+        self._in_array = False
+        return window[position + len(self.marker):]
+
+    def _consume_block(self, text: str, completed: List[Dict[str, Any]]) -> str:
+        for position, char in enumerate(text):
+            if self._depth == 0:
+                if char == "{":
+                    self._object.append(char)
+                    self._depth = 1
+                elif char == "[" and not self._in_array:
+                    self._in_array = True
+                elif char == "]" and self._in_array:
+                    # 配列が閉じたらブロック終了（後続のマーカーを探す）
+                    self._in_block = False
+                    return text[position + 1:]
+                # それ以外（空白、カンマ、前置きの文章など）は読み飛ばす
+                continue
+
+            self._object.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete_object(completed)
+                    if not self._in_array:
+                        self._in_block = False
+                        return text[position + 1:]
+        return ""
+
+    def _complete_object(self, completed: List[Dict[str, Any]]) -> None:
+        raw = "".join(self._object)
+        self._reset_object()
+        try:
+            data = json.loads(raw)
+        except json.JSONDecodeError as e:
+            self.errors.append(f"{e}: {raw[:100]}")
+            return
+
+        candidates = data.get("experts", [data]) if isinstance(data, dict) else []
+        for nomination in candidates:
+            if isinstance(nomination, dict) and nomination.get("expert"):
+                self.nominations.append(nomination)
+                completed.append(nomination)
+
+    def _reset_object(self) -> None:
+        self._object = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+
+def parse_nominations(text: str) -> List[Dict[str, Any]]:
+    """完成したテキストからすべての専門家指名を抽出する"""
+    parser = NominationStreamParser()
+    parser.feed(text)
+    parser.close()
+    for error in parser.errors:
+        print(f"専門家指名の解析エラー: {error}")
+    return parser.nominations
@@ -1,146 +1,989 @@
 """
 Redis-based Session implementation for OpenAI Agents SDK
 """
-import json
+import contextlib
+import copy
 import os
-from typing import List, Dict, Any, Optional, TYPE_CHECKING
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple, Union, TYPE_CHECKING
 import redis.asyncio as redis
 from dotenv import load_dotenv
+from session_blobs import BlobOffload, blob_key_prefix, get_blob_offload, resolve_items
+from session_codec import ItemCodec, decode_item, get_codec
+from session_instrumentation import (
+    SessionInstrumentation, encode_items, get_instrumentation, record_pool_wait, traced
+)
+from session_ttl import DEFAULT_SESSION_TTL, EXTEND_MEMBERS_LUA, SESSION_TTL_LUA, TOUCH_SCRIPT, TTLPolicy, TTLRefresher
+from token_estimator import TokenCounter, estimate_item_tokens
 
 # TResponseInputItemは実行時には単なるdictなので、型エイリアスとして定義
 if TYPE_CHECKING:
     from agents.items import TResponseInputItem
+    from session_compaction import SessionCompactor
+    from tiered_session import TieredSession, TieredSessionStore
 else:
     TResponseInputItem = Dict[str, Any]
 
 load_dotenv()
 
+SESSION_KEY_PREFIX = "openai_agent_session:"
+# Auxiliary keys stored next to each session list, as "<session key>:<suffix>"
+SESSION_KEY_SUFFIXES = ("meta", "archive", "tokens", "blobs")
+
+
+def default_hash_tag() -> bool:
+    """Whether session keys use the cluster layout (REDIS_SESSION_HASH_TAG env var)"""
+    return os.getenv("REDIS_SESSION_HASH_TAG", "").lower() in ("1", "true")
+
+
+def session_keys(session_id: str, hash_tag: bool = False) -> List[str]:
+    """
+    Redis keys of a session: [list, meta, archive, tokens, blobs]
+    
+    Args:
+        session_id: Session identifier
+        hash_tag: Wrap the session id in {...} so Redis Cluster stores all
+            keys of the session in the same slot
+    """
+    key = f"{SESSION_KEY_PREFIX}{{{session_id}}}" if hash_tag else f"{SESSION_KEY_PREFIX}{session_id}"
+    return [key] + [f"{key}:{suffix}" for suffix in SESSION_KEY_SUFFIXES]
+
+
+def session_id_from_key(key: str, hash_tag: bool = False) -> str:
+    """Session id of a session list key (the inverse of session_keys()[0])"""
+    session_id = key[len(SESSION_KEY_PREFIX):]
+    if hash_tag and session_id.startswith("{") and session_id.endswith("}"):
+        session_id = session_id[1:-1]
+    return session_id
+
+
+# Every write bumps a per-session version counter in the meta hash. The epoch
+# changes whenever the list is modified other than by appending (trim, pop,
+# compaction), so readers holding a cached prefix know whether fetching the
+# tail is enough. A fresh epoch is seeded from the server clock when the meta
+# hash is created. The meta hash also tracks the stored byte size and whether
+# the list starts with a compaction summary.
+#
+# A parallel list holds an estimated token count per item, optionally
+# followed by "|<author>" for the agent (or user) that produced the item. It
+# is aligned with the item list by its tail, so items stored before token
+# counts existed simply have no entry.
+_INIT_EPOCH = """
+if redis.call('HEXISTS', KEYS[2], 'epoch') == 0 then
+    local now = redis.call('TIME')
+    redis.call('HSET', KEYS[2], 'epoch', now[1] .. string.format('%06d', tonumber(now[2])))
+end
+"""
+
+# RPUSH + optional LTRIM + EXPIRE in a single atomic server-side call
+# KEYS[1]: session list, KEYS[2]: session meta, KEYS[3]: token counts,
+# KEYS[4]: blob digests, KEYS[5..4+m]: blobs referenced by the new items
+# ARGV[1]: TTL in seconds, ARGV[2]: max lifetime in seconds (0 = none),
+# ARGV[3]: max items (0 = unlimited), ARGV[4]: item count n,
+# ARGV[5]: blob key prefix, ARGV[6..5+n]: items,
+# ARGV[6+n..5+2n]: token counts, ARGV[6+2n..5+2n+m]: blob values
+# Returns: {length, version, epoch, bytes}
+_ADD_ITEMS_SCRIPT = SESSION_TTL_LUA + EXTEND_MEMBERS_LUA + _INIT_EPOCH + """
+local count = tonumber(ARGV[4])
+local last_item = 5 + count
+local last_token = last_item + count
+local length = 0
+local added_bytes = 0
+for i = 6, last_item, 1000 do
+    length = redis.call('RPUSH', KEYS[1], unpack(ARGV, i, math.min(i + 999, last_item)))
+end
+for i = last_item + 1, last_token, 1000 do
+    redis.call('RPUSH', KEYS[3], unpack(ARGV, i, math.min(i + 999, last_token)))
+end
+for i = 6, last_item do
+    added_bytes = added_bytes + string.len(ARGV[i])
+end
+local max_items = tonumber(ARGV[3])
+if max_items > 0 and length > max_items then
+    for _, item in ipairs(redis.call('LRANGE', KEYS[1], 0, length - max_items - 1)) do
+        added_bytes = added_bytes - string.len(item)
+    end
+    redis.call('LTRIM', KEYS[1], -max_items, -1)
+    redis.call('LTRIM', KEYS[3], -max_items, -1)
+    redis.call('HINCRBY', KEYS[2], 'epoch', 1)
+    redis.call('HDEL', KEYS[2], 'summary')
+    length = max_items
+end
+local total_bytes = redis.call('HINCRBY', KEYS[2], 'bytes', added_bytes)
+local version = redis.call('HINCRBY', KEYS[2], 'version', 1)
+-- Content-addressed: a blob that already exists holds the same value
+local prefix = ARGV[5]
+for j = 5, #KEYS do
+    redis.call('SET', KEYS[j], ARGV[last_token + j - 4], 'NX')
+    redis.call('SADD', KEYS[4], string.sub(KEYS[j], string.len(prefix) + 1))
+end
+local ttl = session_ttl(KEYS[2], tonumber(ARGV[1]), tonumber(ARGV[2]))
+redis.call('EXPIRE', KEYS[1], ttl)
+redis.call('EXPIRE', KEYS[2], ttl)
+redis.call('EXPIRE', KEYS[3], ttl)
+if redis.call('EXPIRE', KEYS[4], ttl) == 1 then
+    -- Blobs live at least as long as every session that uses them
+    extend_members(KEYS[4], prefix, ttl)
+end
+return {length, version, redis.call('HGET', KEYS[2], 'epoch'), total_bytes}
+"""
+
+# RPOP that also advances version and epoch
+# KEYS[1]: session list, KEYS[2]: session meta, KEYS[3]: token counts
+_POP_ITEM_SCRIPT = """
+local item = redis.call('RPOP', KEYS[1])
+if item then
+    redis.call('RPOP', KEYS[3])
+    local ttl = redis.call('PTTL', KEYS[1])
+    if ttl > 0 then
+        redis.call('HINCRBY', KEYS[2], 'version', 1)
+        redis.call('HINCRBY', KEYS[2], 'epoch', 1)
+        redis.call('HINCRBY', KEYS[2], 'bytes', -string.len(item))
+        redis.call('PEXPIRE', KEYS[2], ttl)
+    else
+        redis.call('DEL', KEYS[2], KEYS[3])
+    end
+end
+return item
+"""
+
+# Read for the local cache: returns only what changed since the cached state
+# KEYS[1]: session list, KEYS[2]: session meta
+# ARGV[1]: cached version, ARGV[2]: cached epoch, ARGV[3]: cached item count
+# Returns: {version, epoch, summary, offset, items...} where offset is -1 when
+# nothing changed, the cached item count when only the tail is returned, or 0
+# for a full reload
+_READ_ITEMS_SCRIPT = """
+local meta = redis.call('HMGET', KEYS[2], 'version', 'epoch', 'summary')
+local version = meta[1] or '0'
+local epoch = meta[2] or '0'
+local summary = meta[3] or '0'
+if version == ARGV[1] and epoch == ARGV[2] then
+    return {version, epoch, summary, -1}
+end
+local start = 0
+if epoch == ARGV[2] and redis.call('LLEN', KEYS[1]) >= tonumber(ARGV[3]) then
+    start = tonumber(ARGV[3])
+end
+local result = {version, epoch, summary, start}
+local items = redis.call('LRANGE', KEYS[1], start, -1)
+for i = 1, #items do
+    result[i + 4] = items[i]
+end
+return result
+"""
+
+# Replace the oldest items with a summary and move them to the archive list.
+# Aborts if the list changed other than by appends since the snapshot.
+# KEYS[1]: session list, KEYS[2]: session meta, KEYS[3]: archive list,
+# KEYS[4]: token counts
+# ARGV[1]: snapshot epoch, ARGV[2]: number of items to replace,
+# ARGV[3]: summary item, ARGV[4]: summary tokens
+# Returns: 1 if replaced, 0 if the snapshot is stale
+_COMPACT_SCRIPT = """
+if redis.call('HGET', KEYS[2], 'epoch') ~= ARGV[1] then
+    return 0
+end
+local count = tonumber(ARGV[2])
+local length = redis.call('LLEN', KEYS[1])
+if length < count then
+    return 0
+end
+-- Items without a token count sit at the head of the list
+local uncounted = length - redis.call('LLEN', KEYS[4])
+local first = 1
+if redis.call('HGET', KEYS[2], 'summary') == '1' then
+    -- The previous summary is folded into the new one, not archived
+    first = 2
+end
+local removed_bytes = 0
+local archived = {}
+for i, item in ipairs(redis.call('LRANGE', KEYS[1], 0, count - 1)) do
+    removed_bytes = removed_bytes + string.len(item)
+    if i >= first then
+        archived[#archived + 1] = item
+    end
+end
+for i = 1, #archived, 1000 do
+    redis.call('RPUSH', KEYS[3], unpack(archived, i, math.min(i + 999, #archived)))
+end
+redis.call('LTRIM', KEYS[1], count, -1)
+redis.call('LPUSH', KEYS[1], ARGV[3])
+if uncounted <= count then
+    redis.call('LTRIM', KEYS[4], count - uncounted, -1)
+    redis.call('LPUSH', KEYS[4], ARGV[4])
+end
+redis.call('HSET', KEYS[2], 'summary', '1')
+redis.call('HINCRBY', KEYS[2], 'bytes', string.len(ARGV[3]) - removed_bytes)
+redis.call('HINCRBY', KEYS[2], 'epoch', 1)
+redis.call('HINCRBY', KEYS[2], 'version', 1)
+-- The archive expires together with the session
+local ttl = redis.call('PTTL', KEYS[1])
+if #archived > 0 and ttl > 0 then
+    redis.call('PEXPIRE', KEYS[3], ttl)
+end
+return 1
+"""
+
+# Longest recent suffix whose token counts fit the budget. Items without a
+# stored count are estimated from their stored size.
+# KEYS[1]: session list, KEYS[2]: session meta, KEYS[3]: token counts
+# ARGV[1]: token budget
+# Returns: {start index, summary flag, items...}
+_READ_TOKEN_BUDGET_SCRIPT = """
+local budget = tonumber(ARGV[1])
+local length = redis.call('LLEN', KEYS[1])
+local counts = redis.call('LRANGE', KEYS[3], 0, -1)
+local uncounted = length - #counts
+local total = 0
+local start = length
+while start > 0 do
+    local cost
+    if start > uncounted then
+        cost = tonumber(string.match(counts[start - uncounted], '^%d+'))
+    else
+        cost = math.floor(string.len(redis.call('LINDEX', KEYS[1], start - 1)) / 3)
+    end
+    if total + cost > budget then
+        break
+    end
+    total = total + cost
+    start = start - 1
+end
+local result = {start, redis.call('HGET', KEYS[2], 'summary') or '0'}
+for i, item in ipairs(redis.call('LRANGE', KEYS[1], start, -1)) do
+    result[i + 2] = item
+end
+return result
+"""
+
+_SCRIPTS = {
+    "add": _ADD_ITEMS_SCRIPT,
+    "pop": _POP_ITEM_SCRIPT,
+    "read": _READ_ITEMS_SCRIPT,
+    "compact": _COMPACT_SCRIPT,
+    "read_budget": _READ_TOKEN_BUDGET_SCRIPT,
+    "touch": TOUCH_SCRIPT,
+}
+
+
+class _CachedItems:
+    """Parsed items of one session together with the version they reflect"""
+    
+    __slots__ = ("version", "epoch", "summary", "items", "size", "tokens")
+    
+    def __init__(
+        self,
+        version: int,
+        epoch: bytes,
+        summary: bool,
+        items: List[TResponseInputItem],
+        size: int,
+        tokens: Optional[List[int]] = None
+    ):
+        self.version = version
+        self.epoch = epoch
+        self.summary = summary
+        self.items = items
+        self.size = size
+        # Token counts of a prefix of items, filled in lazily
+        self.tokens = tokens if tokens is not None else []
+
+
+class SessionItemCache:
+    """
+    In-process LRU of parsed session items, bounded by serialized size
+    
+    Cached items are shared by every reader of a session. Reads hand out
+    shallow copies of them, so callers may change an item's fields, but
+    nested values (content parts, arguments) must be treated as read-only.
+    """
+    
+    def __init__(self, max_bytes: Optional[int] = None):
+        """
+        Initialize item cache
+        
+        Args:
+            max_bytes: Upper bound for the total serialized size of cached
+                items (defaults to REDIS_SESSION_CACHE_BYTES env var, 64MB)
+        """
+        self.max_bytes = max_bytes or int(os.getenv("REDIS_SESSION_CACHE_BYTES", str(64 * 1024 * 1024)))
+        self._entries: "OrderedDict[str, _CachedItems]" = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key: str) -> Optional[_CachedItems]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+    
+    def put(self, key: str, entry: _CachedItems) -> None:
+        self.invalidate(key)
+        if entry.size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self.current_bytes += entry.size
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= evicted.size
+            self.evictions += 1
+    
+    def invalidate(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry.size
+    
+    def stats(self) -> Dict[str, int]:
+        """Get cache utilization and hit counters"""
+        return {
+            "sessions": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "partial_hits": self.partial_hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+class _TurnBuffer:
+    """Items added during an open turn, shared by a session and its views"""
+    
+    __slots__ = ("items", "authors")
+    
+    def __init__(self):
+        self.items: Optional[List[TResponseInputItem]] = None
+        self.authors: List[Optional[str]] = []
+    
+    def open(self) -> None:
+        self.items, self.authors = [], []
+    
+    def close(self) -> None:
+        self.items, self.authors = None, []
+    
+    def add(self, items: List[TResponseInputItem], authors: Optional[List[Optional[str]]]) -> None:
+        self.items.extend(items)
+        self.authors.extend(authors or [None] * len(items))
+    
+    def pop(self) -> TResponseInputItem:
+        self.authors.pop()
+        return self.items.pop()
+
+
+def _token_entry(tokens: int, author: Optional[str]) -> str:
+    return f"{tokens}|{author}" if author else str(tokens)
+
+
+def _author_of(entry: bytes) -> Optional[str]:
+    """Author recorded in a token count entry (None for entries without one)"""
+    _, separator, author = entry.decode("utf-8").partition("|")
+    return author if separator else None
+
+
+def _window(
+    items: List[TResponseInputItem],
+    tokens: List[int],
+    limit: Optional[int],
+    max_tokens: Optional[int]
+) -> int:
+    """Start of the recent suffix of items within limit / max_tokens"""
+    if max_tokens is not None:
+        total = 0
+        start = len(items)
+        while start > 0 and total + tokens[start - 1] <= max_tokens:
+            total += tokens[start - 1]
+            start -= 1
+        return start
+    if limit is not None:
+        return max(len(items) - limit, 0)
+    return 0
+
 
 class RedisSession:
     """Redis-backed session storage for OpenAI Agents"""
     
-    def __init__(self, session_id: str, redis_url: Optional[str] = None):
+    def __init__(
+        self,
+        session_id: str,
+        redis_url: Optional[str] = None,
+        ttl_seconds: Optional[int] = None,
+        max_items: Optional[int] = None,
+        client: Optional[redis.Redis] = None,
+        cache: Optional[SessionItemCache] = None,
+        codec: Optional[ItemCodec] = None,
+        compactor: Optional["SessionCompactor"] = None,
+        token_counter: Optional[TokenCounter] = None,
+        history_token_budget: Optional[int] = None,
+        ttl_policy: Optional[TTLPolicy] = None,
+        ttl_refresher: Optional[TTLRefresher] = None,
+        instrumentation: Optional[SessionInstrumentation] = None,
+        hash_tag: Optional[bool] = None,
+        blobs: Optional[BlobOffload] = None
+    ):
         """
         Initialize Redis session
         
         Args:
             session_id: Unique identifier for the session
             redis_url: Redis connection URL (defaults to REDIS_URL env var)
+            ttl_seconds: Session TTL (defaults to REDIS_SESSION_TTL env var, 7 days);
+                ignored when ttl_policy is given
+            max_items: Keep only the most recent N items (defaults to
+                REDIS_SESSION_MAX_ITEMS env var, 0 or unset for unlimited)
+            client: Shared Redis client (e.g. from RedisSessionManager). When
+                given, close() leaves its connection pool untouched.
+            cache: Local cache of parsed items, kept in sync with Redis via
+                the session's version counter (None to always read Redis)
+            codec: Item serialization (defaults to get_codec(), configured by
+                REDIS_SESSION_CODEC / REDIS_SESSION_COMPRESS_THRESHOLD)
+            compactor: Summarizes old history in the background once the
+                session grows past its thresholds (None to disable)
+            token_counter: Per-item token estimator stored alongside each item
+                (defaults to estimate_item_tokens)
+            history_token_budget: Default max_tokens for get_items() calls
+                without limit, e.g. from Runner.run (None for no budget)
+            ttl_policy: Expiry mode and touch coalescing, shared between the
+                sessions of a manager (defaults to a sliding TTLPolicy)
+            ttl_refresher: Batches extend_ttl() touches in the background
+                (None to send each due touch immediately)
+            instrumentation: Samples operations into logfire spans and
+                histograms (defaults to get_instrumentation(), None unless
+                REDIS_SESSION_TRACE_SAMPLE_RATE is set)
+            hash_tag: Use the cluster key layout, openai_agent_session:{id}
+                (defaults to REDIS_SESSION_HASH_TAG env var, off)
+            blobs: Store large strings of items in shared content-addressed
+                keys (defaults to get_blob_offload(), None unless
+                REDIS_SESSION_BLOB_THRESHOLD is set). Items stored that way
+                are read back regardless of this setting.
         """
         self.session_id = session_id
         self.redis_url = redis_url or os.getenv("REDIS_URL", "redis://localhost:6379")
-        self._client: Optional[redis.Redis] = None
-        self._key = f"openai_agent_session:{session_id}"
-        
+        self.ttl_policy = ttl_policy or TTLPolicy(ttl_seconds=ttl_seconds)
+        self._ttl_refresher = ttl_refresher
+        self.max_items = max_items if max_items is not None else int(os.getenv("REDIS_SESSION_MAX_ITEMS", "0"))
+        self._client: Optional[redis.Redis] = client
+        self._owns_client = client is None
+        # Views borrow the client of the session they were made from
+        self._client_source: Optional["RedisSession"] = None
+        self._cache = cache
+        self.codec = codec or get_codec()
+        self._compactor = compactor
+        self.token_counter = token_counter or estimate_item_tokens
+        self.history_token_budget = history_token_budget
+        self.instrumentation = instrumentation or get_instrumentation()
+        self.summary_present = False
+        self._scripts: Optional[Dict[str, Any]] = None
+        self.hash_tag = hash_tag if hash_tag is not None else default_hash_tag()
+        self._key, self._meta_key, self._archive_key, self._tokens_key, self._blobs_key = session_keys(
+            session_id, self.hash_tag
+        )
+        self.blobs = blobs or get_blob_offload()
+        self._blob_prefix = blob_key_prefix(session_id, self.hash_tag)
+        self._turn = _TurnBuffer()
+    
+    @property
+    def ttl_seconds(self) -> int:
+        return self.ttl_policy.ttl_seconds
+    
     async def _get_client(self) -> redis.Redis:
         """Get or create Redis client"""
-        if self._client is None:
+        if self._client is None and self._client_source is not None:
+            # The session the view was made from creates and closes the client
+            self._client = await self._client_source._get_client()
+        elif self._client is None:
             self._client = await redis.from_url(
                 self.redis_url,
-                decode_responses=True,
+                decode_responses=False,
                 socket_connect_timeout=5,
                 socket_timeout=5
             )
+        if self._scripts is None:
+            self._scripts = {
+                name: self._client.register_script(source)
+                for name, source in _SCRIPTS.items()
+            }
         return self._client
     
-    async def get_items(self, limit: Optional[int] = None) -> List[TResponseInputItem]:
+    @traced("get_items")
+    async def get_items(
+        self,
+        limit: Optional[int] = None,
+        max_tokens: Optional[int] = None
+    ) -> List[TResponseInputItem]:
         """
         Retrieve conversation items from Redis
         
+        Also updates summary_present: whether the returned items start with
+        a compaction summary. Inside a turn, the items added so far in the
+        turn are included.
+        
         Args:
             limit: Maximum number of items to retrieve (None for all)
+            max_tokens: Return the longest recent suffix whose estimated token
+                count fits this budget (defaults to history_token_budget when
+                limit is None)
             
         Returns:
             List of conversation items
         """
+        if max_tokens is None and limit is None:
+            max_tokens = self.history_token_budget
+        if self._turn.items is not None:
+            return await self._read_items_in_turn(limit, max_tokens)
+        return await self._read_items(limit, max_tokens)
+    
+    async def _read_items(self, limit: Optional[int], max_tokens: Optional[int]) -> List[TResponseInputItem]:
         client = await self._get_client()
         
-        # Get all items from the list
-        if limit is None:
-            items = await client.lrange(self._key, 0, -1)
+        if self._cache is not None:
+            entry = await self._read_through_cache()
+            if max_tokens is not None:
+                start = self._token_budget_start(entry, max_tokens)
+            else:
+                start = 0 if limit is None else max(len(entry.items) - limit, 0)
+            items = entry.items[start:]
+            if max_tokens is not None:
+                items = _drop_orphaned_outputs(items)
+            self.summary_present = entry.summary and len(items) == len(entry.items)
+            return _copy_items(items)
+        
+        if max_tokens is not None:
+            # The cut point is computed server-side so only the suffix is sent
+            result = await self._scripts["read_budget"](
+                keys=[self._key, self._meta_key, self._tokens_key],
+                args=[max_tokens]
+            )
+            items = await self._decode(result[2:])
+            self.summary_present = int(result[0]) == 0 and result[1] == b"1"
+            return _drop_orphaned_outputs(items)
+        
+        async with client.pipeline(transaction=True) as pipe:
+            # Get all items from the list
+            if limit is None:
+                pipe.lrange(self._key, 0, -1)
+            else:
+                # Get the most recent 'limit' items
+                pipe.lrange(self._key, -limit, -1)
+            pipe.llen(self._key)
+            pipe.hget(self._meta_key, "summary")
+            items, length, summary = await pipe.execute()
+        
+        self.summary_present = summary == b"1" and len(items) == length
+        
+        # Decode stored entries back to dictionaries
+        return await self._decode(items)
+    
+    async def _decode(self, raw_items: List[bytes]) -> List[TResponseInputItem]:
+        """Decode stored entries, fetching offloaded strings in one MGET"""
+        return await resolve_items(self._client, self._blob_prefix, raw_items)
+    
+    async def _read_items_in_turn(self, limit: Optional[int], max_tokens: Optional[int]) -> List[TResponseInputItem]:
+        """Stored items followed by the turn's buffered items, windowed as a whole"""
+        buffered = self._turn.items
+        tokens = [self.token_counter(item) for item in buffered] if max_tokens is not None else []
+        start = _window(buffered, tokens, limit, max_tokens)
+        if start > 0 or (limit is not None and limit <= len(buffered)):
+            # The window ends inside the turn, nothing stored is needed
+            self.summary_present = False
+            items = buffered[start:]
+            return _drop_orphaned_outputs(items) if max_tokens is not None else list(items)
+        
+        if max_tokens is not None:
+            stored = await self._read_items(None, max_tokens - sum(tokens))
+            return _drop_orphaned_outputs(stored + buffered)
+        stored = await self._read_items(None if limit is None else limit - len(buffered), None)
+        return stored + buffered
+    
+    def _token_budget_start(self, entry: _CachedItems, max_tokens: int) -> int:
+        """Index where the longest cached suffix within max_tokens starts"""
+        for item in entry.items[len(entry.tokens):]:
+            entry.tokens.append(self.token_counter(item))
+        return _window(entry.items, entry.tokens, None, max_tokens)
+    
+    def with_token_budget(self, max_tokens: Optional[int]) -> "RedisSession":
+        """
+        Get a view of this session whose get_items() defaults to a token budget
+        
+        The view shares the connection and cache, and writes go to the same
+        session, so it can be passed straight to Runner.run(session=...).
+        If this session has not connected yet, the view connects through it,
+        so closing this session also releases the view's client.
+        
+        summary_present is per view: it describes the view's own last read.
+        """
+        view = copy.copy(self)
+        view._owns_client = False
+        view._client_source = self
+        view.history_token_budget = max_tokens
+        return view
+    
+    async def _read_through_cache(self) -> _CachedItems:
+        """Refresh the cached items with whatever changed since the last read"""
+        entry = self._cache.get(self._key)
+        if entry is None:
+            args = ["", "", 0]
+        else:
+            args = [entry.version, entry.epoch, len(entry.items)]
+        
+        result = await self._scripts["read"](keys=[self._key, self._meta_key], args=args)
+        version, epoch, summary, offset = int(result[0]), result[1], result[2] == b"1", int(result[3])
+        
+        if offset < 0:
+            self._cache.hits += 1
+            return entry
+        
+        raw_items = result[4:]
+        parsed = await self._decode(raw_items)
+        size = sum(len(item) for item in raw_items)
+        if offset > 0:
+            self._cache.partial_hits += 1
+            parsed = entry.items + parsed
+            size += entry.size
+            tokens = entry.tokens
         else:
-            # Get the most recent 'limit' items
-            items = await client.lrange(self._key, -limit, -1)
+            self._cache.misses += 1
+            tokens = None
         
-        # Parse JSON strings back to dictionaries
-        return [json.loads(item) for item in items]
+        entry = _CachedItems(version, epoch, summary, parsed, size, tokens)
+        self._cache.put(self._key, entry)
+        return entry
     
-    async def add_items(self, items: List[TResponseInputItem]) -> None:
+    @traced("add_items")
+    async def add_items(
+        self,
+        items: List[TResponseInputItem],
+        authors: Optional[List[Optional[str]]] = None
+    ) -> None:
         """
         Add conversation items to Redis
         
+        Inside a turn, the items are only buffered until commit_turn().
+        
         Args:
             items: List of conversation items to add
+            authors: Agent (or user) that produced each item, recorded for
+                per-agent views (see session_views.py)
         """
         if not items:
             return
+        if self._turn.items is not None:
+            self._turn.add(items, authors)
+            return
             
+        await self._get_client()
+        
+        # Serialize items with the configured codec
+        if self.blobs is not None:
+            encoded_items, blobs = self.blobs.encode(self.codec, items)
+        else:
+            encoded_items, blobs = encode_items(self.codec, items), {}
+        token_counts = [self.token_counter(item) for item in items]
+        token_entries = [
+            _token_entry(tokens, author)
+            for tokens, author in zip(token_counts, authors or [None] * len(items))
+        ]
+        
+        # Append, trim and refresh the TTL in one round trip so the key never
+        # exists without an expiration
+        length, version, epoch, total_bytes = await self._scripts["add"](
+            keys=[
+                self._key, self._meta_key, self._tokens_key, self._blobs_key,
+                *(self._blob_prefix + digest for digest in blobs)
+            ],
+            args=[
+                *self.ttl_policy.script_args(), self.max_items,
+                len(encoded_items), self._blob_prefix, *encoded_items, *token_entries, *blobs.values()
+            ]
+        )
+        self.ttl_policy.mark_touched(self._key)
+        
+        if self._cache is not None:
+            # Extend the cached copy in place when nobody else wrote in between
+            entry = self._cache.get(self._key)
+            if (
+                entry is not None
+                and entry.epoch == epoch
+                and entry.version + 1 == version
+                and len(entry.items) + len(encoded_items) == length
+            ):
+                self._cache.put(self._key, _CachedItems(
+                    version,
+                    epoch,
+                    entry.summary,
+                    entry.items + (
+                        [decode_item(item) for item in encoded_items] if not blobs else copy.deepcopy(items)
+                    ),
+                    entry.size + sum(len(item) for item in encoded_items),
+                    entry.tokens + token_counts if len(entry.tokens) == len(entry.items) else entry.tokens
+                ))
+        
+        if self._compactor is not None:
+            self._compactor.maybe_schedule(self, length, total_bytes)
+    
+    @traced("get_compaction_snapshot")
+    async def get_compaction_snapshot(self) -> Tuple[bytes, List[TResponseInputItem], bool]:
+        """
+        Read the full list together with the epoch it belongs to
+        
+        Returns:
+            (epoch, items, summary_present) for replace_prefix_with_summary
+        """
         client = await self._get_client()
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.hmget(self._meta_key, "epoch", "summary")
+            pipe.lrange(self._key, 0, -1)
+            (epoch, summary), items = await pipe.execute()
+        return epoch or b"0", await self._decode(items), summary == b"1"
+    
+    @traced("get_authored_items")
+    async def get_authored_items(self) -> Tuple[List[TResponseInputItem], List[Optional[str]]]:
+        """
+        Read the full list together with the author of each item
+        
+        Also updates summary_present. Inside a turn, the buffered items are
+        included.
         
-        # Convert items to JSON strings
-        json_items = [json.dumps(item, ensure_ascii=False) for item in items]
+        Cost: with the local cache, only the changed items and the token
+        entries are read; without it, the whole list and the whole token list
+        are transferred and decoded on every call.
         
-        # Add all items to the end of the list
-        await client.rpush(self._key, *json_items)
+        Returns:
+            (items, authors), where the author is None for items stored
+            without one
+        """
+        client = await self._get_client()
+        items: Optional[List[TResponseInputItem]] = None
+        if self._cache is not None:
+            entry = await self._read_through_cache()
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.hget(self._meta_key, "version")
+                pipe.lrange(self._tokens_key, -len(entry.items), -1)
+                version, entries = await pipe.execute()
+            # A write in between shifts the entries; read both lists together then
+            if int(version or 0) == entry.version:
+                items, summary = _copy_items(entry.items), entry.summary
         
-        # Set expiration (7 days by default)
-        ttl_seconds = int(os.getenv("REDIS_SESSION_TTL", "604800"))  # 7 days
-        await client.expire(self._key, ttl_seconds)
+        if items is None:
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.lrange(self._key, 0, -1)
+                pipe.lrange(self._tokens_key, 0, -1)
+                pipe.hget(self._meta_key, "summary")
+                raw_items, entries, summary = await pipe.execute()
+            items = await self._decode(raw_items)
+            summary = summary == b"1"
+        
+        # Token entries are aligned with the items by their tail
+        entries = entries[max(len(entries) - len(items), 0):]
+        authors = [None] * (len(items) - len(entries)) + [_author_of(entry) for entry in entries]
+        self.summary_present = summary
+        if self._turn.items is not None:
+            items += self._turn.items
+            authors += self._turn.authors
+        return items, authors
+    
+    @traced("replace_prefix_with_summary")
+    async def replace_prefix_with_summary(
+        self,
+        epoch: bytes,
+        count: int,
+        summary_item: TResponseInputItem
+    ) -> bool:
+        """
+        Atomically replace the oldest items with a summary item
+        
+        The replaced items (except a previous summary) are appended to the
+        archive list. Items appended after the snapshot are kept.
+        
+        Args:
+            epoch: Epoch from get_compaction_snapshot
+            count: Number of leading items to replace
+            summary_item: Item stored in their place
+            
+        Returns:
+            False if the session changed other than by appends since the snapshot
+        """
+        await self._get_client()
+        replaced = await self._scripts["compact"](
+            keys=[self._key, self._meta_key, self._archive_key, self._tokens_key],
+            args=[
+                epoch,
+                count,
+                self.codec.encode(summary_item),
+                self.token_counter(summary_item)
+            ]
+        )
+        if self._cache is not None:
+            self._cache.invalidate(self._key)
+        return bool(replaced)
+    
+    @traced("get_archived_items")
+    async def get_archived_items(self) -> List[TResponseInputItem]:
+        """Retrieve items moved out of the live history by compaction"""
+        client = await self._get_client()
+        return await self._decode(await client.lrange(self._archive_key, 0, -1))
     
+    @traced("pop_item")
     async def pop_item(self) -> Optional[TResponseInputItem]:
         """
         Remove and return the most recent conversation item
         
+        Inside a turn, items added in the turn are popped from the buffer
+        first; popping further reaches Redis immediately.
+        
         Returns:
             The most recent item or None if empty
         """
-        client = await self._get_client()
+        if self._turn.items:
+            return self._turn.pop()
+        
+        await self._get_client()
         
         # Pop from the right (most recent)
-        item = await client.rpop(self._key)
+        item = await self._scripts["pop"](keys=[self._key, self._meta_key, self._tokens_key])
+        if self._cache is not None:
+            self._cache.invalidate(self._key)
         
         if item:
-            return json.loads(item)
+            return (await self._decode([item]))[0]
         return None
     
+    @traced("clear_session")
     async def clear_session(self) -> None:
-        """Remove all items from the session"""
+        """Remove all items from the session, including those buffered in an open turn"""
+        if self._turn.items is not None:
+            self._turn.open()
         client = await self._get_client()
-        await client.delete(self._key)
+        # Blobs are shared with other sessions and expire on their own
+        await client.delete(*session_keys(self.session_id, self.hash_tag))
+        if self._cache is not None:
+            self._cache.invalidate(self._key)
+    
+    # Turns
+    
+    @property
+    def in_turn(self) -> bool:
+        return self._turn.items is not None
+    
+    def begin_turn(self) -> None:
+        """
+        Buffer add_items() calls until commit_turn()
+        
+        Runner.run and the conference flow add items several times per turn;
+        buffering them turns those calls into a single write. Reads see the
+        buffered items. Views from with_token_budget() share the turn.
+        """
+        if self._turn.items is not None:
+            raise RuntimeError(f"Session {self.session_id} already has an open turn")
+        self._turn.open()
+    
+    async def commit_turn(self) -> None:
+        """
+        Write the items buffered in the turn in one atomic call
+        
+        If the write fails, the turn stays open with its items, so it can be
+        committed again or rolled back; Redis is left unchanged.
+        """
+        items, authors = self._turn.items, self._turn.authors
+        if items is None:
+            raise RuntimeError(f"Session {self.session_id} has no open turn")
+        self._turn.close()
+        try:
+            await self.add_items(items, authors)
+        except BaseException:
+            self._turn.items, self._turn.authors = items, authors
+            raise
+    
+    def rollback_turn(self) -> None:
+        """Discard the items buffered in the turn"""
+        self._turn.close()
+    
+    @contextlib.asynccontextmanager
+    async def turn(self) -> AsyncIterator["RedisSession"]:
+        """
+        Buffer the writes of a turn, committing them if the block succeeds
+        
+        Usage:
+            async with session.turn():
+                await Runner.run(agent, user_input, session=session)
+        """
+        self.begin_turn()
+        try:
+            yield self
+            await self.commit_turn()
+        finally:
+            # Nothing partial is written if the turn or its commit failed
+            self.rollback_turn()
     
     async def close(self) -> None:
-        """Close Redis connection"""
-        if self._client:
+        """
+        Close Redis connection
+        
+        Shared clients are only released: the session keeps its reference to
+        the manager's client, so a late call (e.g. from a background task)
+        still goes through the pool instead of opening a private connection.
+        """
+        if self._client and self._owns_client:
             await self._client.close()
             self._client = None
+            self._scripts = None
     
+    @traced("exists")
     async def exists(self) -> bool:
         """Check if session exists in Redis"""
         client = await self._get_client()
         return await client.exists(self._key) > 0
     
+    @traced("get_session_info")
     async def get_session_info(self) -> Dict[str, Any]:
         """Get session metadata"""
         client = await self._get_client()
         
-        # Get session length and TTL
-        length = await client.llen(self._key)
-        ttl = await client.ttl(self._key)
+        # Get session length, TTL and compaction state in one round trip
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.llen(self._key)
+            pipe.ttl(self._key)
+            pipe.hget(self._meta_key, "summary")
+            pipe.llen(self._archive_key)
+            length, ttl, summary, archived = await pipe.execute()
         
         return {
             "session_id": self.session_id,
             "item_count": length,
             "ttl_seconds": ttl if ttl > 0 else None,
-            "exists": length > 0
+            "exists": length > 0,
+            "summary_present": summary == b"1",
+            "archived_count": archived
         }
     
+    @traced("extend_ttl")
     async def extend_ttl(self, seconds: Optional[int] = None) -> None:
-        """Extend session TTL"""
-        client = await self._get_client()
+        """
+        Extend session TTL according to the TTL policy
         
-        if await self.exists():
-            ttl_seconds = seconds or int(os.getenv("REDIS_SESSION_TTL", "604800"))
-            await client.expire(self._key, ttl_seconds)
+        Touches within the policy's touch_interval of the last write or touch
+        are skipped, and a configured TTLRefresher batches the rest. Passing
+        seconds overrides the TTL and always reaches Redis immediately.
+        
+        Args:
+            seconds: TTL to apply instead of the policy's
+        """
+        if seconds is None and not self.ttl_policy.touch_due(self._key):
+            return
+        self.ttl_policy.mark_touched(self._key)
+        
+        client = await self._get_client()
+        keys = session_keys(self.session_id, self.hash_tag)
+        args = [*self.ttl_policy.script_args(seconds), self._blob_prefix]
+        if seconds is None and self._ttl_refresher is not None:
+            self._ttl_refresher.schedule(client, keys, args)
+        else:
+            # EXISTS and EXPIRE of all keys in one call
+            await self._scripts["touch"](keys=keys, args=args)
     
     # Context manager support
     async def __aenter__(self):
@@ -150,12 +993,189 @@ class RedisSession:
         await self.close()
 
 
+def _copy_items(items: List[TResponseInputItem]) -> List[TResponseInputItem]:
+    """Shallow copies of cached items, so callers cannot change the cache"""
+    return [dict(item) for item in items]
+
+
+def _drop_orphaned_outputs(items: List[TResponseInputItem]) -> List[TResponseInputItem]:
+    """Drop leading tool outputs whose call was cut off by a budget"""
+    start = 0
+    while start < len(items) and str(items[start].get("type", "")).endswith("_output"):
+        start += 1
+    return items[start:] if start else items
+
+
+class _TrackedBlockingConnectionPool(redis.BlockingConnectionPool):
+    """BlockingConnectionPool that counts acquisitions that had to wait"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.acquire_count = 0
+        self.wait_count = 0
+        self.wait_seconds_total = 0.0
+    
+    async def get_connection(self, *args, **kwargs):
+        must_wait = (
+            not self._available_connections
+            and len(self._in_use_connections) >= self.max_connections
+        )
+        start = time.perf_counter()
+        connection = await super().get_connection(*args, **kwargs)
+        waited = time.perf_counter() - start
+        self.acquire_count += 1
+        if must_wait:
+            self.wait_count += 1
+            self.wait_seconds_total += waited
+        record_pool_wait(waited)
+        return connection
+
+
+class RedisSessionManager:
+    """Process-wide session factory sharing one bounded connection pool per Redis URL"""
+    
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        pool_timeout: Optional[float] = None,
+        cache: Optional[SessionItemCache] = None,
+        ttl_policy: Optional[TTLPolicy] = None,
+        ttl_refresher: Optional[TTLRefresher] = None,
+        instrumentation: Optional[SessionInstrumentation] = None,
+        cluster: Optional[bool] = None
+    ):
+        """
+        Initialize session manager
+        
+        Args:
+            max_connections: Maximum connections per Redis URL
+                (defaults to REDIS_MAX_CONNECTIONS env var, 50)
+            pool_timeout: Seconds to wait for a free connection before raising
+                (defaults to REDIS_POOL_TIMEOUT env var, 5)
+            cache: Item cache shared by all sessions (defaults to one sized by
+                REDIS_SESSION_CACHE_BYTES when that env var is set)
+            ttl_policy: TTL policy shared by all sessions, so touches are
+                coalesced across session objects (defaults to TTLPolicy())
+            ttl_refresher: Background batcher for TTL touches (defaults to
+                TTLRefresher())
+            instrumentation: Operation tracing shared by all sessions
+                (defaults to get_instrumentation())
+            cluster: Connect to Redis Cluster; sessions then use the
+                hash-tagged key layout (defaults to REDIS_CLUSTER env var, off)
+        """
+        self.max_connections = max_connections or int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+        self.pool_timeout = (
+            pool_timeout if pool_timeout is not None
+            else float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+        )
+        if cache is None and int(os.getenv("REDIS_SESSION_CACHE_BYTES", "0")) > 0:
+            cache = SessionItemCache()
+        self.cache = cache
+        self.ttl_policy = ttl_policy or TTLPolicy()
+        self.ttl_refresher = ttl_refresher or TTLRefresher()
+        self.instrumentation = instrumentation or get_instrumentation()
+        self.cluster = cluster if cluster is not None else os.getenv("REDIS_CLUSTER", "").lower() in ("1", "true")
+        self._pools: Dict[str, _TrackedBlockingConnectionPool] = {}
+        self._clients: Dict[str, redis.Redis] = {}
+    
+    def url_for(self, session_id: str, redis_url: Optional[str] = None) -> str:
+        """Redis URL that stores a session"""
+        return redis_url or os.getenv("REDIS_URL", "redis://localhost:6379")
+    
+    def get_client(self, redis_url: Optional[str] = None) -> redis.Redis:
+        """Get the shared client for a Redis URL, creating its pool on first use"""
+        url = redis_url or os.getenv("REDIS_URL", "redis://localhost:6379")
+        client = self._clients.get(url)
+        if client is None and self.cluster:
+            # The cluster client keeps a pool per node and routes by key slot
+            client = redis.RedisCluster.from_url(
+                url,
+                max_connections=self.max_connections,
+                decode_responses=False,
+                socket_connect_timeout=5,
+                socket_timeout=5
+            )
+            self._clients[url] = client
+        elif client is None:
+            pool = _TrackedBlockingConnectionPool.from_url(
+                url,
+                max_connections=self.max_connections,
+                timeout=self.pool_timeout,
+                decode_responses=False,
+                socket_connect_timeout=5,
+                socket_timeout=5
+            )
+            client = redis.Redis(connection_pool=pool)
+            self._pools[url] = pool
+            self._clients[url] = client
+        return client
+    
+    def session(self, session_id: str, redis_url: Optional[str] = None, **kwargs) -> RedisSession:
+        """Create a lightweight RedisSession view over the shared pool"""
+        kwargs.setdefault("cache", self.cache)
+        if "ttl_seconds" not in kwargs:
+            kwargs.setdefault("ttl_policy", self.ttl_policy)
+        kwargs.setdefault("ttl_refresher", self.ttl_refresher)
+        kwargs.setdefault("instrumentation", self.instrumentation)
+        if self.cluster:
+            kwargs.setdefault("hash_tag", True)
+        url = self.url_for(session_id, redis_url)
+        return RedisSession(session_id, url, client=self.get_client(url), **kwargs)
+    
+    def pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get connection pool utilization per Redis URL (cluster clients keep their own per-node pools)"""
+        return {
+            url: {
+                "max_connections": pool.max_connections,
+                "in_use": len(pool._in_use_connections),
+                "idle": len(pool._available_connections),
+                "acquisitions": pool.acquire_count,
+                "waits": pool.wait_count,
+                "wait_seconds_total": pool.wait_seconds_total
+            }
+            for url, pool in self._pools.items()
+        }
+    
+    async def close(self) -> None:
+        """Send pending TTL touches and disconnect all pooled connections"""
+        await self.ttl_refresher.close()
+        for client in self._clients.values():
+            await client.close()
+        for pool in self._pools.values():
+            await pool.disconnect()
+        self._clients.clear()
+        self._pools.clear()
+
+
+_default_manager: Optional[RedisSessionManager] = None
+
+
+def get_session_manager() -> RedisSessionManager:
+    """
+    Get the process-wide RedisSessionManager
+    
+    When REDIS_SHARD_URLS lists several standalone Redis servers, sessions
+    are spread across them with a ShardedSessionManager.
+    """
+    global _default_manager
+    if _default_manager is None:
+        if os.getenv("REDIS_SHARD_URLS"):
+            from session_sharding import ShardedSessionManager
+            _default_manager = ShardedSessionManager()
+        else:
+            _default_manager = RedisSessionManager()
+    return _default_manager
+
+
 # Helper function for easy session creation
 async def create_redis_session(
     session_id: str, 
     redis_url: Optional[str] = None,
-    restore_existing: bool = True
-) -> RedisSession:
+    restore_existing: bool = True,
+    manager: Optional[RedisSessionManager] = None,
+    tiered: Optional["TieredSessionStore"] = None,
+    **session_kwargs: Any
+) -> Union[RedisSession, "TieredSession"]:
     """
     Create or restore a Redis session
     
@@ -163,11 +1183,22 @@ async def create_redis_session(
         session_id: Session identifier
         redis_url: Redis connection URL
         restore_existing: If False, clears any existing session data
+        manager: Share connections through this manager instead of
+            opening a dedicated client for the session
+        tiered: Serve the session from this store's local tiers and write
+            to Redis in the background
+        **session_kwargs: Passed to RedisSession (e.g. compactor)
         
     Returns:
-        RedisSession instance
+        RedisSession instance, or a TieredSession wrapping it
     """
-    session = RedisSession(session_id, redis_url)
+    if manager is not None:
+        session = manager.session(session_id, redis_url, **session_kwargs)
+    else:
+        session = RedisSession(session_id, redis_url, **session_kwargs)
+    
+    if tiered is not None:
+        session = tiered.session(session)
     
     if not restore_existing:
         await session.clear_session()
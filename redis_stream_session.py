@@ -0,0 +1,387 @@
+"""
+Redis Streams-based Session implementation for OpenAI Agents SDK
+
+RedisStreamSession stores each conversation item as one stream entry, so
+every item gets a stable, monotonically increasing entry ID. Consumers that
+remember the last ID they processed can fetch only newer entries with
+get_items_since() instead of re-reading the history by index.
+
+The stream is trimmed with XADD MAXLEN ~, which drops whole macro nodes and
+may therefore keep somewhat more than max_items entries. Entry IDs are never
+reused: pop_item() and clear_session() remove entries but keep the stream's
+last generated ID, so an ID seen by a consumer always refers to the same item.
+"""
+import os
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import redis.asyncio as redis
+from dotenv import load_dotenv
+
+from redis_session import default_hash_tag
+from session_codec import ItemCodec, get_codec
+from session_instrumentation import SessionInstrumentation, decode_items, encode_items, get_instrumentation, traced
+from session_ttl import SESSION_TTL_LUA, TOUCH_SCRIPT, TTLPolicy, TTLRefresher
+
+if TYPE_CHECKING:
+    from agents.items import TResponseInputItem
+    from redis_session import RedisSessionManager
+else:
+    TResponseInputItem = Dict[str, Any]
+
+load_dotenv()
+
+# Streams live under their own prefix so they never collide with list sessions
+STREAM_KEY_PREFIX = "openai_agent_stream:"
+ITEM_FIELD = b"item"
+
+
+def stream_session_keys(session_id: str, hash_tag: bool = False) -> List[str]:
+    """Redis keys of a stream session: [stream, meta] (see redis_session.session_keys)"""
+    key = f"{STREAM_KEY_PREFIX}{{{session_id}}}" if hash_tag else f"{STREAM_KEY_PREFIX}{session_id}"
+    return [key, f"{key}:meta"]
+
+
+# XADD every item + EXPIRE in a single atomic server-side call
+# KEYS[1]: session stream, KEYS[2]: session meta
+# ARGV[1]: TTL in seconds, ARGV[2]: max lifetime in seconds (0 = none),
+# ARGV[3]: max items (0 = unlimited, trimmed approximately), ARGV[4..]: items
+# Returns: entry IDs of the added items
+_ADD_ENTRIES_SCRIPT = SESSION_TTL_LUA + """
+local max_items = tonumber(ARGV[3])
+local ids = {}
+for i = 4, #ARGV do
+    if max_items > 0 then
+        ids[#ids + 1] = redis.call('XADD', KEYS[1], 'MAXLEN', '~', max_items, '*', 'item', ARGV[i])
+    else
+        ids[#ids + 1] = redis.call('XADD', KEYS[1], '*', 'item', ARGV[i])
+    end
+end
+local ttl = session_ttl(KEYS[2], tonumber(ARGV[1]), tonumber(ARGV[2]))
+redis.call('EXPIRE', KEYS[1], ttl)
+redis.call('EXPIRE', KEYS[2], ttl)
+return ids
+"""
+
+# Remove the newest entry. The stream key is kept even when it becomes
+# empty, so its last generated ID (and thus ID monotonicity) survives.
+# KEYS[1]: session stream
+# Returns: the removed item or nil
+_POP_ENTRY_SCRIPT = """
+local last = redis.call('XREVRANGE', KEYS[1], '+', '-', 'COUNT', 1)
+if #last == 0 then
+    return nil
+end
+redis.call('XDEL', KEYS[1], last[1][1])
+local fields = last[1][2]
+for i = 1, #fields, 2 do
+    if fields[i] == 'item' then
+        return fields[i + 1]
+    end
+end
+return nil
+"""
+
+_SCRIPTS = {
+    "add": _ADD_ENTRIES_SCRIPT,
+    "pop": _POP_ENTRY_SCRIPT,
+    "touch": TOUCH_SCRIPT,
+}
+
+
+def _decode_entries(entries: List[Tuple[bytes, Dict[bytes, bytes]]]) -> List[Tuple[str, TResponseInputItem]]:
+    """Turn XRANGE results into (entry ID, item) pairs"""
+    items = decode_items([fields[ITEM_FIELD] for _, fields in entries])
+    return [(entry_id.decode(), item) for (entry_id, _), item in zip(entries, items)]
+
+
+class RedisStreamSession:
+    """Redis Streams-backed session storage for OpenAI Agents with stable entry IDs"""
+
+    def __init__(
+        self,
+        session_id: str,
+        redis_url: Optional[str] = None,
+        ttl_seconds: Optional[int] = None,
+        max_items: Optional[int] = None,
+        client: Optional[redis.Redis] = None,
+        codec: Optional[ItemCodec] = None,
+        ttl_policy: Optional[TTLPolicy] = None,
+        ttl_refresher: Optional[TTLRefresher] = None,
+        instrumentation: Optional[SessionInstrumentation] = None,
+        hash_tag: Optional[bool] = None
+    ):
+        """
+        Initialize Redis stream session
+
+        Args:
+            session_id: Unique identifier for the session
+            redis_url: Redis connection URL (defaults to REDIS_URL env var)
+            ttl_seconds: Session TTL (defaults to REDIS_SESSION_TTL env var, 7 days);
+                ignored when ttl_policy is given
+            max_items: Approximate number of recent items to keep (defaults to
+                REDIS_SESSION_MAX_ITEMS env var, 0 or unset for unlimited)
+            client: Shared Redis client (e.g. from RedisSessionManager). When
+                given, close() leaves its connection pool untouched.
+            codec: Item serialization (defaults to get_codec())
+            ttl_policy: Expiry mode and touch coalescing (defaults to a
+                sliding TTLPolicy)
+            ttl_refresher: Batches extend_ttl() touches in the background
+                (None to send each due touch immediately)
+            instrumentation: Samples operations into logfire spans and
+                histograms (defaults to get_instrumentation())
+            hash_tag: Use the cluster key layout, openai_agent_stream:{id}
+                (defaults to REDIS_SESSION_HASH_TAG env var, off)
+        """
+        self.session_id = session_id
+        self.redis_url = redis_url or os.getenv("REDIS_URL", "redis://localhost:6379")
+        self.ttl_policy = ttl_policy or TTLPolicy(ttl_seconds=ttl_seconds)
+        self._ttl_refresher = ttl_refresher
+        self.max_items = max_items if max_items is not None else int(os.getenv("REDIS_SESSION_MAX_ITEMS", "0"))
+        self._client: Optional[redis.Redis] = client
+        self._owns_client = client is None
+        self.codec = codec or get_codec()
+        self.instrumentation = instrumentation or get_instrumentation()
+        # ID of the newest entry returned or written by this object
+        self.last_entry_id: Optional[str] = None
+        self._scripts: Optional[Dict[str, Any]] = None
+        self.hash_tag = hash_tag if hash_tag is not None else default_hash_tag()
+        self._key, self._meta_key = stream_session_keys(session_id, self.hash_tag)
+
+    @property
+    def ttl_seconds(self) -> int:
+        return self.ttl_policy.ttl_seconds
+
+    async def _get_client(self) -> redis.Redis:
+        """Get or create Redis client"""
+        if self._client is None:
+            self._client = await redis.from_url(
+                self.redis_url,
+                decode_responses=False,
+                socket_connect_timeout=5,
+                socket_timeout=5
+            )
+        if self._scripts is None:
+            self._scripts = {
+                name: self._client.register_script(source)
+                for name, source in _SCRIPTS.items()
+            }
+        return self._client
+
+    async def _read_entries(self, limit: Optional[int]) -> List[Tuple[str, TResponseInputItem]]:
+        client = await self._get_client()
+        if limit is None:
+            entries = await client.xrange(self._key)
+        else:
+            # Newest first, so only the requested tail is transferred
+            entries = (await client.xrevrange(self._key, count=limit))[::-1] if limit > 0 else []
+        decoded = _decode_entries(entries)
+        if decoded:
+            self.last_entry_id = decoded[-1][0]
+        return decoded
+
+    @traced("get_items")
+    async def get_items(self, limit: Optional[int] = None) -> List[TResponseInputItem]:
+        """
+        Retrieve conversation items from Redis
+
+        Args:
+            limit: Maximum number of items to retrieve (None for all)
+
+        Returns:
+            List of conversation items, oldest first
+        """
+        return [item for _, item in await self._read_entries(limit)]
+
+    @traced("get_entries")
+    async def get_entries(self, limit: Optional[int] = None) -> List[Tuple[str, TResponseInputItem]]:
+        """
+        Retrieve conversation items together with their entry IDs
+
+        Args:
+            limit: Maximum number of items to retrieve (None for all)
+
+        Returns:
+            List of (entry ID, item), oldest first
+        """
+        return await self._read_entries(limit)
+
+    @traced("get_items_since")
+    async def get_items_since(
+        self,
+        entry_id: Optional[str],
+        limit: Optional[int] = None
+    ) -> List[Tuple[str, TResponseInputItem]]:
+        """
+        Retrieve only the entries added after a known entry
+
+        Args:
+            entry_id: Last entry ID the caller has seen (None to start from
+                the oldest entry)
+            limit: Maximum number of entries to retrieve (None for all)
+
+        Returns:
+            List of (entry ID, item) newer than entry_id, oldest first. Pass
+            the last returned ID to the next call to continue.
+        """
+        client = await self._get_client()
+        start = f"({entry_id}" if entry_id else "-"
+        decoded = _decode_entries(await client.xrange(self._key, min=start, count=limit))
+        if decoded:
+            self.last_entry_id = decoded[-1][0]
+        return decoded
+
+    @traced("add_items")
+    async def add_items(self, items: List[TResponseInputItem]) -> List[str]:
+        """
+        Add conversation items to Redis
+
+        Args:
+            items: List of conversation items to add
+
+        Returns:
+            Entry IDs assigned to the items
+        """
+        if not items:
+            return []
+
+        await self._get_client()
+        encoded_items = encode_items(self.codec, items)
+
+        # Append, trim and refresh the TTL in one round trip so the key never
+        # exists without an expiration
+        ids = await self._scripts["add"](
+            keys=[self._key, self._meta_key],
+            args=[*self.ttl_policy.script_args(), self.max_items, *encoded_items]
+        )
+        self.ttl_policy.mark_touched(self._key)
+        entry_ids = [entry_id.decode() for entry_id in ids]
+        self.last_entry_id = entry_ids[-1]
+        return entry_ids
+
+    @traced("pop_item")
+    async def pop_item(self) -> Optional[TResponseInputItem]:
+        """
+        Remove and return the most recent conversation item
+
+        Returns:
+            The most recent item or None if empty
+        """
+        await self._get_client()
+        item = await self._scripts["pop"](keys=[self._key])
+        if item:
+            return decode_items([item])[0]
+        return None
+
+    @traced("clear_session")
+    async def clear_session(self) -> None:
+        """Remove all items from the session (entry IDs keep increasing afterwards)"""
+        client = await self._get_client()
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.xtrim(self._key, maxlen=0, approximate=False)
+            pipe.delete(self._meta_key)
+            await pipe.execute()
+
+    async def close(self) -> None:
+        """
+        Close Redis connection
+
+        Shared clients are only released: the session keeps its reference to
+        the manager's client, so a late call (e.g. from a background task)
+        still goes through the pool instead of opening a private connection.
+        """
+        if self._client and self._owns_client:
+            await self._client.close()
+            self._client = None
+            self._scripts = None
+
+    @traced("exists")
+    async def exists(self) -> bool:
+        """Check if the session has any items in Redis"""
+        client = await self._get_client()
+        return await client.xlen(self._key) > 0
+
+    @traced("get_session_info")
+    async def get_session_info(self) -> Dict[str, Any]:
+        """Get session metadata"""
+        client = await self._get_client()
+
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.xlen(self._key)
+            pipe.ttl(self._key)
+            pipe.xrange(self._key, count=1)
+            pipe.xrevrange(self._key, count=1)
+            length, ttl, first, last = await pipe.execute()
+
+        return {
+            "session_id": self.session_id,
+            "item_count": length,
+            "ttl_seconds": ttl if ttl > 0 else None,
+            "exists": length > 0,
+            "first_entry_id": first[0][0].decode() if first else None,
+            "last_entry_id": last[0][0].decode() if last else None
+        }
+
+    @traced("extend_ttl")
+    async def extend_ttl(self, seconds: Optional[int] = None) -> None:
+        """
+        Extend session TTL according to the TTL policy
+
+        Args:
+            seconds: TTL to apply instead of the policy's
+        """
+        if seconds is None and not self.ttl_policy.touch_due(self._key):
+            return
+        self.ttl_policy.mark_touched(self._key)
+
+        client = await self._get_client()
+        keys = [self._key, self._meta_key]
+        args = self.ttl_policy.script_args(seconds)
+        if seconds is None and self._ttl_refresher is not None:
+            self._ttl_refresher.schedule(client, keys, args)
+        else:
+            await self._scripts["touch"](keys=keys, args=args)
+
+    # Context manager support
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+async def create_redis_stream_session(
+    session_id: str,
+    redis_url: Optional[str] = None,
+    restore_existing: bool = True,
+    manager: Optional["RedisSessionManager"] = None,
+    **session_kwargs: Any
+) -> RedisStreamSession:
+    """
+    Create or restore a Redis stream session
+
+    Args:
+        session_id: Session identifier
+        redis_url: Redis connection URL
+        restore_existing: If False, clears any existing session data
+        manager: Share connections, TTL policy, instrumentation and shard
+            placement with the list sessions of this manager
+        **session_kwargs: Passed to RedisStreamSession (e.g. max_items)
+
+    Returns:
+        RedisStreamSession instance
+    """
+    if manager is not None:
+        if "ttl_seconds" not in session_kwargs:
+            session_kwargs.setdefault("ttl_policy", manager.ttl_policy)
+        session_kwargs.setdefault("ttl_refresher", manager.ttl_refresher)
+        session_kwargs.setdefault("instrumentation", manager.instrumentation)
+        if manager.cluster:
+            session_kwargs.setdefault("hash_tag", True)
+        redis_url = manager.url_for(session_id, redis_url)
+        session_kwargs["client"] = manager.get_client(redis_url)
+    session = RedisStreamSession(session_id, redis_url, **session_kwargs)
+
+    if not restore_existing:
+        await session.clear_session()
+
+    return session
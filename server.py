@@ -0,0 +1,326 @@
+"""
+専門家エージェントシステムのHTTPサーバー
+
+トリアージ形式（main.py）と会議形式（main_conference.py）の対話をHTTPで提供し、
+回答をServer-Sent Eventsで逐次返す。experts.yamlから作ったエージェントと
+Redisの接続プールは全セッションで共有する。experts.yamlの変更は再起動せずに
+次のターンから反映する（EXPERTS_RELOAD_INTERVAL）。
+
+使い方:
+    python server.py [--host 127.0.0.1] [--port 8080]
+
+エンドポイント:
+    POST   /sessions/{session_id}/triage      {"message": "..."} → SSE
+    POST   /sessions/{session_id}/conference  {"message": "..."} → SSE
+    GET    /sessions/{session_id}             セッション情報
+    DELETE /sessions/{session_id}             セッションを削除
+    GET    /health                            実行中のターン数、接続プール、専門家設定の状態
+
+SSEのイベント:
+    delta  {"text": "..."}          回答の断片
+    done   {"session_id": "..."}    ターン完了
+    error  {"message": "..."}       ターンの失敗
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+import main as triage_app
+import main_conference as conference_app
+from answer_cache import create_answer_cache
+from expert_registry import ExpertRegistry
+from redis_session import RedisSession, get_session_manager
+from session_compaction import SessionCompactor
+from telemetry import configure_telemetry
+from tiered_session import create_tiered_store
+
+# 環境変数を読み込む
+load_dotenv()
+
+# Redisのキーに使うため、セッションIDに使える文字を制限する
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_.:-]{1,128}$")
+
+TurnRunner = Callable[[RedisSession, Callable[[str], None]], Awaitable[None]]
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+class AgentService:
+    """全リクエストで共有するエージェント、Redis接続、同時実行数の制御"""
+
+    def __init__(
+        self,
+        config_path: str = "experts.yaml",
+        max_concurrent_turns: Optional[int] = None,
+        queue_timeout: Optional[float] = None,
+        drain_timeout: Optional[float] = None
+    ):
+        """
+        Args:
+            config_path: 専門家設定ファイル
+            max_concurrent_turns: プロセス全体で同時に実行するターンの最大数
+                (デフォルトは環境変数SERVER_MAX_CONCURRENT_TURNS、32)
+            queue_timeout: 実行枠の空きを待つ最大秒数（超えると503）
+                (デフォルトは環境変数SERVER_QUEUE_TIMEOUT、10)
+            drain_timeout: 終了時に実行中のターンの完了を待つ最大秒数
+                (デフォルトは環境変数SERVER_DRAIN_TIMEOUT、60)
+        """
+        self.max_concurrent_turns = max_concurrent_turns or int(os.getenv("SERVER_MAX_CONCURRENT_TURNS", "32"))
+        self.queue_timeout = queue_timeout if queue_timeout is not None else float(os.getenv("SERVER_QUEUE_TIMEOUT", "10"))
+        self.drain_timeout = drain_timeout if drain_timeout is not None else float(os.getenv("SERVER_DRAIN_TIMEOUT", "60"))
+
+        # 接続プールを共有するセッションマネージャー
+        self.session_manager = get_session_manager()
+        self.compactor = SessionCompactor(manager=self.session_manager) if os.getenv("REDIS_SESSION_COMPACTION", "").lower() in ("1", "true") else None
+        self.history_max_tokens = int(os.getenv("HISTORY_MAX_TOKENS", "0")) or None
+        self.answer_cache = create_answer_cache(self.session_manager)
+        self.tiered_store = create_tiered_store(self.session_manager)
+
+        # トリアージ形式と会議形式のエージェント（experts.yamlの変更は再起動なしで反映）
+        self.registry = ExpertRegistry(config_path, local_router=triage_app.LOCAL_ROUTER)
+
+        self.draining = False
+        self._slots = asyncio.Semaphore(self.max_concurrent_turns)
+        # 同じセッションのターンは順番に実行する（使われなくなったロックは自動で消える）
+        self._session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._turns: Set[asyncio.Task] = set()
+
+    def _session_lock(self, session_id: str) -> asyncio.Lock:
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._session_locks[session_id] = lock
+        return lock
+
+    def session(self, session_id: str) -> RedisSession:
+        session = self.session_manager.session(session_id, compactor=self.compactor)
+        return self.tiered_store.session(session) if self.tiered_store else session
+
+    def triage_turn(self, session_id: str, message: str) -> TurnRunner:
+        # 受け付けた時点のエージェントで最後まで実行する（途中で設定が変わっても影響しない）
+        experts = self.registry.current()
+
+        async def run(session: RedisSession, write: Callable[[str], None]) -> None:
+            await triage_app.run_turn(
+                experts.triage_agent, experts.experts_by_name, session, session_id, message,
+                self.history_max_tokens, experts.router, self.answer_cache,
+                stream=True, write=write
+            )
+        return run
+
+    def conference_turn(self, session_id: str, message: str) -> TurnRunner:
+        experts = self.registry.current()
+
+        async def run(session: RedisSession, write: Callable[[str], None]) -> None:
+            await conference_app.run_streamed_turn(
+                experts.facilitator, experts.conference_experts, session, session_id, message,
+                self.history_max_tokens, self.answer_cache, write=write, projection=experts.history
+            )
+        return run
+
+    async def start_turn(self, session_id: str, run: TurnRunner) -> "asyncio.Queue[Tuple[str, Dict[str, Any]]]":
+        """
+        ターンをバックグラウンドで開始する
+
+        クライアントが切断してもターンは最後まで実行され、会話履歴が途中で途切れない。
+
+        Returns:
+            SSEイベント（イベント名, データ）のキュー。doneかerrorで終わる
+        """
+        if self.draining:
+            raise web.HTTPServiceUnavailable(text="サーバーは終了処理中です")
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise web.HTTPServiceUnavailable(
+                text="同時実行数の上限に達しています",
+                headers={"Retry-After": "5"}
+            )
+
+        events: "asyncio.Queue[Tuple[str, Dict[str, Any]]]" = asyncio.Queue()
+        task = asyncio.create_task(self._run_turn(session_id, run, events))
+        self._turns.add(task)
+        task.add_done_callback(self._turns.discard)
+        return events
+
+    async def _run_turn(self, session_id: str, run: TurnRunner, events: asyncio.Queue) -> None:
+        try:
+            async with self._session_lock(session_id):
+                session = self.session(session_id)
+                try:
+                    # ターン中の書き込みはまとめて1回で保存（失敗したターンは保存しない）
+                    async with session.turn():
+                        await run(session, lambda text: events.put_nowait(("delta", {"text": text})))
+                    # TTLを延長（アクティビティがあったため）
+                    await session.extend_ttl()
+                finally:
+                    await session.close()
+            events.put_nowait(("done", {"session_id": session_id}))
+        except Exception as e:
+            print(f"ターンの実行中にエラーが発生しました（{session_id}）: {e}")
+            events.put_nowait(("error", {"message": str(e)}))
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        router = self.registry.current().router
+        return {
+            "status": "draining" if self.draining else "ok",
+            "in_flight_turns": len(self._turns),
+            "max_concurrent_turns": self.max_concurrent_turns,
+            "redis_pools": self.session_manager.pool_stats(),
+            "experts": self.registry.stats(),
+            "router": router.stats() if router else None,
+            "answer_cache": self.answer_cache.stats() if self.answer_cache else None,
+            "tiered_sessions": self.tiered_store.stats() if self.tiered_store else None
+        }
+
+    async def drain(self) -> None:
+        """新しいターンを受け付けず、実行中のターンと要約の完了を待って接続を閉じる"""
+        self.draining = True
+        await self.registry.close()
+        if self._turns:
+            print(f"実行中の{len(self._turns)}件のターンの完了を待っています...")
+            await asyncio.wait(list(self._turns), timeout=self.drain_timeout)
+        if self.compactor:
+            await self.compactor.wait()
+        if self.tiered_store:
+            await self.tiered_store.close()
+        await self.session_manager.close()
+
+
+SERVICE = web.AppKey("service", AgentService)
+
+
+def _session_id(request: web.Request) -> str:
+    session_id = request.match_info["session_id"]
+    if not _SESSION_ID.match(session_id):
+        raise web.HTTPBadRequest(text="session_idが不正です")
+    return session_id
+
+
+async def _message(request: web.Request) -> str:
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="リクエストボディはJSONである必要があります")
+    message = body.get("message") if isinstance(body, dict) else None
+    if not isinstance(message, str) or not message.strip():
+        raise web.HTTPBadRequest(text="messageを指定してください")
+    return message.strip()
+
+
+async def _stream_events(request: web.Request, events: asyncio.Queue) -> web.StreamResponse:
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+    await response.prepare(request)
+    while True:
+        event, data = await events.get()
+        await response.write(sse_event(event, data))
+        if event in ("done", "error"):
+            break
+    await response.write_eof()
+    return response
+
+
+async def handle_triage(request: web.Request) -> web.StreamResponse:
+    service = request.app[SERVICE]
+    session_id = _session_id(request)
+    message = await _message(request)
+    events = await service.start_turn(session_id, service.triage_turn(session_id, message))
+    return await _stream_events(request, events)
+
+
+async def handle_conference(request: web.Request) -> web.StreamResponse:
+    service = request.app[SERVICE]
+    session_id = _session_id(request)
+    message = await _message(request)
+    events = await service.start_turn(session_id, service.conference_turn(session_id, message))
+    return await _stream_events(request, events)
+
+
+async def handle_session_info(request: web.Request) -> web.Response:
+    service = request.app[SERVICE]
+    session_id = _session_id(request)
+    # 実行中のターンが書き終えてから読む
+    async with service._session_lock(session_id):
+        session = service.session(session_id)
+        try:
+            info = await session.get_session_info()
+        finally:
+            await session.close()
+    return web.json_response(info)
+
+
+async def handle_delete_session(request: web.Request) -> web.Response:
+    service = request.app[SERVICE]
+    session_id = _session_id(request)
+    # 実行中のターンの書き込みと混ざらないよう、ターンと同じロックで削除する
+    async with service._session_lock(session_id):
+        session = service.session(session_id)
+        try:
+            await session.clear_session()
+        finally:
+            await session.close()
+    return web.Response(status=204)
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    return web.json_response(request.app[SERVICE].stats())
+
+
+async def _on_startup(app: web.Application) -> None:
+    await app[SERVICE].registry.start()
+
+
+async def _on_shutdown(app: web.Application) -> None:
+    await app[SERVICE].drain()
+
+
+def create_app(service: Optional[AgentService] = None) -> web.Application:
+    app = web.Application()
+    app[SERVICE] = service or AgentService()
+    app.add_routes([
+        web.post("/sessions/{session_id}/triage", handle_triage),
+        web.post("/sessions/{session_id}/conference", handle_conference),
+        web.get("/sessions/{session_id}", handle_session_info),
+        web.delete("/sessions/{session_id}", handle_delete_session),
+        web.get("/health", handle_health),
+    ])
+    app.on_startup.append(_on_startup)
+    app.on_shutdown.append(_on_shutdown)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="専門家エージェントシステムのHTTPサーバー")
+    parser.add_argument("--host", default=os.getenv("SERVER_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVER_PORT", "8080")))
+    args = parser.parse_args()
+
+    configure_telemetry("expert-agent-server")
+    service = AgentService()
+    print(f"{len(service.registry.current().experts_by_name)}人の専門家を読み込みました")
+    # 終了シグナルを受けたら、実行中のターンが終わるまで接続を閉じない
+    web.run_app(
+        create_app(service),
+        host=args.host,
+        port=args.port,
+        shutdown_timeout=service.drain_timeout
+    )
+
+
+if __name__ == "__main__":
+    main()
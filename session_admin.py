@@ -0,0 +1,353 @@
+"""
+RedisSessionの一括管理ツール
+
+openai_agent_session: 以下のセッションをSCANで少しずつ走査し、
+LLEN / TTL / OBJECT IDLETIME（と任意でMEMORY USAGE）をパイプラインでまとめて取得する。
+条件（セッションIDの接頭辞、アイドル時間、アイテム数、メモリ使用量、TTLなし）に合う
+セッションの一覧表示、集計、一括削除、一括TTL設定ができる。
+1秒あたりに処理するキー数を制限し、本番のRedisを長時間ふさがないようにする。
+
+使い方:
+    python session_admin.py list [--prefix batch-] [--min-idle 86400] [--json]
+    python session_admin.py stats [--memory]
+    python session_admin.py delete --min-idle 2592000 [--yes]
+    python session_admin.py expire --no-ttl --ttl 604800 [--yes]
+
+delete / expire は --yes を付けない限り対象を表示するだけで変更しない。
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional
+
+import redis.asyncio as redis
+from redis.exceptions import ResponseError
+
+from redis_session import SESSION_KEY_PREFIX, SESSION_KEY_SUFFIXES, default_hash_tag, session_id_from_key, session_keys
+from session_blobs import blob_key_prefix
+from session_ttl import TOUCH_SCRIPT
+
+# 削除の直前にアイドル時間を確認し直し、走査後に使われたセッションは残す
+# KEYS: セッションのキー（先頭がリスト）、ARGV[1]: 最小アイドル時間（秒、0で確認しない）
+# Returns: 削除したキー数（使われていた場合は-1）
+_DELETE_IF_IDLE_SCRIPT = """
+local min_idle = tonumber(ARGV[1])
+if min_idle > 0 then
+    local idle = redis.call('OBJECT', 'IDLETIME', KEYS[1])
+    if idle and idle < min_idle then
+        return -1
+    end
+end
+return redis.call('UNLINK', unpack(KEYS))
+"""
+
+_GLOB_SPECIAL = re.compile(r"([*?\[\]\\])")
+
+
+class SessionRecord(NamedTuple):
+    """走査で見つかったセッション"""
+    session_id: str
+    items: int
+    ttl_seconds: Optional[int]  # Noneは有効期限なし
+    idle_seconds: Optional[int]  # LFUポリシーなどで取得できなければNone
+    memory_bytes: Optional[int]  # --memoryを指定したときのみ（補助キーを含む）
+
+
+class SessionFilter(NamedTuple):
+    """対象とするセッションの条件（Noneの項目は条件にしない）"""
+    prefix: str = ""
+    min_idle: Optional[int] = None
+    max_idle: Optional[int] = None
+    min_items: Optional[int] = None
+    max_items: Optional[int] = None
+    min_bytes: Optional[int] = None
+    no_ttl: bool = False
+
+    def matches(self, record: SessionRecord) -> bool:
+        if self.no_ttl and record.ttl_seconds is not None:
+            return False
+        if self.min_items is not None and record.items < self.min_items:
+            return False
+        if self.max_items is not None and record.items > self.max_items:
+            return False
+        if self.min_idle is not None and (record.idle_seconds is None or record.idle_seconds < self.min_idle):
+            return False
+        if self.max_idle is not None and (record.idle_seconds is None or record.idle_seconds > self.max_idle):
+            return False
+        if self.min_bytes is not None and (record.memory_bytes is None or record.memory_bytes < self.min_bytes):
+            return False
+        return True
+
+
+class SessionAdmin:
+    """SCANとパイプラインでセッションを一括処理する"""
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        batch_size: int = 500,
+        rate: float = 2000,
+        with_memory: bool = False,
+        hash_tag: Optional[bool] = None
+    ):
+        """
+        Args:
+            client: 専用のRedisクライアント（single_connection_client推奨）
+            batch_size: SCAN 1回あたりのCOUNTとパイプラインの大きさ
+            rate: 1秒あたりに処理する最大キー数（0は無制限）
+            with_memory: MEMORY USAGEも取得する
+            hash_tag: クラスタ用のキー（openai_agent_session:{id}）を対象にする
+                (デフォルトは環境変数REDIS_SESSION_HASH_TAG)
+        """
+        self.client = client
+        self.batch_size = batch_size
+        self.rate = rate
+        self.with_memory = with_memory
+        self.hash_tag = hash_tag if hash_tag is not None else default_hash_tag()
+        self.scanned_keys = 0
+        self._started: Optional[float] = None
+        self._processed = 0
+
+    async def disable_touch(self) -> bool:
+        """
+        この接続のコマンドでキーのアイドル時間を更新しない（Redis 7.2以降）
+
+        Returns:
+            無効にできたらTrue（古いRedisではLLENでアイドル時間が更新される）
+        """
+        try:
+            await self.client.execute_command("CLIENT", "NO-TOUCH", "ON")
+            return True
+        except ResponseError:
+            return False
+
+    async def throttle(self, processed: int) -> None:
+        """rateを超えないように待つ"""
+        if self._started is None:
+            self._started = time.monotonic()
+        self._processed += processed
+        if self.rate <= 0:
+            return
+        ahead = self._processed / self.rate - (time.monotonic() - self._started)
+        if ahead > 0:
+            await asyncio.sleep(ahead)
+
+    async def scan(self, session_filter: SessionFilter) -> AsyncIterator[List[SessionRecord]]:
+        """条件に合うセッションをSCANのバッチごとに返す"""
+        pattern = (
+            SESSION_KEY_PREFIX + ("{" if self.hash_tag else "")
+            + _GLOB_SPECIAL.sub(r"\\\1", session_filter.prefix) + "*"
+        )
+        aux_suffixes = tuple(f":{suffix}".encode() for suffix in SESSION_KEY_SUFFIXES)
+        cursor = 0
+        while True:
+            # 補助キーのうちmetaはハッシュなので、リストに絞れば本体とarchive/tokensだけが残る
+            cursor, keys = await self.client.scan(cursor, match=pattern, count=self.batch_size, _type="list")
+            self.scanned_keys += len(keys)
+            keys = [key for key in keys if not key.endswith(aux_suffixes) and self._in_layout(key)]
+            if keys:
+                records = await self._inspect(keys)
+                yield [record for record in records if session_filter.matches(record)]
+            await self.throttle(max(len(keys), 1))
+            if cursor == 0:
+                break
+
+    def _in_layout(self, key: bytes) -> bool:
+        # キーの配置を切り替えている途中は、同じRedisに両方の配置のキーがある
+        session_part = key[len(SESSION_KEY_PREFIX):]
+        return (session_part.startswith(b"{") and session_part.endswith(b"}")) == self.hash_tag
+
+    async def _inspect(self, keys: List[bytes]) -> List[SessionRecord]:
+        commands_per_key = 3 + (len(SESSION_KEY_SUFFIXES) + 1 if self.with_memory else 0)
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                # OBJECT IDLETIMEはLLENより先に（NO-TOUCHが使えない場合でも正しい値を得る）
+                pipe.object("idletime", key)
+                pipe.ttl(key)
+                pipe.llen(key)
+                if self.with_memory:
+                    session_id = session_id_from_key(key.decode(), self.hash_tag)
+                    for session_key in session_keys(session_id, self.hash_tag):
+                        pipe.memory_usage(session_key)
+            results = await pipe.execute(raise_on_error=False)
+
+        records = []
+        for index, key in enumerate(keys):
+            idle, ttl, length, *memory = results[index * commands_per_key:(index + 1) * commands_per_key]
+            if isinstance(length, Exception) or length == 0:
+                # 走査の後に削除されたセッション
+                continue
+            records.append(SessionRecord(
+                session_id=session_id_from_key(key.decode(), self.hash_tag),
+                items=length,
+                ttl_seconds=ttl if isinstance(ttl, int) and ttl >= 0 else None,
+                idle_seconds=idle if isinstance(idle, int) else None,
+                memory_bytes=sum(usage for usage in memory if isinstance(usage, int)) if memory else None
+            ))
+        return records
+
+    async def delete(self, records: List[SessionRecord], min_idle: Optional[int] = None) -> int:
+        """
+        セッションを補助キーごと削除する（UNLINKでRedisをブロックしない）
+
+        Args:
+            min_idle: 削除の直前にアイドル時間がこれより短くなっていたら残す
+
+        Returns:
+            削除したセッション数
+        """
+        script = self.client.register_script(_DELETE_IF_IDLE_SCRIPT)
+        async with self.client.pipeline(transaction=False) as pipe:
+            for record in records:
+                await script(keys=session_keys(record.session_id, self.hash_tag), args=[min_idle or 0], client=pipe)
+            results = await pipe.execute(raise_on_error=False)
+        await self.throttle(len(records))
+        return sum(1 for result in results if isinstance(result, int) and result > 0)
+
+    async def expire(self, records: List[SessionRecord], ttl_seconds: int) -> int:
+        """
+        セッションと補助キーの有効期限を設定する（参照している大きな値は短くしない）
+
+        Returns:
+            有効期限を設定したセッション数
+        """
+        script = self.client.register_script(TOUCH_SCRIPT)
+        async with self.client.pipeline(transaction=False) as pipe:
+            for record in records:
+                await script(
+                    keys=session_keys(record.session_id, self.hash_tag),
+                    args=[ttl_seconds, 0, blob_key_prefix(record.session_id, self.hash_tag)],
+                    client=pipe
+                )
+            results = await pipe.execute(raise_on_error=False)
+        await self.throttle(len(records))
+        return sum(1 for result in results if isinstance(result, int) and result > 0)
+
+
+def _format_seconds(seconds: Optional[int]) -> str:
+    if seconds is None:
+        return "-"
+    if seconds >= 86400:
+        return f"{seconds / 86400:.1f}d"
+    if seconds >= 3600:
+        return f"{seconds / 3600:.1f}h"
+    return f"{seconds}s"
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    session_filter = SessionFilter(
+        prefix=args.prefix,
+        min_idle=args.min_idle,
+        max_idle=args.max_idle,
+        min_items=args.min_items,
+        max_items=args.max_items,
+        min_bytes=args.min_bytes,
+        no_ttl=args.no_ttl
+    )
+    # NO-TOUCHは接続ごとの設定なので、接続を1本に固定する
+    client = redis.from_url(args.redis_url, decode_responses=False, single_connection_client=True)
+    admin = SessionAdmin(
+        client,
+        batch_size=args.batch,
+        rate=args.rate,
+        with_memory=args.memory or args.min_bytes is not None,
+        hash_tag=args.hash_tag
+    )
+    apply = args.action in ("delete", "expire") and args.yes
+    summary: Dict[str, Any] = {"action": args.action, "applied": apply, "matched": 0, "items": 0, "no_ttl": 0}
+    if admin.with_memory:
+        summary["memory_bytes"] = 0
+    changed = 0
+    try:
+        if not await admin.disable_touch() and not args.json:
+            print("注意: CLIENT NO-TOUCHが使えないため、走査したセッションのアイドル時間がリセットされます", file=sys.stderr)
+
+        async for records in admin.scan(session_filter):
+            if args.limit:
+                records = records[:max(args.limit - summary["matched"], 0)]
+            summary["matched"] += len(records)
+            for record in records:
+                summary["items"] += record.items
+                summary["no_ttl"] += record.ttl_seconds is None
+                if admin.with_memory:
+                    summary["memory_bytes"] += record.memory_bytes or 0
+                if args.action != "stats":
+                    _print_record(record, args.json)
+
+            if apply and records:
+                if args.action == "delete":
+                    changed += await admin.delete(records, min_idle=args.min_idle)
+                else:
+                    changed += await admin.expire(records, args.ttl)
+            if args.limit and summary["matched"] >= args.limit:
+                break
+    finally:
+        await client.close()
+
+    summary["scanned_keys"] = admin.scanned_keys
+    if args.action in ("delete", "expire"):
+        summary["changed"] = changed
+    return summary
+
+
+def _print_record(record: SessionRecord, as_json: bool) -> None:
+    if as_json:
+        print(json.dumps(record._asdict(), ensure_ascii=False))
+        return
+    memory = f"{record.memory_bytes:>10,}" if record.memory_bytes is not None else f"{'-':>10}"
+    print(
+        f"{record.session_id:<40} {record.items:>7} {_format_seconds(record.ttl_seconds):>8} "
+        f"{_format_seconds(record.idle_seconds):>8} {memory}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RedisSessionの一括管理")
+    parser.add_argument("action", choices=["list", "stats", "delete", "expire"], help="実行する操作")
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379"))
+    parser.add_argument("--prefix", default="", help="セッションIDの接頭辞")
+    parser.add_argument("--min-idle", type=int, help="最小アイドル時間（秒）")
+    parser.add_argument("--max-idle", type=int, help="最大アイドル時間（秒）")
+    parser.add_argument("--min-items", type=int, help="最小アイテム数")
+    parser.add_argument("--max-items", type=int, help="最大アイテム数")
+    parser.add_argument("--min-bytes", type=int, help="最小メモリ使用量（バイト、--memoryを含む）")
+    parser.add_argument("--no-ttl", action="store_true", help="有効期限のないセッションだけ")
+    parser.add_argument("--memory", action="store_true", help="MEMORY USAGEも取得する")
+    parser.add_argument("--hash-tag", action="store_true", default=None,
+                        help="クラスタ用のキー配置（openai_agent_session:{id}）のセッションを対象にする")
+    parser.add_argument("--ttl", type=int, help="expireで設定する有効期限（秒）")
+    parser.add_argument("--limit", type=int, default=0, help="対象とするセッションの最大数（0は無制限）")
+    parser.add_argument("--batch", type=int, default=500, help="SCAN 1回あたりのキー数")
+    parser.add_argument("--rate", type=float, default=2000, help="1秒あたりに処理する最大キー数（0は無制限）")
+    parser.add_argument("--yes", action="store_true", help="delete / expireを実際に実行する")
+    parser.add_argument("--json", action="store_true", help="1行1件のJSONで出力")
+    args = parser.parse_args()
+
+    if args.action == "expire" and not args.ttl:
+        parser.error("expireには--ttlが必要です")
+
+    if not args.json and args.action != "stats":
+        print(f"{'session_id':<40} {'items':>7} {'ttl':>8} {'idle':>8} {'memory':>10}")
+    summary = asyncio.run(run(args))
+
+    if args.json:
+        print(json.dumps({"summary": summary}, ensure_ascii=False))
+        return
+    print(f"\n走査したキー: {summary['scanned_keys']:,} / 該当セッション: {summary['matched']:,}"
+          f" / アイテム合計: {summary['items']:,} / 有効期限なし: {summary['no_ttl']:,}")
+    if "memory_bytes" in summary:
+        print(f"メモリ使用量: {summary['memory_bytes']:,}バイト")
+    if args.action in ("delete", "expire"):
+        if summary["applied"]:
+            label = "削除" if args.action == "delete" else "有効期限を設定"
+            print(f"{label}したセッション: {summary['changed']:,}")
+        else:
+            print("確認のみ（実行するには--yesを付けてください）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Content-addressed offload of large strings in session items
+
+Long answers, code samples and tool outputs make up most of a session's
+memory, and the same text is often stored many times (answers served from
+the answer cache, echoed instructions). With a threshold set, RedisSession
+moves every string of at least that many bytes into a blob key named after
+the SHA-256 of the text and keeps only a small stub in the list:
+
+    R + <codec entry of {"item": item with "" in place of the strings,
+                         "refs": [[digest, path], ...]}>
+
+Reads resolve the references of all returned items with a single MGET, so
+callers get the original items back.
+
+Lifetime: blobs are not reference counted. Each session lists the digests
+it uses in its "blobs" set, and every write or touch of the session extends
+those blobs to at least the session's TTL. A blob therefore lives as long as
+the longest-lived session using it and then expires on its own; popped,
+trimmed or cleared items leave their blobs to expire with the session.
+
+Layout: blobs are shared by all sessions of a Redis server under
+openai_agent_blob:<digest>. With the cluster key layout they are stored per
+session, under openai_agent_blob:{<session id>}:<digest>, so the session's
+scripts and the MGET stay within one slot; identical text is then only
+deduplicated within a session.
+"""
+import hashlib
+import os
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import redis.asyncio as redis
+
+from session_codec import BLOB_REF_PREFIX, ItemCodec, decode_item
+from session_instrumentation import decode_items, encode_items
+
+BLOB_KEY_PREFIX = "openai_agent_blob:"
+
+Path = List[Union[str, int]]
+
+
+def blob_key_prefix(session_id: str, hash_tag: bool = False) -> str:
+    """Prefix that turns a digest into the blob key used by a session"""
+    return f"{BLOB_KEY_PREFIX}{{{session_id}}}:" if hash_tag else BLOB_KEY_PREFIX
+
+
+class BlobOffload:
+    """Decides which strings of an item are stored as blobs"""
+
+    def __init__(self, threshold: Optional[int] = None):
+        """
+        Initialize blob offload
+
+        Args:
+            threshold: Offload strings of at least this many UTF-8 bytes
+                (defaults to REDIS_SESSION_BLOB_THRESHOLD env var, 4096)
+        """
+        self.threshold = threshold or int(os.getenv("REDIS_SESSION_BLOB_THRESHOLD", "0")) or 4096
+
+    def _collect(self, value: Any, path: Path, found: List[Tuple[Path, str]]) -> None:
+        if isinstance(value, str):
+            # UTF-8 needs at most 4 bytes per character
+            if len(value) * 4 >= self.threshold and len(value.encode("utf-8")) >= self.threshold:
+                found.append((list(path), value))
+        elif isinstance(value, dict):
+            for key, child in value.items():
+                path.append(key)
+                self._collect(child, path, found)
+                path.pop()
+        elif isinstance(value, list):
+            for index, child in enumerate(value):
+                path.append(index)
+                self._collect(child, path, found)
+                path.pop()
+
+    def encode(self, codec: ItemCodec, items: List[Dict[str, Any]]) -> Tuple[List[bytes], Dict[str, bytes]]:
+        """
+        Encode items, moving large strings out of them
+
+        Args:
+            codec: Codec of the session (also used for the blobs)
+            items: Items to store
+
+        Returns:
+            (list entries, {digest: blob value}) for the blobs the entries reference
+        """
+        stored: List[Dict[str, Any]] = []
+        is_ref: List[bool] = []
+        blobs: Dict[str, bytes] = {}
+        for item in items:
+            found: List[Tuple[Path, str]] = []
+            self._collect(item, [], found)
+            if not found:
+                stored.append(item)
+                is_ref.append(False)
+                continue
+            stub = _copy_containers(item)
+            refs = []
+            for path, value in found:
+                digest = hashlib.sha256(value.encode("utf-8")).hexdigest()
+                if digest not in blobs:
+                    blobs[digest] = codec.encode(value)
+                _set_path(stub, path, "")
+                refs.append([digest, path])
+            stored.append({"item": stub, "refs": refs})
+            is_ref.append(True)
+
+        entries = encode_items(codec, stored)
+        return [BLOB_REF_PREFIX + entry if ref else entry for entry, ref in zip(entries, is_ref)], blobs
+
+
+def _copy_containers(value: Any) -> Any:
+    """Copy dicts and lists, sharing the leaves"""
+    if isinstance(value, dict):
+        return {key: _copy_containers(child) for key, child in value.items()}
+    if isinstance(value, list):
+        return [_copy_containers(child) for child in value]
+    return value
+
+
+def _set_path(value: Any, path: Path, leaf: Any) -> None:
+    for step in path[:-1]:
+        value = value[step]
+    value[path[-1]] = leaf
+
+
+def has_blob_refs(raw_items: List[bytes]) -> bool:
+    return any(raw[:1] == BLOB_REF_PREFIX for raw in raw_items)
+
+
+async def resolve_items(client: redis.Redis, key_prefix: str, raw_items: List[bytes]) -> List[Dict[str, Any]]:
+    """
+    Decode list entries, fetching the blobs they reference with one MGET
+
+    Args:
+        client: Redis client of the session
+        key_prefix: blob_key_prefix() of the session
+        raw_items: Entries as stored in the session list
+
+    Returns:
+        The original items; strings whose blob has expired come back empty
+    """
+    if not has_blob_refs(raw_items):
+        return decode_items(raw_items)
+
+    plain = iter(decode_items([raw for raw in raw_items if raw[:1] != BLOB_REF_PREFIX]))
+    wrappers = [decode_item(raw[1:]) if raw[:1] == BLOB_REF_PREFIX else None for raw in raw_items]
+    digests = list(dict.fromkeys(
+        digest for wrapper in wrappers if wrapper is not None for digest, _ in wrapper["refs"]
+    ))
+    values = dict(zip(digests, await client.mget([key_prefix + digest for digest in digests])))
+
+    items = []
+    missing = 0
+    for wrapper in wrappers:
+        if wrapper is None:
+            items.append(next(plain))
+            continue
+        item = wrapper["item"]
+        for digest, path in wrapper["refs"]:
+            value = values[digest]
+            if value is None:
+                missing += 1
+                continue
+            _set_path(item, path, decode_item(value))
+        items.append(item)
+    if missing:
+        print(f"セッションの{missing}件の大きな値が見つかりませんでした（有効期限切れ）")
+    return items
+
+
+_default_offload: Optional[BlobOffload] = None
+
+
+def get_blob_offload() -> Optional[BlobOffload]:
+    """Process-wide offload settings, or None unless REDIS_SESSION_BLOB_THRESHOLD is set"""
+    global _default_offload
+    if _default_offload is None and int(os.getenv("REDIS_SESSION_BLOB_THRESHOLD", "0")) > 0:
+        _default_offload = BlobOffload()
+    return _default_offload
@@ -0,0 +1,160 @@
+"""
+Pluggable codecs for RedisSession items
+
+Stored entries are self-describing: JSON is written as-is (like entries
+stored before codecs existed), other formats start with a one-byte prefix.
+Entries written with different codecs can therefore live in the same list.
+Entries whose large strings were offloaded to blob keys (session_blobs.py)
+carry their own prefix and are resolved by the session that reads them.
+"""
+import json
+import os
+from typing import Any, Dict, Optional, Type
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+MSGPACK_PREFIX = b"M"
+ZSTD_PREFIX = b"Z"
+BLOB_REF_PREFIX = b"R"
+
+
+def _json_loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class ItemCodec:
+    """Base codec: serializes items and optionally compresses large payloads"""
+
+    name = "json"
+    prefix = b""
+
+    def __init__(self, compress_threshold: Optional[int] = None, compression_level: int = 3):
+        """
+        Initialize codec
+
+        Args:
+            compress_threshold: Compress payloads of at least this many bytes
+                with zstd (defaults to REDIS_SESSION_COMPRESS_THRESHOLD env var,
+                0 or unset disables compression)
+            compression_level: zstd compression level
+        """
+        if compress_threshold is None:
+            compress_threshold = int(os.getenv("REDIS_SESSION_COMPRESS_THRESHOLD", "0"))
+        if compress_threshold > 0 and zstandard is None:
+            raise RuntimeError("Compression requires the 'zstandard' package")
+        self.compress_threshold = compress_threshold
+        self._compressor = (
+            zstandard.ZstdCompressor(level=compression_level)
+            if compress_threshold > 0 else None
+        )
+
+    def dumps(self, item: Dict[str, Any]) -> bytes:
+        return json.dumps(item, ensure_ascii=False).encode("utf-8")
+
+    def encode(self, item: Dict[str, Any]) -> bytes:
+        """Serialize an item into a self-describing entry"""
+        payload = self.prefix + self.dumps(item)
+        if self._compressor is not None and len(payload) >= self.compress_threshold:
+            compressed = ZSTD_PREFIX + self._compressor.compress(payload)
+            # Keep the plain payload when compression doesn't pay off
+            if len(compressed) < len(payload):
+                return compressed
+        return payload
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        """Deserialize an entry written by any codec"""
+        return decode_item(data)
+
+
+class OrjsonCodec(ItemCodec):
+    """JSON via orjson (same stored format as the default codec)"""
+
+    name = "orjson"
+
+    def __init__(self, *args, **kwargs):
+        if orjson is None:
+            raise RuntimeError("OrjsonCodec requires the 'orjson' package")
+        super().__init__(*args, **kwargs)
+
+    def dumps(self, item: Dict[str, Any]) -> bytes:
+        return orjson.dumps(item)
+
+
+class MsgpackCodec(ItemCodec):
+    """MessagePack encoding"""
+
+    name = "msgpack"
+    prefix = MSGPACK_PREFIX
+
+    def __init__(self, *args, **kwargs):
+        if msgpack is None:
+            raise RuntimeError("MsgpackCodec requires the 'msgpack' package")
+        super().__init__(*args, **kwargs)
+
+    def dumps(self, item: Dict[str, Any]) -> bytes:
+        return msgpack.packb(item, use_bin_type=True)
+
+
+_decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+
+
+def decode_item(data: bytes) -> Dict[str, Any]:
+    """Deserialize an entry, dispatching on its prefix byte"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    head = data[:1]
+    if head == BLOB_REF_PREFIX:
+        raise ValueError("Session item references offloaded blobs; read it with session_blobs.resolve_items")
+    if head == ZSTD_PREFIX:
+        if _decompressor is None:
+            raise RuntimeError("Compressed session item requires the 'zstandard' package")
+        data = _decompressor.decompress(data[1:])
+        head = data[:1]
+
+    if head == MSGPACK_PREFIX:
+        if msgpack is None:
+            raise RuntimeError("msgpack session item requires the 'msgpack' package")
+        return msgpack.unpackb(data[1:], raw=False)
+
+    # Plain JSON (also every entry written before codecs were introduced)
+    return _json_loads(data)
+
+
+CODECS: Dict[str, Type[ItemCodec]] = {
+    "json": ItemCodec,
+    "orjson": OrjsonCodec,
+    "msgpack": MsgpackCodec,
+}
+
+
+def get_codec(name: Optional[str] = None, **kwargs) -> ItemCodec:
+    """
+    Create a codec by name
+
+    Args:
+        name: One of CODECS (defaults to REDIS_SESSION_CODEC env var, json)
+        **kwargs: Passed to the codec constructor
+
+    Returns:
+        ItemCodec instance
+    """
+    name = name or os.getenv("REDIS_SESSION_CODEC", "json")
+    if name not in CODECS:
+        raise ValueError(f"Unknown session codec: {name} (available: {', '.join(CODECS)})")
+    return CODECS[name](**kwargs)
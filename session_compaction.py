@@ -0,0 +1,175 @@
+"""
+Background history compaction for RedisSession
+
+Once a session grows past an item count or byte size threshold, the oldest
+items are summarized by a summarizer agent and atomically replaced by a
+single summary item. The originals are kept in the session's archive list.
+"""
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+
+from agents import Agent, Runner
+
+if TYPE_CHECKING:
+    from redis_session import RedisSession, RedisSessionManager
+
+# Sessions remembered as having nothing to compact (oldest are forgotten first)
+MAX_IDLE_SESSIONS = 10000
+
+# Content prefix that marks the summary item at the head of a session
+SUMMARY_PREFIX = "【これまでの会話の要約】"
+
+SUMMARIZER_INSTRUCTIONS = """あなたは会話の記録係です。渡された会話ログを、後続の会話で文脈として使える要約にまとめてください。
+
+- ユーザーの名前、目的、前提条件、決定事項を必ず残してください
+- どの専門家が何を回答したかを簡潔に残してください
+- 未解決の質問や次に行う予定のことを残してください
+- 箇条書きで、元の会話と同じ言語で書いてください
+"""
+
+
+def create_summarizer_agent() -> Agent:
+    """デフォルトの要約エージェントを作成"""
+    return Agent(
+        name="Session Summarizer",
+        instructions=SUMMARIZER_INSTRUCTIONS
+    )
+
+
+def is_summary_item(item: Dict[str, Any]) -> bool:
+    """Whether an item is a compaction summary"""
+    content = item.get("content")
+    return isinstance(content, str) and content.startswith(SUMMARY_PREFIX)
+
+
+def render_transcript(items: List[Dict[str, Any]]) -> str:
+    """Render session items as plain text for the summarizer"""
+    lines = []
+    for item in items:
+        role = item.get("role") or item.get("type", "item")
+        content = item.get("content")
+        if isinstance(content, list):
+            text = "\n".join(
+                part.get("text", "") for part in content
+                if isinstance(part, dict) and part.get("type") in ("output_text", "input_text")
+            )
+        elif content is not None:
+            text = str(content)
+        elif item.get("type") == "function_call":
+            text = f"[tool call] {item.get('name')}({item.get('arguments', '')})"
+        elif item.get("type") == "function_call_output":
+            text = f"[tool output] {item.get('output', '')}"
+        else:
+            continue
+        lines.append(f"[{role}]\n{text}")
+    return "\n\n".join(lines)
+
+
+class SessionCompactor:
+    """Summarizes and archives old session history off the request path"""
+
+    def __init__(
+        self,
+        summarizer: Optional[Agent] = None,
+        max_items: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        keep_recent: Optional[int] = None,
+        manager: Optional["RedisSessionManager"] = None
+    ):
+        """
+        Initialize compactor
+
+        Args:
+            summarizer: Agent that writes the summary (defaults to create_summarizer_agent())
+            max_items: Compact once the session holds more items than this
+                (defaults to REDIS_SESSION_COMPACT_MAX_ITEMS env var, 100)
+            max_bytes: Compact once the stored items exceed this many bytes
+                (defaults to REDIS_SESSION_COMPACT_MAX_BYTES env var, 256KB)
+            keep_recent: Number of most recent items kept verbatim
+                (defaults to REDIS_SESSION_COMPACT_KEEP_RECENT env var, 20)
+            manager: Background compactions open their own session from this
+                manager, so the caller may close its session right away.
+                Without it, the caller's session is used and must stay open
+                until wait() returns.
+        """
+        self.summarizer = summarizer or create_summarizer_agent()
+        self.max_items = max_items or int(os.getenv("REDIS_SESSION_COMPACT_MAX_ITEMS", "100"))
+        self.max_bytes = max_bytes or int(os.getenv("REDIS_SESSION_COMPACT_MAX_BYTES", str(256 * 1024)))
+        self.keep_recent = keep_recent if keep_recent is not None else int(os.getenv("REDIS_SESSION_COMPACT_KEEP_RECENT", "20"))
+        self.manager = manager
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # session id -> item count to reach before retrying after a compaction found nothing to do
+        self._retry_at: "OrderedDict[str, int]" = OrderedDict()
+
+    def should_compact(self, item_count: int, total_bytes: int) -> bool:
+        return item_count > self.max_items or total_bytes > self.max_bytes
+
+    def maybe_schedule(self, session: "RedisSession", item_count: int, total_bytes: int) -> None:
+        """
+        Start a background compaction if thresholds are crossed and none is running
+
+        When the kept recent items alone exceed the thresholds, compacting finds
+        nothing to do; the session is then not snapshotted again until
+        keep_recent more items have been added.
+        """
+        if not self.should_compact(item_count, total_bytes):
+            return
+        if session.session_id in self._tasks:
+            return
+        if self._retry_at.get(session.session_id, 0) > item_count:
+            return
+        self._retry_at.pop(session.session_id, None)
+        task = asyncio.create_task(self._run(session))
+        self._tasks[session.session_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(session.session_id, None))
+
+    async def _run(self, session: "RedisSession") -> None:
+        if self.manager is not None:
+            # The caller's session may be closed before the summary is ready
+            session = self.manager.session(session.session_id, session.redis_url)
+        try:
+            await self.compact(session)
+        except Exception as e:
+            print(f"会話履歴の圧縮に失敗しました（{session.session_id}）: {e}")
+        finally:
+            if self.manager is not None:
+                await session.close()
+
+    def _cut_index(self, items: List[Dict[str, Any]]) -> int:
+        """Number of leading items to summarize; the kept suffix starts at a user turn"""
+        cut = len(items) - max(self.keep_recent, 1)
+        while cut > 0 and items[cut].get("role") != "user":
+            cut -= 1
+        return cut
+
+    async def compact(self, session: "RedisSession") -> bool:
+        """
+        Summarize and archive the oldest items of a session now
+
+        Returns:
+            True if the history was replaced, False if there was nothing to
+            compact or the session changed underneath
+        """
+        epoch, items, summary_present = await session.get_compaction_snapshot()
+        cut = self._cut_index(items)
+        # Re-summarizing a lone summary gains nothing
+        if cut < (2 if summary_present else 1):
+            self._retry_at[session.session_id] = len(items) + max(self.keep_recent, 1)
+            self._retry_at.move_to_end(session.session_id)
+            if len(self._retry_at) > MAX_IDLE_SESSIONS:
+                self._retry_at.popitem(last=False)
+            return False
+
+        result = await Runner.run(self.summarizer, render_transcript(items[:cut]))
+        summary_item = {
+            "role": "system",
+            "content": f"{SUMMARY_PREFIX}\n{result.final_output}"
+        }
+        return await session.replace_prefix_with_summary(epoch, cut, summary_item)
+
+    async def wait(self) -> None:
+        """Wait for running compactions (call before shutting down)"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
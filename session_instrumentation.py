@@ -0,0 +1,188 @@
+"""
+Optional tracing of RedisSession operations through logfire
+
+Sampled operations get a span (redis_session.<operation>) and histogram
+samples for latency, item count, serialized bytes, encode/decode time and
+the time spent waiting for a pooled connection. Unsampled operations only
+pay for one random() call, and with tracing disabled (the default) sessions
+have no instrumentation at all.
+
+Per-operation measurements are collected through a context variable, so the
+codec helpers and the connection pool attribute their work to whichever
+operation is running in the current task.
+"""
+import contextvars
+import functools
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from session_codec import ItemCodec, decode_item
+
+T = TypeVar("T")
+
+
+class OperationStats:
+    """Measurements of one sampled session operation"""
+
+    __slots__ = ("items", "bytes", "codec_seconds", "pool_wait_seconds")
+
+    def __init__(self):
+        self.items = 0
+        self.bytes = 0
+        self.codec_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+
+
+_current_operation: contextvars.ContextVar[Optional[OperationStats]] = contextvars.ContextVar(
+    "redis_session_operation", default=None
+)
+
+
+def current_operation() -> Optional[OperationStats]:
+    """Stats of the sampled operation running in this task, if any"""
+    return _current_operation.get()
+
+
+def decode_items(raw_items: List[bytes]) -> List[Dict[str, Any]]:
+    """Decode stored entries, recording count, size and time when sampled"""
+    operation = _current_operation.get()
+    if operation is None:
+        return [decode_item(item) for item in raw_items]
+    start = time.perf_counter()
+    items = [decode_item(item) for item in raw_items]
+    operation.codec_seconds += time.perf_counter() - start
+    operation.items += len(raw_items)
+    operation.bytes += sum(len(item) for item in raw_items)
+    return items
+
+
+def encode_items(codec: ItemCodec, items: List[Dict[str, Any]]) -> List[bytes]:
+    """Encode items, recording count, size and time when sampled"""
+    operation = _current_operation.get()
+    if operation is None:
+        return [codec.encode(item) for item in items]
+    start = time.perf_counter()
+    encoded = [codec.encode(item) for item in items]
+    operation.codec_seconds += time.perf_counter() - start
+    operation.items += len(encoded)
+    operation.bytes += sum(len(item) for item in encoded)
+    return encoded
+
+
+def record_pool_wait(seconds: float) -> None:
+    """Attribute connection acquisition time to the running operation"""
+    operation = _current_operation.get()
+    if operation is not None:
+        operation.pool_wait_seconds += seconds
+
+
+class SessionInstrumentation:
+    """Samples RedisSession operations into logfire spans and histograms"""
+
+    def __init__(self, sample_rate: Optional[float] = None, spans: Optional[bool] = None):
+        """
+        Initialize instrumentation
+
+        Args:
+            sample_rate: Fraction of operations to measure, 0 to 1
+                (defaults to REDIS_SESSION_TRACE_SAMPLE_RATE env var, 0)
+            spans: Emit a span per sampled operation in addition to the
+                histograms (defaults to REDIS_SESSION_TRACE_SPANS env var, true)
+        """
+        # logfire is only imported once tracing is actually enabled
+        import logfire
+
+        self.sample_rate = (
+            sample_rate if sample_rate is not None
+            else float(os.getenv("REDIS_SESSION_TRACE_SAMPLE_RATE", "0"))
+        )
+        self.spans = (
+            spans if spans is not None
+            else os.getenv("REDIS_SESSION_TRACE_SPANS", "true").lower() in ("1", "true")
+        )
+        self._logfire = logfire
+        self._duration = logfire.metric_histogram(
+            "redis_session.duration", unit="ms", description="RedisSession operation latency"
+        )
+        self._bytes = logfire.metric_histogram(
+            "redis_session.bytes", unit="By", description="Serialized bytes read or written per operation"
+        )
+        self._codec = logfire.metric_histogram(
+            "redis_session.codec_time", unit="ms", description="Encode/decode time per operation"
+        )
+        self._pool_wait = logfire.metric_histogram(
+            "redis_session.pool_wait", unit="ms", description="Time spent waiting for a pooled connection"
+        )
+        # In-process totals per operation, for stats()
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    async def trace(self, operation: str, session_id: str, call: Awaitable[T]) -> T:
+        """Run one session operation with measurements collected"""
+        stats = OperationStats()
+        token = _current_operation.set(stats)
+        start = time.perf_counter()
+        try:
+            if not self.spans:
+                return await call
+            with self._logfire.span(
+                "redis_session.{operation}", operation=operation, session_id=session_id
+            ) as span:
+                result = await call
+                span.set_attribute("redis.items", stats.items)
+                span.set_attribute("redis.bytes", stats.bytes)
+                span.set_attribute("redis.codec_ms", stats.codec_seconds * 1000)
+                span.set_attribute("redis.pool_wait_ms", stats.pool_wait_seconds * 1000)
+                return result
+        finally:
+            _current_operation.reset(token)
+            self._record(operation, (time.perf_counter() - start), stats)
+
+    def _record(self, operation: str, seconds: float, stats: OperationStats) -> None:
+        attributes = {"operation": operation}
+        self._duration.record(seconds * 1000, attributes)
+        self._bytes.record(stats.bytes, attributes)
+        self._codec.record(stats.codec_seconds * 1000, attributes)
+        self._pool_wait.record(stats.pool_wait_seconds * 1000, attributes)
+
+        totals = self._totals.setdefault(operation, {
+            "calls": 0, "items": 0, "bytes": 0, "duration_ms": 0.0, "codec_ms": 0.0, "pool_wait_ms": 0.0
+        })
+        totals["calls"] += 1
+        totals["items"] += stats.items
+        totals["bytes"] += stats.bytes
+        totals["duration_ms"] += seconds * 1000
+        totals["codec_ms"] += stats.codec_seconds * 1000
+        totals["pool_wait_ms"] += stats.pool_wait_seconds * 1000
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Totals of the sampled operations, per operation"""
+        return {operation: dict(totals) for operation, totals in self._totals.items()}
+
+
+def traced(operation: str) -> Callable:
+    """Decorator for RedisSession methods; a no-op unless the session is instrumented"""
+    def decorate(method: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            instrumentation = self.instrumentation
+            if instrumentation is None or not instrumentation.sampled():
+                return await method(self, *args, **kwargs)
+            return await instrumentation.trace(operation, self.session_id, method(self, *args, **kwargs))
+        return wrapper
+    return decorate
+
+
+_default_instrumentation: Optional[SessionInstrumentation] = None
+
+
+def get_instrumentation() -> Optional[SessionInstrumentation]:
+    """Process-wide instrumentation, or None while REDIS_SESSION_TRACE_SAMPLE_RATE is 0"""
+    global _default_instrumentation
+    if _default_instrumentation is None and float(os.getenv("REDIS_SESSION_TRACE_SAMPLE_RATE", "0")) > 0:
+        _default_instrumentation = SessionInstrumentation()
+    return _default_instrumentation
@@ -0,0 +1,331 @@
+"""
+セッションの再配置ツール
+
+シャード（REDIS_SHARD_URLS）を追加・削除したときに、コンシステントハッシュで
+担当が変わったセッションだけを新しいRedisに移動する。
+移動元の各RedisをSCANで走査し、DUMP / PTTLとRESTOREをパイプラインでまとめて実行する。
+コピーの後、移動元のセッションはコピー中に更新されていないことをスクリプトで確かめてから
+削除し、更新されていたら同じ実行の中でコピーし直す。
+移動先にすでにあるセッションは上書きせず競合として報告する（--replaceで上書き）。
+キーの配置の変更（Redis Clusterへの移行に合わせたハッシュタグ付きのキー）にも使える。
+セッションが参照している大きな値（session_blobs.py）も移動先にコピーする。
+移動元の値は他のセッションと共有されているため削除せず、有効期限で消える。
+
+手順:
+    1. --yesなしで実行し、移動するセッション数を確認する
+    2. アプリが古いシャードの設定のまま --yes で移動する
+    3. アプリのREDIS_SHARD_URLSを新しい設定に切り替える
+    4. もう一度 --yes で実行し、切り替えまでに書き込まれたセッションを移動する
+
+使い方:
+    python session_rebalance.py --from redis://a:6379,redis://b:6379 \\
+        --to redis://a:6379,redis://b:6379,redis://c:6379 [--yes]
+    python session_rebalance.py --from redis://old:6379 --to redis://cluster:7000 \\
+        --to-cluster [--yes]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from redis_session import default_hash_tag, session_keys
+from session_blobs import blob_key_prefix
+from session_admin import SessionAdmin, SessionFilter
+from session_sharding import HashRing, parse_shard_urls
+
+# コピーした時点から変わっていなければセッションを削除する
+# KEYS: 移動元のセッションのキー（2番目がmeta）、ARGV[1]: コピーした時点のversion
+# Returns: 削除したら1、更新されていたら0
+_DELETE_IF_UNCHANGED_SCRIPT = """
+local version = redis.call('HGET', KEYS[2], 'version') or ''
+if version ~= ARGV[1] then
+    return 0
+end
+redis.call('UNLINK', unpack(KEYS))
+return 1
+"""
+
+MigrationStats = Dict[str, int]
+
+
+class SessionMigrator:
+    """移動元の1台から移動先へセッションをまとめて移動する"""
+
+    def __init__(
+        self,
+        source: redis.Redis,
+        target_for: Any,
+        source_hash_tag: bool,
+        target_hash_tag: bool,
+        replace: bool = False,
+        retries: int = 3
+    ):
+        """
+        Args:
+            source: 移動元のRedis
+            target_for: セッションID → 移動先のRedis（移動しない場合はNone）
+            source_hash_tag: 移動元のキーがハッシュタグ付きか
+            target_hash_tag: 移動先のキーをハッシュタグ付きにするか
+            replace: 移動先にすでにあるセッションを上書きする
+            retries: コピー中に更新されたセッションをコピーし直す回数
+        """
+        self.source = source
+        self.target_for = target_for
+        self.source_hash_tag = source_hash_tag
+        self.target_hash_tag = target_hash_tag
+        self.replace = replace
+        self.retries = retries
+        self._delete_script = source.register_script(_DELETE_IF_UNCHANGED_SCRIPT)
+        self.stats: MigrationStats = {"moved": 0, "conflicts": 0, "changed": 0, "failed": 0}
+
+    async def _dump(self, session_ids: List[str]) -> List[Tuple[Any, List[Tuple[Optional[bytes], int]]]]:
+        """セッションごとの (version, [(DUMPの結果, PTTL), ...])"""
+        per_session = 1 + 2 * len(session_keys(""))
+        async with self.source.pipeline(transaction=False) as pipe:
+            for session_id in session_ids:
+                keys = session_keys(session_id, self.source_hash_tag)
+                pipe.hget(keys[1], "version")
+                for key in keys:
+                    pipe.dump(key)
+                    pipe.pttl(key)
+            results = await pipe.execute()
+
+        dumps = []
+        for index in range(len(session_ids)):
+            version, *rest = results[index * per_session:(index + 1) * per_session]
+            dumps.append((version, [(rest[i], rest[i + 1]) for i in range(0, len(rest), 2)]))
+        return dumps
+
+    async def _existing(self, target: redis.Redis, session_ids: List[str]) -> List[bool]:
+        async with target.pipeline(transaction=False) as pipe:
+            for session_id in session_ids:
+                pipe.exists(session_keys(session_id, self.target_hash_tag)[0])
+            return [bool(exists) for exists in await pipe.execute()]
+
+    async def _restore(self, target: redis.Redis, session_ids: List[str], dumps: List[Any]) -> List[bool]:
+        """移動先に書き込み、セッションごとの成否を返す"""
+        commands: List[int] = []
+        async with target.pipeline(transaction=False) as pipe:
+            for position, (session_id, (_, key_dumps)) in enumerate(zip(session_ids, dumps)):
+                for key, (payload, pttl) in zip(session_keys(session_id, self.target_hash_tag), key_dumps):
+                    if payload is None:
+                        # 移動元にないキーは移動先からも消し、古いデータを残さない
+                        pipe.delete(key)
+                    else:
+                        pipe.restore(key, max(pttl, 0), payload, replace=True)
+                    commands.append(position)
+            results = await pipe.execute(raise_on_error=False)
+
+        succeeded = [True] * len(session_ids)
+        for position, result in zip(commands, results):
+            if isinstance(result, Exception):
+                succeeded[position] = False
+        return succeeded
+
+    async def _copy_blobs(self, target: redis.Redis, session_ids: List[str]) -> List[bool]:
+        """セッションが参照している大きな値を移動先にコピーし、セッションごとの成否を返す"""
+        async with self.source.pipeline(transaction=False) as pipe:
+            for session_id in session_ids:
+                pipe.smembers(session_keys(session_id, self.source_hash_tag)[-1])
+            members = await pipe.execute()
+        blobs = [
+            (position, session_id, digest.decode())
+            for position, (session_id, digests) in enumerate(zip(session_ids, members))
+            for digest in digests
+        ]
+        succeeded = [True] * len(session_ids)
+        if not blobs:
+            return succeeded
+
+        async with self.source.pipeline(transaction=False) as pipe:
+            for _, session_id, digest in blobs:
+                key = blob_key_prefix(session_id, self.source_hash_tag) + digest
+                pipe.dump(key)
+                pipe.pttl(key)
+            dumps = await pipe.execute()
+
+        commands: List[int] = []
+        async with target.pipeline(transaction=False) as pipe:
+            for index, (position, session_id, digest) in enumerate(blobs):
+                payload, pttl = dumps[2 * index], dumps[2 * index + 1]
+                if payload is None:
+                    # 移動元でも有効期限切れ
+                    continue
+                key = blob_key_prefix(session_id, self.target_hash_tag) + digest
+                # 同じ名前の値は同じ内容なので、すでにあれば有効期限だけ延ばす
+                pipe.restore(key, max(pttl, 0), payload)
+                commands.append(position)
+                if pttl > 0:
+                    pipe.pexpire(key, pttl, gt=True)
+                    commands.append(position)
+            results = await pipe.execute(raise_on_error=False)
+
+        for position, result in zip(commands, results):
+            if isinstance(result, Exception) and not str(result).startswith("BUSYKEY"):
+                succeeded[position] = False
+        return succeeded
+
+    async def migrate(self, session_ids: List[str]) -> None:
+        """移動先ごとにまとめて移動する"""
+        by_target: Dict[int, Tuple[redis.Redis, List[str]]] = {}
+        for session_id in session_ids:
+            target = self.target_for(session_id)
+            if target is not None:
+                by_target.setdefault(id(target), (target, []))[1].append(session_id)
+
+        for target, ids in by_target.values():
+            if not self.replace:
+                existing = await self._existing(target, ids)
+                self.stats["conflicts"] += sum(existing)
+                ids = [session_id for session_id, exists in zip(ids, existing) if not exists]
+
+            for attempt in range(self.retries + 1):
+                if not ids:
+                    break
+                dumps = await self._dump(ids)
+                restored = await self._restore(target, ids, dumps)
+                # 参照している大きな値もコピーできたセッションだけを移動元から削除する
+                restored_ids = [session_id for session_id, ok in zip(ids, restored) if ok]
+                blobs_copied = iter(await self._copy_blobs(target, restored_ids))
+                restored = [ok and next(blobs_copied) for ok in restored]
+                self.stats["failed"] += restored.count(False)
+
+                copied = [(session_id, dump) for session_id, dump, ok in zip(ids, dumps, restored) if ok]
+                async with self.source.pipeline(transaction=False) as pipe:
+                    for session_id, (version, _) in copied:
+                        await self._delete_script(
+                            keys=session_keys(session_id, self.source_hash_tag),
+                            args=[version or b""],
+                            client=pipe
+                        )
+                    deleted = await pipe.execute()
+                self.stats["moved"] += sum(1 for result in deleted if result == 1)
+                # コピー中に書き込まれたセッションは、コピーし直して最新の内容で上書きする
+                ids = [session_id for (session_id, _), result in zip(copied, deleted) if result != 1]
+            self.stats["changed"] += len(ids)
+
+
+async def rebalance(args: argparse.Namespace) -> Dict[str, Any]:
+    sources = parse_shard_urls(args.source)
+    targets = parse_shard_urls(args.to)
+    source_hash_tag = args.from_hash_tag if args.from_hash_tag is not None else default_hash_tag()
+    target_hash_tag = args.to_cluster or (args.to_hash_tag if args.to_hash_tag is not None else source_hash_tag)
+
+    clients: Dict[str, redis.Redis] = {}
+
+    def client_for(url: str) -> redis.Redis:
+        if url not in clients:
+            clients[url] = redis.from_url(url, decode_responses=False)
+        return clients[url]
+
+    if args.to_cluster:
+        if len(targets) != 1:
+            raise ValueError("--to-clusterには移動先のURLを1つだけ指定してください")
+        cluster = redis.RedisCluster.from_url(targets[0], decode_responses=False)
+        ring = None
+    else:
+        cluster = None
+        ring = HashRing(targets, args.replicas)
+
+    report: Dict[str, Any] = {"applied": args.yes, "sources": {}}
+    try:
+        for source_url in sources:
+            source = client_for(source_url)
+            layout_changes = source_hash_tag != target_hash_tag
+
+            def target_url(session_id: str, source_url: str = source_url) -> Optional[str]:
+                if cluster is not None:
+                    return targets[0]
+                url = ring.node_for(session_id)
+                return url if url != source_url or layout_changes else None
+
+            def target_for(session_id: str) -> Optional[redis.Redis]:
+                url = target_url(session_id)
+                if url is None:
+                    return None
+                return cluster if cluster is not None else client_for(url)
+
+            admin = SessionAdmin(source, batch_size=args.batch, rate=args.rate, hash_tag=source_hash_tag)
+            migrator = SessionMigrator(
+                source,
+                target_for,
+                source_hash_tag,
+                target_hash_tag,
+                replace=args.replace,
+                retries=args.retries
+            )
+            counts: Dict[str, Any] = {"sessions": 0, "to_move": 0, "by_target": {}}
+            async for records in admin.scan(SessionFilter()):
+                counts["sessions"] += len(records)
+                moving = []
+                for record in records:
+                    url = target_url(record.session_id)
+                    if url is not None:
+                        moving.append(record.session_id)
+                        counts["by_target"][url] = counts["by_target"].get(url, 0) + 1
+                counts["to_move"] += len(moving)
+                if args.yes and moving:
+                    await migrator.migrate(moving)
+                    await admin.throttle(len(moving))
+            if args.yes:
+                counts.update(migrator.stats)
+            report["sources"][source_url] = counts
+            if not args.json:
+                _print_source(source_url, counts, args.yes)
+    finally:
+        for client in clients.values():
+            await client.close()
+        if cluster is not None:
+            await cluster.close()
+    return report
+
+
+def _print_source(url: str, counts: Dict[str, Any], applied: bool) -> None:
+    print(f"\n{url}: セッション {counts['sessions']:,} / 移動対象 {counts['to_move']:,}")
+    for target, count in counts["by_target"].items():
+        print(f"  → {target}: {count:,}")
+    if applied:
+        print(
+            f"  移動: {counts['moved']:,} / 競合（移動先に既存）: {counts['conflicts']:,}"
+            f" / 更新が続いて未移動: {counts['changed']:,} / 失敗: {counts['failed']:,}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="シャードの変更に合わせてセッションを再配置")
+    parser.add_argument("--from", dest="source", default=os.getenv("REDIS_SHARD_URLS") or os.getenv("REDIS_URL"),
+                        help="現在のシャードのRedis URL（カンマ区切り、デフォルトはREDIS_SHARD_URLS）")
+    parser.add_argument("--to", required=True, help="新しいシャードのRedis URL（カンマ区切り）")
+    parser.add_argument("--to-cluster", action="store_true", help="移動先をRedis Clusterにする（ハッシュタグ付きのキー）")
+    parser.add_argument("--from-hash-tag", action="store_true", default=None, help="移動元のキーがハッシュタグ付き")
+    parser.add_argument("--to-hash-tag", action="store_true", default=None, help="移動先のキーをハッシュタグ付きにする")
+    parser.add_argument("--replicas", type=int, help="ハッシュリングの仮想ノード数（アプリと同じ値）")
+    parser.add_argument("--replace", action="store_true", help="移動先にすでにあるセッションを上書きする")
+    parser.add_argument("--retries", type=int, default=3, help="コピー中に更新されたセッションをコピーし直す回数")
+    parser.add_argument("--batch", type=int, default=200, help="SCAN 1回あたりのキー数とパイプラインの大きさ")
+    parser.add_argument("--rate", type=float, default=1000, help="1秒あたりに処理する最大キー数（0は無制限）")
+    parser.add_argument("--yes", action="store_true", help="実際に移動する（指定しなければ件数の確認のみ）")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args()
+
+    if not args.source:
+        parser.error("--fromを指定してください")
+    try:
+        report = asyncio.run(rebalance(args))
+    except (ValueError, RedisError) as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    elif not args.yes:
+        print("\n確認のみ（移動するには--yesを付けてください）")
+
+
+if __name__ == "__main__":
+    main()
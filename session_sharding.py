@@ -0,0 +1,95 @@
+"""
+Client-side sharding of sessions across standalone Redis servers
+
+For deployments without Redis Cluster, ShardedSessionManager spreads
+sessions over several Redis URLs with a consistent hash ring. Each URL is
+placed on the ring at many virtual points, so adding a server moves only
+about 1/N of the sessions; session_rebalance.py moves those sessions to
+their new server.
+
+The ring positions are derived from the URL strings, so every process must
+use the same URLs (including credentials and database) in REDIS_SHARD_URLS.
+"""
+import bisect
+import hashlib
+import os
+from typing import Any, List, Optional
+
+import redis.asyncio as redis
+
+from redis_session import RedisSessionManager
+
+
+def _ring_hash(value: str) -> int:
+    # Process-independent, unlike hash()
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+def parse_shard_urls(value: Optional[str]) -> List[str]:
+    """Split a comma separated list of Redis URLs"""
+    return [url.strip() for url in (value or "").split(",") if url.strip()]
+
+
+class HashRing:
+    """Consistent hash ring mapping session ids to Redis URLs"""
+
+    def __init__(self, nodes: List[str], replicas: Optional[int] = None):
+        """
+        Initialize hash ring
+
+        Args:
+            nodes: Redis URLs of the shards
+            replicas: Virtual points per node; more points spread sessions
+                more evenly (defaults to REDIS_SHARD_REPLICAS env var, 160)
+        """
+        if not nodes:
+            raise ValueError("HashRing needs at least one node")
+        if len(set(nodes)) != len(nodes):
+            raise ValueError("HashRing nodes must be unique")
+        self.nodes = list(nodes)
+        self.replicas = replicas or int(os.getenv("REDIS_SHARD_REPLICAS", "160"))
+        points = sorted(
+            (_ring_hash(f"{node}#{index}"), node)
+            for node in self.nodes
+            for index in range(self.replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, session_id: str) -> str:
+        """URL of the shard that owns a session"""
+        index = bisect.bisect(self._hashes, _ring_hash(session_id))
+        return self._owners[index % len(self._owners)]
+
+
+class ShardedSessionManager(RedisSessionManager):
+    """RedisSessionManager that places each session on one of several Redis servers"""
+
+    def __init__(
+        self,
+        shard_urls: Optional[List[str]] = None,
+        replicas: Optional[int] = None,
+        **kwargs: Any
+    ):
+        """
+        Initialize sharded session manager
+
+        Args:
+            shard_urls: Redis URLs of the shards (defaults to the comma
+                separated REDIS_SHARD_URLS env var)
+            replicas: Virtual points per shard on the hash ring
+            **kwargs: Passed to RedisSessionManager (pool sizes apply per shard)
+        """
+        super().__init__(**kwargs)
+        if self.cluster:
+            raise ValueError("Client-side sharding cannot be combined with Redis Cluster")
+        self.ring = HashRing(shard_urls or parse_shard_urls(os.getenv("REDIS_SHARD_URLS")), replicas)
+
+    def url_for(self, session_id: str, redis_url: Optional[str] = None) -> str:
+        """Redis URL that stores a session (an explicit redis_url wins)"""
+        return redis_url or self.ring.node_for(session_id)
+
+    def get_client(self, redis_url: Optional[str] = None) -> redis.Redis:
+        """Get the shared client for a Redis URL; data not tied to a session goes to the first shard"""
+        return super().get_client(redis_url or self.ring.nodes[0])
+
@@ -0,0 +1,224 @@
+"""
+Session expiry policies for RedisSession
+
+A TTLPolicy decides how long a session lives:
+
+- sliding: the session expires ttl_seconds after its last activity
+- absolute: the session expires ttl_seconds after it was created
+- hybrid: sliding, but never longer than max_lifetime_seconds after creation
+
+The expiry is computed server-side from a creation time stored in the
+session's meta hash, so every write refreshes it in the same round trip.
+Explicit touches (extend_ttl) are coalesced to at most one per
+touch_interval per session. Sliding TTLs are padded by touch_interval to
+make up for skipped touches, so a session never expires less than
+ttl_seconds after its last activity.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+from redis.exceptions import NoScriptError
+
+DEFAULT_SESSION_TTL = 604800  # 7 days
+DEFAULT_MAX_LIFETIME = 2592000  # 30 days
+
+TTL_MODES = ("sliding", "absolute", "hybrid")
+
+# Lua helper: seconds until the session should expire, given the sliding
+# TTL and the maximum lifetime (0 = none). Records the creation time in the
+# meta hash on first use.
+SESSION_TTL_LUA = """
+local function session_ttl(meta_key, ttl, max_lifetime)
+    if max_lifetime <= 0 then
+        return ttl
+    end
+    local now = tonumber(redis.call('TIME')[1])
+    local created = tonumber(redis.call('HGET', meta_key, 'created'))
+    if not created then
+        created = now
+        redis.call('HSET', meta_key, 'created', now)
+    end
+    return math.max(math.min(ttl, created + max_lifetime - now), 1)
+end
+"""
+
+# Lua helper: make the keys named by a set's members (after a prefix) live
+# at least ttl seconds. Keys shared with longer-lived sessions keep their TTL.
+EXTEND_MEMBERS_LUA = """
+local function extend_members(set_key, prefix, ttl)
+    for _, member in ipairs(redis.call('SMEMBERS', set_key)) do
+        local key = prefix .. member
+        if redis.call('TTL', key) < ttl then
+            redis.call('EXPIRE', key, ttl)
+        end
+    end
+end
+"""
+
+# Refresh the TTL of an existing session in one call
+# KEYS[1]: session list, KEYS[2..]: auxiliary keys (meta first)
+# ARGV[1]: TTL in seconds, ARGV[2]: max lifetime in seconds (0 = none)
+# ARGV[3] (optional): key prefix of the blobs listed in the set KEYS[#KEYS]
+# Returns: the applied TTL, or 0 if the session does not exist
+TOUCH_SCRIPT = SESSION_TTL_LUA + EXTEND_MEMBERS_LUA + """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local ttl = session_ttl(KEYS[2], tonumber(ARGV[1]), tonumber(ARGV[2]))
+for i = 1, #KEYS do
+    redis.call('EXPIRE', KEYS[i], ttl)
+end
+if ARGV[3] then
+    extend_members(KEYS[#KEYS], ARGV[3], ttl)
+end
+return ttl
+"""
+
+
+class TTLPolicy:
+    """How long sessions live and how often their TTL is refreshed"""
+
+    def __init__(
+        self,
+        mode: Optional[str] = None,
+        ttl_seconds: Optional[int] = None,
+        max_lifetime_seconds: Optional[int] = None,
+        touch_interval: Optional[float] = None
+    ):
+        """
+        Initialize TTL policy
+
+        Args:
+            mode: "sliding", "absolute" or "hybrid"
+                (defaults to REDIS_SESSION_TTL_MODE env var, sliding)
+            ttl_seconds: Idle timeout for sliding/hybrid, lifetime for absolute
+                (defaults to REDIS_SESSION_TTL env var, 7 days)
+            max_lifetime_seconds: Hard cap on a hybrid session's lifetime
+                (defaults to REDIS_SESSION_MAX_LIFETIME env var, 30 days)
+            touch_interval: Minimum seconds between TTL refreshes of a session
+                (defaults to REDIS_SESSION_TOUCH_INTERVAL env var, 60)
+        """
+        self.mode = mode or os.getenv("REDIS_SESSION_TTL_MODE", "sliding")
+        if self.mode not in TTL_MODES:
+            raise ValueError(f"Unknown TTL mode '{self.mode}', expected one of {', '.join(TTL_MODES)}")
+        self.ttl_seconds = ttl_seconds or int(os.getenv("REDIS_SESSION_TTL", str(DEFAULT_SESSION_TTL)))
+        self.max_lifetime_seconds = max_lifetime_seconds or int(
+            os.getenv("REDIS_SESSION_MAX_LIFETIME", str(DEFAULT_MAX_LIFETIME))
+        )
+        self.touch_interval = (
+            touch_interval if touch_interval is not None
+            else float(os.getenv("REDIS_SESSION_TOUCH_INTERVAL", "60"))
+        )
+        # Last refresh per session key (monotonic clock), oldest first
+        self._touched: "OrderedDict[str, float]" = OrderedDict()
+
+    def script_args(self, ttl_seconds: Optional[int] = None) -> List[int]:
+        """TTL arguments for the session scripts: [ttl, max lifetime]"""
+        if self.mode == "absolute":
+            lifetime = ttl_seconds or self.ttl_seconds
+            return [lifetime, lifetime]
+        ttl = (ttl_seconds or self.ttl_seconds) + int(self.touch_interval)
+        return [ttl, self.max_lifetime_seconds if self.mode == "hybrid" else 0]
+
+    def touch_due(self, key: str) -> bool:
+        """Whether an explicit touch should reach Redis now"""
+        if self.mode == "absolute":
+            # The expiry is fixed at creation; writes keep new keys in line
+            return False
+        last = self._touched.get(key)
+        return last is None or time.monotonic() - last >= self.touch_interval
+
+    def mark_touched(self, key: str) -> None:
+        now = time.monotonic()
+        self._touched[key] = now
+        self._touched.move_to_end(key)
+        # Forget sessions whose next touch is due anyway
+        while self._touched:
+            oldest_key, touched = next(iter(self._touched.items()))
+            if now - touched < self.touch_interval:
+                break
+            del self._touched[oldest_key]
+
+
+class TTLRefresher:
+    """Applies TTL touches in the background, batched into one pipeline per Redis client"""
+
+    def __init__(self, flush_interval: Optional[float] = None):
+        """
+        Initialize refresher
+
+        Args:
+            flush_interval: Seconds to collect touches before sending them
+                (defaults to REDIS_SESSION_TOUCH_FLUSH_INTERVAL env var, 1)
+        """
+        self.flush_interval = (
+            flush_interval if flush_interval is not None
+            else float(os.getenv("REDIS_SESSION_TOUCH_FLUSH_INTERVAL", "1"))
+        )
+        self._pending: Dict[int, Tuple[redis.Redis, Dict[str, Tuple[List[str], List[int]]]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.touches = 0
+
+    def schedule(self, client: redis.Redis, keys: List[str], args: List[int]) -> None:
+        """Queue a touch; repeated touches of the same session are merged"""
+        _, touches = self._pending.setdefault(id(client), (client, {}))
+        touches[keys[0]] = (keys, args)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"セッションの有効期限の更新に失敗しました: {e}")
+
+    async def flush(self) -> None:
+        """
+        Send all queued touches now
+
+        Touches for a client that fails are queued again (behind any newer
+        touch of the same session) and sent with the next flush; the other
+        clients are still flushed. The first error is raised at the end.
+        """
+        pending, self._pending = self._pending, {}
+        error: Optional[Exception] = None
+        for client_id, (client, touches) in pending.items():
+            try:
+                try:
+                    await self._send(client, touches)
+                except NoScriptError:
+                    # Cluster pipelines do not load the script on the nodes they
+                    # reach; touches are idempotent, so resend after loading it
+                    await client.script_load(TOUCH_SCRIPT)
+                    await self._send(client, touches)
+            except Exception as e:
+                _, queued = self._pending.setdefault(client_id, (client, {}))
+                for key, touch in touches.items():
+                    queued.setdefault(key, touch)
+                error = error or e
+                continue
+            self.flushes += 1
+            self.touches += len(touches)
+        if error is not None:
+            raise error
+
+    @staticmethod
+    async def _send(client: redis.Redis, touches: Dict[str, Tuple[List[str], List[int]]]) -> None:
+        script = client.register_script(TOUCH_SCRIPT)
+        async with client.pipeline(transaction=False) as pipe:
+            for keys, args in touches.values():
+                await script(keys=keys, args=args, client=pipe)
+            await pipe.execute()
+
+    async def close(self) -> None:
+        """Stop the background task and send what is queued"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+        await self.flush()
@@ -0,0 +1,212 @@
+"""
+専門家ごとに絞り込んだ会話履歴（ヒストリープロジェクション）
+
+会議形式では司会者と全専門家の発言が1つのセッションに保存される。専門家に毎回
+その全体を渡すと、他の専門家の長い回答でトークンと待ち時間を使ってしまう。
+セッションには各アイテムの発言者（RedisSession.add_itemsのauthors）を記録し、
+専門家には規則に合う発言だけを渡す。書き込みは絞り込まずに共有の履歴に保存する。
+
+規則はexperts.yamlで全員の既定（settings.history）と専門家ごと（history）に指定する:
+
+    settings:
+      history:
+        user_turns: 3                # 直近のユーザー発言3回分以降だけを見る
+        include: ["Facilitator"]     # 自分とユーザー以外に見る発言者（省略で全員）
+        max_tokens: 4000             # 絞り込んだ履歴のトークン上限
+    experts:
+      - name: "Security Expert"
+        history:
+          include: ["Facilitator", "Python Expert"]
+
+ユーザーの発言と会話の要約は常に含める。発言者が記録されていない古いアイテムは
+ユーザーの発言として扱えるもの以外、includeを指定した規則では除外する。
+"""
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional
+
+from redis_session import _drop_orphaned_outputs
+from token_estimator import TokenCounter, estimate_item_tokens
+
+# ユーザーの発言の発言者名
+USER_AUTHOR = "user"
+
+_RULE_FIELDS = ("user_turns", "include", "max_tokens")
+
+
+class HistoryRule(NamedTuple):
+    """1人のエージェントに渡す会話履歴の規則（Noneは制限なし）"""
+    user_turns: Optional[int] = None
+    include: Optional[FrozenSet[str]] = None
+    max_tokens: Optional[int] = None
+
+    @property
+    def filters(self) -> bool:
+        """発言者か範囲で履歴を絞り込むか（トークン上限だけなら通常の読み込みで足りる）"""
+        return self.user_turns is not None or self.include is not None
+
+    @classmethod
+    def from_config(cls, config: Any, base: Optional["HistoryRule"] = None) -> "HistoryRule":
+        """
+        experts.yamlのhistoryから規則を作る（不正ならValueError）
+
+        Args:
+            config: historyの値（Noneならbaseをそのまま使う）
+            base: 指定のない項目を引き継ぐ規則
+        """
+        base = base or cls()
+        if config is None:
+            return base
+        if not isinstance(config, dict):
+            raise ValueError("historyはオブジェクトである必要があります")
+        unknown = set(config) - set(_RULE_FIELDS)
+        if unknown:
+            raise ValueError(f"historyに不明な項目があります: {', '.join(sorted(map(str, unknown)))}")
+        for field in ("user_turns", "max_tokens"):
+            value = config.get(field)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value <= 0):
+                raise ValueError(f"historyの{field}は正の整数である必要があります")
+        include = config.get("include", base.include)
+        if "include" in config and include is not None:
+            if not isinstance(include, list) or not all(isinstance(name, str) for name in include):
+                raise ValueError("historyのincludeは文字列のリストである必要があります")
+            include = frozenset(include)
+        return cls(
+            user_turns=config.get("user_turns", base.user_turns),
+            include=include,
+            max_tokens=config.get("max_tokens", base.max_tokens)
+        )
+
+
+class HistoryProjection:
+    """専門家ごとの会話履歴の規則"""
+
+    def __init__(self, default: Optional[HistoryRule] = None, rules: Optional[Dict[str, HistoryRule]] = None):
+        self.default = default or HistoryRule()
+        self.rules = rules or {}
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "HistoryProjection":
+        """experts.yamlの設定から作る（settings.historyが全員の既定、専門家のhistoryで上書き）"""
+        default = HistoryRule.from_config((config.get("settings") or {}).get("history"))
+        rules = {
+            expert["name"]: HistoryRule.from_config(expert["history"], default)
+            for expert in config.get("experts", [])
+            if expert.get("history") is not None
+        }
+        return cls(default, rules)
+
+    def rule_for(self, agent_name: str) -> HistoryRule:
+        return self.rules.get(agent_name, self.default)
+
+    @property
+    def configured(self) -> bool:
+        """いずれかの専門家に規則があるか（なければ全員に同じ履歴を渡せばよい）"""
+        return self.default != HistoryRule() or any(rule != HistoryRule() for rule in self.rules.values())
+
+
+def _starts_user_turn(item: Dict[str, Any], author: Optional[str]) -> bool:
+    # 発言者のない古いアイテムはroleで判断する（専門家への質問と区別できない）
+    if author is None:
+        return item.get("role") == "user"
+    return author == USER_AUTHOR
+
+
+def _visible(item: Dict[str, Any], author: Optional[str], agent_name: str, include: Optional[FrozenSet[str]]) -> bool:
+    if author == USER_AUTHOR or author == agent_name or include is None:
+        return True
+    if author is None:
+        return item.get("role") == "user"
+    return author in include
+
+
+def project(
+    items: List[Dict[str, Any]],
+    authors: List[Optional[str]],
+    agent_name: str,
+    rule: HistoryRule,
+    summary: bool = False,
+    token_counter: TokenCounter = estimate_item_tokens
+) -> List[Dict[str, Any]]:
+    """
+    agent_nameに渡す会話履歴を選ぶ
+
+    Args:
+        items: 共有の会話履歴
+        authors: 各アイテムの発言者（itemsと同じ長さ、Noneは記録なし）
+        agent_name: 履歴を渡すエージェント
+        rule: 適用する規則
+        summary: 先頭のアイテムが会話の要約か（summary_present）
+        token_counter: max_tokensに使うトークン数の見積もり
+
+    Returns:
+        規則に合うアイテム（順序はそのまま）
+    """
+    start = 0
+    if rule.user_turns is not None:
+        turns = [index for index, (item, author) in enumerate(zip(items, authors)) if _starts_user_turn(item, author)]
+        if len(turns) > rule.user_turns:
+            start = turns[-rule.user_turns]
+
+    selected = [
+        item for index, (item, author) in enumerate(zip(items, authors))
+        if (index >= start and _visible(item, author, agent_name, rule.include)) or (summary and index == 0)
+    ]
+
+    if rule.max_tokens is not None:
+        total = 0
+        begin = len(selected)
+        while begin > 0:
+            tokens = token_counter(selected[begin - 1])
+            if total + tokens > rule.max_tokens:
+                break
+            total += tokens
+            begin -= 1
+        selected = selected[begin:]
+    return _drop_orphaned_outputs(selected)
+
+
+def item_authors(items: List[Dict[str, Any]], agent_name: str) -> List[Optional[str]]:
+    """エージェントの実行で追加されたアイテムの発言者（入力はユーザー、それ以外はエージェント）"""
+    return [USER_AUTHOR if item.get("role") == "user" else agent_name for item in items]
+
+
+class SessionView:
+    """共有セッションをエージェントの規則で絞り込んで見せるSession（Runnerにそのまま渡せる）"""
+
+    def __init__(self, session: Any, agent_name: str, rule: Optional[HistoryRule] = None):
+        """
+        Args:
+            session: RedisSessionかTieredSession（with_token_budgetのビューも可）
+            agent_name: このビューを使うエージェント（追加したアイテムの発言者になる）
+            rule: 履歴の規則（Noneなら絞り込まずセッションのトークン予算だけを使う）
+        """
+        self.session = session
+        self.session_id = session.session_id
+        self.agent_name = agent_name
+        self.rule = rule or HistoryRule()
+
+    async def get_items(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        if not self.rule.filters:
+            if self.rule.max_tokens is not None and limit is None:
+                return await self.session.get_items(max_tokens=self.rule.max_tokens)
+            return await self.session.get_items(limit)
+
+        items, authors = await self.session.get_authored_items()
+        rule = self.rule
+        if rule.max_tokens is None:
+            rule = rule._replace(max_tokens=self.session.history_token_budget)
+        projected = project(
+            items, authors, self.agent_name, rule, self.session.summary_present, self.session.token_counter
+        )
+        if limit is not None:
+            return projected[max(len(projected) - limit, 0):]
+        return projected
+
+    async def add_items(self, items: List[Dict[str, Any]]) -> None:
+        # 絞り込まずに共有の履歴へ、発言者付きで保存
+        await self.session.add_items(items, item_authors(items, self.agent_name))
+
+    async def pop_item(self) -> Optional[Dict[str, Any]]:
+        return await self.session.pop_item()
+
+    async def clear_session(self) -> None:
+        await self.session.clear_session()
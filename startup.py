@@ -0,0 +1,41 @@
+"""
+起動時の重い処理（agents/logfireの読み込み、テレメトリの設定、エージェントの作成）をまとめて行う
+
+FAST_STARTUPを有効にすると、これらを別スレッドで始めてすぐに戻るため、
+ユーザーがセッションIDや最初の質問を入力している間に準備が終わる。
+"""
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from telemetry import configure_telemetry
+
+T = TypeVar("T")
+
+# 起動時の準備をバックグラウンドで行う
+FAST_STARTUP = os.getenv("FAST_STARTUP", "").lower() in ("1", "true")
+
+
+def preload(service_name: str, build: Callable[[], T]) -> "Future[T]":
+    """
+    テレメトリを設定してからbuildを呼ぶ
+
+    Returns:
+        buildの戻り値を受け取るFuture（asyncio.wrap_futureで待てる）
+    """
+    def run() -> T:
+        configure_telemetry(service_name)
+        return build()
+
+    if FAST_STARTUP:
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="startup")
+        future = executor.submit(run)
+        executor.shutdown(wait=False)
+        return future
+
+    future: "Future[T]" = Future()
+    try:
+        future.set_result(run())
+    except Exception as e:
+        future.set_exception(e)
+    return future
@@ -0,0 +1,118 @@
+"""
+Runner.run_streamedの出力をターミナルに逐次表示するヘルパー
+"""
+import time
+from typing import Callable, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from agents import RunResultStreaming
+
+
+def _print(text: str) -> None:
+    print(text, end="", flush=True)
+
+
+def _partial_marker_length(text: str, marker: str) -> int:
+    """textの末尾がmarkerの先頭と一致する最大の長さ（次のチャンクでmarkerになりうる部分）"""
+    for length in range(min(len(marker) - 1, len(text)), 0, -1):
+        if text.endswith(marker[:length]):
+            return length
+    return 0
+
+
+async def stream_text(
+    result: "RunResultStreaming",
+    write: Callable[[str], None] = _print,
+    span=None,
+    hide_from: Optional[str] = None,
+    on_text: Optional[Callable[[str], None]] = None
+) -> None:
+    """
+    ストリーミング実行のテキストを到着順に出力する
+
+    Args:
+        result: Runner.run_streamedの戻り値（最後まで消費される）
+        write: テキストの出力先
+        span: 初回トークンまでの時間を記録するlogfireのspan
+        hide_from: この文字列以降のテキストは出力しない（専門家指名のJSONなど）
+        on_text: 表示の有無にかかわらず、すべてのテキスト断片を受け取るコールバック
+    """
+    # 起動を遅くしないよう、実際にストリーミングするときに読み込む
+    from openai.types.responses import ResponseTextDeltaEvent
+
+    start = time.perf_counter()
+    first_token = True
+    start_agent = None
+    pending = ""
+    hidden = False
+
+    async for event in result.stream_events():
+        if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+            if first_token:
+                first_token = False
+                if span is not None:
+                    span.set_attribute("stream.time_to_first_token_ms", (time.perf_counter() - start) * 1000)
+            if on_text is not None:
+                on_text(event.data.delta)
+            if hidden:
+                continue
+
+            text = pending + event.data.delta
+            pending = ""
+            if hide_from:
+                marker_start = text.find(hide_from)
+                if marker_start >= 0:
+                    if marker_start:
+                        write(text[:marker_start])
+                    hidden = True
+                    continue
+                # マーカーが複数のチャンクに分かれて届く場合に備えて末尾を保留
+                held = _partial_marker_length(text, hide_from)
+                if held:
+                    text, pending = text[:-held], text[-held:]
+            if text:
+                write(text)
+
+        elif event.type == "agent_updated_stream_event":
+            # 最初のエージェントの通知は表示せず、ハンドオフ時のみ表示
+            if start_agent is None:
+                start_agent = event.new_agent
+            else:
+                write(f"\n\n（{event.new_agent.name}に引き継ぎました）\n\n")
+
+    if pending:
+        write(pending)
+
+
+class OrderedOutput:
+    """並行して届く複数のストリームを決まった順番で表示する
+
+    先頭のストリームはそのまま表示し、後続のストリームは順番が来るまでバッファする。
+    """
+
+    def __init__(self, count: int = 0, write: Callable[[str], None] = _print):
+        self._write = write
+        self._buffers: List[List[str]] = [[] for _ in range(count)]
+        self._finished = [False] * count
+        self._current = 0
+    
+    def add(self) -> int:
+        """ストリームを末尾に追加し、そのindexを返す"""
+        self._buffers.append([])
+        self._finished.append(False)
+        return len(self._buffers) - 1
+
+    def write(self, index: int, text: str) -> None:
+        if index == self._current:
+            self._write(text)
+        else:
+            self._buffers[index].append(text)
+
+    def finish(self, index: int) -> None:
+        """ストリームの終了を通知し、順番が来たストリームのバッファを表示"""
+        self._finished[index] = True
+        while self._current < len(self._finished) and self._finished[self._current]:
+            self._current += 1
+            if self._current < len(self._buffers):
+                self._write("".join(self._buffers[self._current]))
+                self._buffers[self._current].clear()
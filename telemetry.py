@@ -0,0 +1,34 @@
+"""
+Langfuse（OpenTelemetry）へのトレース送信の設定
+"""
+import base64
+import os
+
+_configured = False
+
+
+def configure_telemetry(service_name: str) -> None:
+    """logfireを設定してOpenAI Agents SDKを計装する（2回目以降の呼び出しは無視）"""
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    # logfireの読み込みは重いので、設定するときに初めて読み込む
+    import logfire
+
+    # OpenTelemetryエンドポイントをLangfuseに設定
+    if os.getenv("LANGFUSE_PUBLIC_KEY") and os.getenv("LANGFUSE_SECRET_KEY"):
+        langfuse_auth = base64.b64encode(
+            f"{os.environ.get('LANGFUSE_PUBLIC_KEY')}:{os.environ.get('LANGFUSE_SECRET_KEY')}".encode()
+        ).decode()
+        os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"] = os.environ.get("LANGFUSE_HOST", "https://cloud.langfuse.com") + "/api/public/otel"
+        os.environ["OTEL_EXPORTER_OTLP_HEADERS"] = f"Authorization=Basic {langfuse_auth}"
+
+    # Langfuse統合をセットアップ
+    logfire.configure(
+        service_name=service_name,
+        send_to_logfire=False
+        # scrubbingパラメータを省略することでデフォルト（マスキング有効）になる
+    )
+    logfire.instrument_openai_agents()
@@ -0,0 +1,94 @@
+"""
+バッチランナーのテスト（Redisが必要、専門家の実行はOpenAIを呼ばない関数に置き換える）
+"""
+import asyncio
+import io
+import json
+import os
+import tempfile
+import uuid
+
+import expert_config
+import main_conference as conference_app
+from batch_runner import BatchRunner
+from session_views import USER_AUTHOR
+
+CONFIG = """experts:
+  - name: "Python Expert"
+    description: "Pythonの専門家"
+    instructions: "Pythonについて回答します。"
+  - name: "Database Expert"
+    description: "データベースの専門家"
+    instructions: "データベースについて回答します。"
+    history:
+      include: []
+"""
+
+
+_original_cache_dir = expert_config.CONFIG_CACHE_DIR
+_original_run_expert = conference_app.run_expert
+
+
+def setup_module():
+    # 一時ファイルの設定をディスクにキャッシュしない
+    expert_config.CONFIG_CACHE_DIR = ""
+
+
+def teardown_module():
+    expert_config.CONFIG_CACHE_DIR = _original_cache_dir
+    conference_app.run_expert = _original_run_expert
+
+
+def test_conference_expert_question_uses_history_rules():
+    """会議形式で専門家を指定した質問が、その専門家の規則で絞り込んだ履歴で実行されるか"""
+    print("=== 専門家指定の質問テスト ===\n")
+    histories = {}
+
+    async def fake_run_expert(expert_agent, question, history, *args, **kwargs):
+        histories[expert_agent.name] = [item["content"] for item in history]
+        answer = f"{expert_agent.name}の回答"
+        return answer, [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+    conference_app.run_expert = fake_run_expert
+
+    async def run():
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "experts.yaml")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(CONFIG)
+            output = io.StringIO()
+            runner = BatchRunner("conference", output, config_path=path)
+
+            session_id = f"batch-test-{uuid.uuid4()}"
+            session = runner.session_manager.session(session_id)
+            await session.add_items(
+                [
+                    {"role": "user", "content": "以前の質問"},
+                    {"role": "user", "content": "Pythonへの質問"},
+                    {"role": "assistant", "content": "Pythonの回答"},
+                ],
+                [USER_AUTHOR, "Python Expert", "Python Expert"]
+            )
+            try:
+                await runner.run_question(0, {
+                    "question": "インデックスの設計は？", "session_id": session_id, "expert": "Database Expert"
+                })
+                record = json.loads(output.getvalue())
+                print(record)
+                assert record["status"] == "ok"
+                assert record["experts"] == ["Database Expert"]
+
+                # 他の専門家の発言は渡さない
+                assert histories["Database Expert"] == ["以前の質問"]
+
+                # 回答は共有の履歴に発言者付きで保存される
+                items, authors = await session.get_authored_items()
+                assert len(items) == 5
+                assert authors[-2:] == ["Database Expert", "Database Expert"]
+            finally:
+                await session.clear_session()
+                await session.close()
+                await runner.close()
+
+    asyncio.run(run())
+    print("\n✅ 専門家指定の質問テスト完了")
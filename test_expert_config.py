@@ -0,0 +1,81 @@
+"""
+experts.yamlのキャッシュのテスト
+"""
+import os
+import tempfile
+
+import expert_config
+from expert_config import cached_build, read_experts_config
+
+CONFIG = """experts:
+  - name: "Python Expert"
+    description: "Pythonの専門家"
+    instructions: "Pythonについて回答します。"
+"""
+
+
+def test_config_cache():
+    """同じ内容の設定は解析済みのものを再利用し、ディスクにも保存するか"""
+    print("=== 設定キャッシュテスト ===\n")
+    original_cache_dir = expert_config.CONFIG_CACHE_DIR
+    with tempfile.TemporaryDirectory() as directory:
+        expert_config.CONFIG_CACHE_DIR = os.path.join(directory, "cache")
+        try:
+            path = os.path.join(directory, "experts.yaml")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(CONFIG)
+
+            digest, config = read_experts_config(path)
+            assert config["experts"][0]["name"] == "Python Expert"
+            assert read_experts_config(path)[1] is config, "同じ内容なら解析済みの設定を返す"
+            assert os.path.exists(os.path.join(expert_config.CONFIG_CACHE_DIR, f"{digest}.json"))
+
+            # プロセス内のキャッシュがなくてもディスクのキャッシュから同じ設定を読む
+            expert_config._configs.clear()
+            assert read_experts_config(path) == (digest, config)
+
+            # 内容が変われば別の設定として読み直す
+            with open(path, "a", encoding="utf-8") as f:
+                f.write('  - name: "Database Expert"\n    description: "DB"\n    instructions: "DB"\n')
+            new_digest, new_config = read_experts_config(path)
+            assert new_digest != digest and len(new_config["experts"]) == 2
+        finally:
+            expert_config.CONFIG_CACHE_DIR = original_cache_dir
+    print("\n✅ 設定キャッシュテスト完了")
+
+
+def test_cached_build():
+    """エージェントは設定の内容と種類ごとに一度だけ作るか"""
+    print("\n=== エージェント構築キャッシュテスト ===\n")
+    calls = []
+
+    def build(label):
+        calls.append(label)
+        return object()
+
+    first = cached_build("digest-a", "triage", lambda: build("a"))
+    assert cached_build("digest-a", "triage", lambda: build("a")) is first
+    assert cached_build("digest-a", "conference", lambda: build("a")) is not first
+    assert cached_build("digest-b", "triage", lambda: build("b")) is not first
+    assert calls == ["a", "a", "b"]
+    print("\n✅ エージェント構築キャッシュテスト完了")
+
+
+def test_cache_keeps_recent_configs():
+    """再読み込みで置き換わった古い設定はプロセス内のキャッシュから捨てるか"""
+    print("\n=== キャッシュの上限テスト ===\n")
+    for digest in ("digest-1", "digest-2", "digest-3"):
+        cached_build(digest, "triage", object)
+    assert list(expert_config._agents) == ["digest-2", "digest-3"]
+
+    # 使われた設定は最新として残る
+    cached_build("digest-2", "conference", object)
+    cached_build("digest-4", "triage", object)
+    assert list(expert_config._agents) == ["digest-2", "digest-4"]
+    print("\n✅ キャッシュの上限テスト完了")
+
+
+if __name__ == "__main__":
+    test_config_cache()
+    test_cached_build()
+    test_cache_keeps_recent_configs()
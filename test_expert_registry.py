@@ -0,0 +1,106 @@
+"""
+専門家レジストリ（experts.yamlの再読み込み）のテスト
+"""
+import os
+import tempfile
+
+import expert_config
+from expert_registry import ExpertRegistry
+
+CONFIG = """experts:
+  - name: "Python Expert"
+    description: "Pythonの専門家"
+    instructions: "Pythonについて回答します。"
+  - name: "Database Expert"
+    description: "データベースの専門家"
+    instructions: "データベースについて回答します。"
+"""
+
+
+_original_cache_dir = expert_config.CONFIG_CACHE_DIR
+
+
+def setup_module():
+    # 一時ファイルの設定をディスクにキャッシュしない
+    expert_config.CONFIG_CACHE_DIR = ""
+
+
+def teardown_module():
+    expert_config.CONFIG_CACHE_DIR = _original_cache_dir
+
+
+def write_config(path: str, text: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    # 同じ時刻の書き込みでも変更として検出されるようにmtimeを進める
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def test_reload_changed_experts():
+    """変更された専門家だけを作り直し、実行中のスナップショットは変えないか"""
+    print("=== 専門家の再読み込みテスト ===\n")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "experts.yaml")
+        write_config(path, CONFIG)
+        registry = ExpertRegistry(path, poll_interval=0)
+        before = registry.current()
+        assert before.version == 1
+        assert registry.check() is False, "変更がなければ読み直さない"
+
+        # Database Expertを変更し、Security Expertを追加
+        write_config(path, CONFIG.replace("データベースについて回答します。", "DBについて詳しく回答します。") + """  - name: "Security Expert"
+    description: "セキュリティの専門家"
+    instructions: "セキュリティについて回答します。"
+""")
+        assert registry.check() is True
+        after = registry.current()
+        print(f"   バージョン: {before.version} → {after.version}")
+        assert after.version == 2
+        assert after.experts_by_name["Python Expert"] is before.experts_by_name["Python Expert"], "変わっていない専門家は再利用"
+        assert after.experts_by_name["Database Expert"] is not before.experts_by_name["Database Expert"]
+        assert after.experts_by_name["Database Expert"].instructions == "DBについて詳しく回答します。"
+        assert [agent.name for agent in after.triage_agent.handoffs] == ["Python Expert", "Database Expert", "Security Expert"]
+        assert "Security Expert" in after.facilitator.expert_dict
+
+        # 以前のスナップショットは実行中のターンのためにそのまま残る
+        assert [agent.name for agent in before.triage_agent.handoffs] == ["Python Expert", "Database Expert"]
+        assert "Security Expert" not in before.facilitator.expert_dict
+    print("\n✅ 専門家の再読み込みテスト完了")
+
+
+def test_invalid_config_keeps_last_good():
+    """不正な設定は適用せず、最後に読み込めた設定を使い続けるか"""
+    print("\n=== 不正な設定の拒否テスト ===\n")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "experts.yaml")
+        write_config(path, CONFIG)
+        registry = ExpertRegistry(path, poll_interval=0)
+        good = registry.current()
+
+        invalid_configs = [
+            "experts: [unclosed",  # YAMLの構文エラー
+            "experts: []",  # 専門家がいない
+            CONFIG + '  - name: "Python Expert"\n    description: "重複"\n    instructions: "重複"\n',  # 名前の重複
+        ]
+        for text in invalid_configs:
+            write_config(path, text)
+            assert registry.check() is False
+            assert registry.current() is good, "不正な設定では差し替えない"
+            print(f"   拒否: {registry.last_error}")
+
+        stats = registry.stats()
+        assert stats["failed_reloads"] == 3 and stats["reloads"] == 0
+        assert stats["last_error"] is not None
+
+        # 正しい設定に戻せば再び読み込む
+        write_config(path, CONFIG.replace("Pythonについて", "Python 3について"))
+        assert registry.check() is True
+        assert registry.stats()["last_error"] is None
+    print("\n✅ 不正な設定の拒否テスト完了")
+
+
+if __name__ == "__main__":
+    setup_module()
+    test_reload_changed_experts()
+    test_invalid_config_keeps_last_good()
@@ -0,0 +1,82 @@
+"""
+ローカル専門家ルーターのテスト
+"""
+import yaml
+
+from expert_router import ExpertRouter, char_ngrams
+
+
+def load_router(**kwargs):
+    with open("experts.yaml", "r", encoding="utf-8") as f:
+        return ExpertRouter.from_config(yaml.safe_load(f), **kwargs)
+
+
+def test_char_ngrams():
+    """全角/半角と大文字/小文字の違いを吸収するか"""
+    print("=== 文字n-gramテスト ===\n")
+    assert char_ngrams("Ｐｙｔｈｏｎ") == char_ngrams("python")
+    assert char_ngrams("デコレータ、使い方") == char_ngrams("デコレータ 使い方")
+    assert char_ngrams("") == {}
+    print("\n✅ 文字n-gramテスト完了")
+
+
+def test_obvious_questions():
+    """明らかな質問はローカルで正しい専門家に振り分けるか"""
+    print("\n=== 明らかな質問テスト ===\n")
+    router = load_router(threshold=0.15, min_margin=0.04)
+    cases = {
+        "Pythonのデコレータの使い方を教えて": "Python Expert",
+        "ReactのuseEffectが2回呼ばれるのはなぜ？": "JavaScript Expert",
+        "PostgreSQLのインデックス設計": "Database Expert",
+        "Kubernetesにデプロイしたい": "DevOps Expert",
+        "XSSとCSRFの対策": "Security Expert",
+    }
+    for question, expert in cases.items():
+        decision = router.route(question)
+        print(f"{question} -> {decision.expert} ({decision.score:.3f})")
+        assert decision.expert == expert
+    print("\n✅ 明らかな質問テスト完了")
+
+
+def test_fallback_and_stats():
+    """確信度の低い質問はトリアージに任せ、統計を記録するか"""
+    print("\n=== フォールバックテスト ===\n")
+    router = load_router(threshold=0.15, min_margin=0.04)
+    assert router.route("Pythonのデコレータ").expert == "Python Expert"
+
+    decision = router.route("こんにちは")
+    assert decision.expert is None, "関係のない質問はトリアージに任せるべき"
+    router.record_triage_choice(decision, "Python Expert")
+
+    stats = router.stats()
+    print(f"統計: {stats}")
+    assert stats["questions"] == 2
+    assert stats["routed_locally"] == 1
+    assert stats["fallbacks"] == 1
+    assert stats["hit_rate"] == 0.5
+    assert stats["shadow_checked"] == 1
+
+    # 閾値を上げればすべてフォールバックする
+    strict = load_router(threshold=1.01)
+    assert strict.route("Pythonのデコレータ").expert is None
+    print("\n✅ フォールバックテスト完了")
+
+
+def test_empty_keywords():
+    """keywordsが空（null）の専門家も振り分けの対象にできるか"""
+    config = {
+        "experts": [
+            {"name": "Python Expert", "description": "Pythonの専門家", "keywords": None},
+            {"name": "Database Expert", "description": "データベースの専門家", "keywords": ["SQL"]},
+        ]
+    }
+    router = ExpertRouter.from_config(config)
+    assert router.expert_names == ["Python Expert", "Database Expert"]
+    assert router.route("SQLのインデックス").candidate == "Database Expert"
+
+
+if __name__ == "__main__":
+    test_char_ngrams()
+    test_obvious_questions()
+    test_fallback_and_stats()
+    test_empty_keywords()
@@ -0,0 +1,97 @@
+"""
+専門家指名の逐次パーサーのテスト
+"""
+from nomination_parser import NominationStreamParser, parse_nominations
+
+
+FACILITATOR_TEXT = """司会者です。セキュリティとデータベースの両面からの検討が必要ですね。
+
+【専門家指名】
+[
+  {"expert": "Security Expert", "question": "SQLインジェクション対策を教えてください"},
+  {"expert": "Database Expert", "question": "プリペアドステートメントの使い方は？"}
+]
+よろしくお願いします。"""
+
+
+def feed_in_chunks(text, size):
+    """テキストを指定サイズに分割してパーサーに渡し、確定した位置を記録"""
+    parser = NominationStreamParser()
+    emitted = []
+    for start in range(0, len(text), size):
+        for nomination in parser.feed(text[start:start + size]):
+            emitted.append((start + size, nomination))
+    parser.close()
+    return parser, emitted
+
+
+def test_partial_chunks():
+    """どの分割サイズでも同じ指名が得られるか"""
+    print("=== 分割チャンクテスト ===\n")
+    expected = parse_nominations(FACILITATOR_TEXT)
+    assert [n["expert"] for n in expected] == ["Security Expert", "Database Expert"]
+    for size in (1, 2, 3, 7, 50, len(FACILITATOR_TEXT)):
+        parser, emitted = feed_in_chunks(FACILITATOR_TEXT, size)
+        assert [n for _, n in emitted] == expected, f"チャンクサイズ{size}で結果が一致するべき"
+        assert not parser.errors
+    print("\n✅ 分割チャンクテスト完了")
+
+
+def test_emits_when_object_closes():
+    """JSONオブジェクトが閉じた時点で指名が確定するか"""
+    print("\n=== 早期確定テスト ===\n")
+    _, emitted = feed_in_chunks(FACILITATOR_TEXT, 1)
+    first_close = FACILITATOR_TEXT.index("}") + 1
+    assert emitted[0][0] == first_close, "最初の指名はその閉じ括弧で確定するべき"
+    assert emitted[1][0] < len(FACILITATOR_TEXT), "配列の終わりより前に確定するべき"
+    print("\n✅ 早期確定テスト完了")
+
+
+def test_nested_braces():
+    """文字列内やネストした括弧を正しく扱えるか"""
+    print("\n=== ネスト括弧テスト ===\n")
+    text = (
+        '司会者です。【専門家指名】{"expert": "Python Expert", '
+        '"question": "dict内包表記 {k: v} と \\"}\\" の扱いは？", '
+        '"context": {"level": {"depth": 2}}} 以上です。{ 無関係な括弧 }'
+    )
+    nominations = parse_nominations(text)
+    assert len(nominations) == 1
+    assert nominations[0]["question"] == 'dict内包表記 {k: v} と "}" の扱いは？'
+    assert nominations[0]["context"] == {"level": {"depth": 2}}
+    print("\n✅ ネスト括弧テスト完了")
+
+
+def test_malformed_json():
+    """壊れたJSONはスキップして後続の指名を解析できるか"""
+    print("\n=== 不正JSONテスト ===\n")
+    text = (
+        '【専門家指名】[{expert: "DevOps Expert"}, '
+        '{"expert": "DevOps Expert", "question": "Dockerとは？"}]'
+    )
+    parser = NominationStreamParser()
+    nominations = parser.feed(text)
+    assert [n["question"] for n in nominations] == ["Dockerとは？"]
+    assert len(parser.errors) == 1, "不正なJSONはエラーとして記録されるべき"
+
+    # 閉じられないまま終了した場合
+    parser = NominationStreamParser()
+    assert parser.feed('【専門家指名】{"expert": "DevOps Expert", "question": "途中') == []
+    parser.close()
+    assert parser.errors, "未完了のJSONはエラーとして記録されるべき"
+    print("\n✅ 不正JSONテスト完了")
+
+
+def test_without_marker():
+    """マーカーがなければ括弧があっても指名しないか"""
+    print("\n=== マーカーなしテスト ===\n")
+    assert parse_nominations('司会者です。{"expert": "Python Expert"} のような形式です。') == []
+    print("\n✅ マーカーなしテスト完了")
+
+
+if __name__ == "__main__":
+    test_partial_chunks()
+    test_emits_when_object_closes()
+    test_nested_braces()
+    test_malformed_json()
+    test_without_marker()
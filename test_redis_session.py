@@ -2,8 +2,20 @@
 RedisSessionのテスト
 """
 import asyncio
+import os
+import tempfile
 import uuid
-from redis_session import RedisSession, create_redis_session
+from redis.exceptions import ConnectionError as RedisConnectionError
+from answer_cache import AnswerCache
+from session_admin import SessionAdmin, SessionFilter
+from session_blobs import BlobOffload
+from session_instrumentation import SessionInstrumentation
+from session_views import USER_AUTHOR, HistoryRule, SessionView
+from session_ttl import TTLPolicy, TTLRefresher
+import redis_session as redis_session_module
+from redis_session import RedisSession, RedisSessionManager, SessionItemCache, create_redis_session
+from redis_stream_session import create_redis_stream_session
+from tiered_session import TieredSessionStore
 
 
 async def test_basic_operations():
@@ -161,6 +173,782 @@ async def test_concurrent_access():
     print("\n✅ 並行アクセステスト完了")
 
 
+async def test_max_items_trim():
+    """最大アイテム数でのトリムとTTL設定のテスト"""
+    print("\n\n=== 最大アイテム数トリムテスト ===\n")
+    
+    session_id = f"trim-{uuid.uuid4()}"
+    print(f"テストセッションID: {session_id}")
+    
+    session = RedisSession(session_id, ttl_seconds=600, max_items=3)
+    
+    # 1. 上限を超えて追加
+    print("\n1. 上限(3)を超える5つのアイテムを追加")
+    await session.add_items([
+        {"role": "user", "content": f"Message{i+1}"} for i in range(5)
+    ])
+    items = await session.get_items()
+    print(f"   保持されたアイテム: {[item['content'] for item in items]}")
+    assert [item["content"] for item in items] == ["Message3", "Message4", "Message5"], "最新の3つが残るべき"
+    
+    # 2. TTLが同時に設定されていることを確認
+    print("\n2. TTLを確認")
+    info = await session.get_session_info()
+    print(f"   TTL: {info['ttl_seconds']}秒")
+    # スライディングTTLには更新間隔の分の余裕が加わる
+    assert info["ttl_seconds"] is not None and info["ttl_seconds"] <= 600 + session.ttl_policy.touch_interval, "TTLが設定されるべき"
+    
+    # クリーンアップ
+    await session.clear_session()
+    await session.close()
+    
+    print("\n✅ 最大アイテム数トリムテスト完了")
+
+
+async def test_session_manager_pool():
+    """共有接続プールのテスト"""
+    print("\n\n=== 共有接続プールテスト ===\n")
+    
+    manager = RedisSessionManager(max_connections=2, pool_timeout=5)
+    session_ids = [f"pool-{uuid.uuid4()}" for _ in range(10)]
+    
+    # 1. 接続数より多いセッションから同時に書き込み
+    print("1. 10セッションから最大2接続で同時に書き込み")
+    sessions = [
+        await create_redis_session(session_id, manager=manager)
+        for session_id in session_ids
+    ]
+    await asyncio.gather(*[
+        session.add_items([{"role": "user", "content": session.session_id}])
+        for session in sessions
+    ])
+    
+    # 2. 各セッションのデータを確認
+    print("\n2. 各セッションのデータを確認")
+    for session in sessions:
+        items = await session.get_items()
+        assert items == [{"role": "user", "content": session.session_id}], "自分のアイテムのみ保存されるべき"
+    
+    # 3. セッションを閉じても接続はプールに残る
+    print("\n3. プール統計を確認")
+    for session in sessions:
+        await session.clear_session()
+        await session.close()
+    stats = list(manager.pool_stats().values())[0]
+    print(f"   統計: {stats}")
+    assert stats["in_use"] == 0, "使用中の接続は残らないべき"
+    assert stats["idle"] <= 2, "接続数は上限以下であるべき"
+    
+    await manager.close()
+    
+    print("\n✅ 共有接続プールテスト完了")
+
+
+async def test_item_cache():
+    """ローカルキャッシュと他プロセスからの書き込みの整合性テスト"""
+    print("\n\n=== ローカルキャッシュテスト ===\n")
+    
+    session_id = f"cache-{uuid.uuid4()}"
+    print(f"テストセッションID: {session_id}")
+    
+    cache = SessionItemCache(max_bytes=1024 * 1024)
+    cached = RedisSession(session_id, cache=cache)
+    writer = RedisSession(session_id)  # キャッシュを持たない別の書き込み元
+    
+    # 1. 自分の書き込みはキャッシュに反映される
+    print("\n1. 自分の書き込み後の読み込み")
+    await cached.add_items([{"role": "user", "content": "Message1"}])
+    await cached.get_items()
+    await cached.add_items([{"role": "user", "content": "Message2"}])
+    items = await cached.get_items()
+    assert [item["content"] for item in items] == ["Message1", "Message2"]
+    print(f"   統計: {cache.stats()}")
+    assert cache.stats()["hits"] == 1, "書き込み直後の読み込みはキャッシュヒットするべき"
+    
+    # 取得したアイテムを変更してもキャッシュは変わらない
+    items[0]["content"] = "changed"
+    assert (await cached.get_items())[0]["content"] == "Message1", "キャッシュのアイテムは共有されないべき"
+    
+    # 2. 他の書き込み元の追記は差分だけ取得される
+    print("\n2. 他の書き込み元による追記")
+    await writer.add_items([{"role": "user", "content": "Message3"}])
+    items = await cached.get_items()
+    assert [item["content"] for item in items] == ["Message1", "Message2", "Message3"]
+    assert cache.stats()["partial_hits"] == 1, "差分のみ取得されるべき"
+    
+    # 3. pop後は正しく再読み込みされる
+    print("\n3. 他の書き込み元によるpop")
+    await writer.pop_item()
+    items = await cached.get_items(limit=1)
+    assert [item["content"] for item in items] == ["Message2"]
+    
+    # 4. クリア後に同じ件数を書き込んでも古い内容は返らない
+    print("\n4. クリア後の再書き込み")
+    await writer.clear_session()
+    await writer.add_items([{"role": "user", "content": "New1"}, {"role": "user", "content": "New2"}])
+    items = await cached.get_items()
+    assert [item["content"] for item in items] == ["New1", "New2"]
+    print(f"   統計: {cache.stats()}")
+    
+    # クリーンアップ
+    await cached.clear_session()
+    await cached.close()
+    await writer.close()
+    
+    print("\n✅ ローカルキャッシュテスト完了")
+
+
+async def test_summary_replacement():
+    """要約による履歴の置き換えとアーカイブのテスト（要約エージェントは使わない）"""
+    print("\n\n=== 履歴要約置き換えテスト ===\n")
+    
+    session_id = f"compact-{uuid.uuid4()}"
+    print(f"テストセッションID: {session_id}")
+    
+    session = RedisSession(session_id)
+    await session.add_items([
+        {"role": "user", "content": f"Message{i+1}"} for i in range(6)
+    ])
+    
+    # 1. スナップショット後の追記は置き換え後も残る
+    print("\n1. 先頭4件を要約に置き換え")
+    epoch, items, summary_present = await session.get_compaction_snapshot()
+    assert len(items) == 6 and not summary_present
+    await session.add_items([{"role": "user", "content": "Message7"}])
+    summary = {"role": "system", "content": "【これまでの会話の要約】\nMessage1〜4"}
+    assert await session.replace_prefix_with_summary(epoch, 4, summary), "置き換えは成功するべき"
+    
+    items = await session.get_items()
+    print(f"   現在の履歴: {[item['content'][:12] for item in items]}")
+    assert items[0] == summary and len(items) == 4, "要約 + 残り3件になるべき"
+    assert session.summary_present, "要約があることが分かるべき"
+    archived = await session.get_archived_items()
+    assert [item["content"] for item in archived] == [f"Message{i+1}" for i in range(4)]
+    
+    # 2. pop後の古いスナップショットでは置き換えない
+    print("\n2. 古いスナップショットでの置き換えを拒否")
+    epoch, _, _ = await session.get_compaction_snapshot()
+    await session.pop_item()
+    assert not await session.replace_prefix_with_summary(epoch, 2, summary), "古いスナップショットは拒否されるべき"
+    
+    # 3. セッション情報に反映される
+    info = await session.get_session_info()
+    print(f"   セッション情報: {info}")
+    assert info["summary_present"] and info["archived_count"] == 4
+    
+    # 4. 要約できるものがなかったセッションは、書き込みのたびに読み直さない
+    print("\n4. 要約対象がない場合の再試行")
+    from session_compaction import SessionCompactor
+    compactor = SessionCompactor(summarizer=object(), max_items=2, keep_recent=10)
+    busy = RedisSession(f"compact-{uuid.uuid4()}", compactor=compactor)
+    snapshots = 0
+    original_snapshot = busy.get_compaction_snapshot
+    
+    async def counting_snapshot():
+        nonlocal snapshots
+        snapshots += 1
+        return await original_snapshot()
+    
+    busy.get_compaction_snapshot = counting_snapshot
+    for i in range(12):
+        await busy.add_items([{"role": "user", "content": f"Message{i+1}"}])
+        await compactor.wait()
+    print(f"   スナップショット: {snapshots}回")
+    assert snapshots == 1, "直近のアイテムだけのセッションは1回だけ確認するべき"
+    await busy.clear_session()
+    await busy.close()
+    
+    # 5. マネージャーを渡すと、閉じたセッションの要約もプールの接続で行う
+    print("\n5. セッションを閉じた後の要約")
+    manager = RedisSessionManager()
+    pooled = SessionCompactor(summarizer=object(), max_items=2, keep_recent=10, manager=manager)
+    closed = manager.session(f"compact-{uuid.uuid4()}", compactor=pooled)
+    await closed.add_items([{"role": "user", "content": f"Message{i+1}"} for i in range(3)])
+    await closed.close()
+    original_from_url = redis_session_module.redis.from_url
+    
+    def private_client(*args, **kwargs):
+        raise AssertionError("プール外の接続を作らないべき")
+    
+    redis_session_module.redis.from_url = private_client
+    try:
+        await pooled.wait()
+    finally:
+        redis_session_module.redis.from_url = original_from_url
+    assert pooled._retry_at[closed.session_id] == 13, "要約の確認は実行されるべき"
+    assert closed._client is manager.get_client(closed.redis_url), "閉じても共有の接続を保持するべき"
+    await closed.clear_session()
+    await manager.close()
+    
+    # クリーンアップ
+    await session.clear_session()
+    await session.close()
+    
+    print("\n✅ 履歴要約置き換えテスト完了")
+
+
+async def test_token_budget():
+    """トークン予算による履歴取得のテスト"""
+    print("\n\n=== トークン予算テスト ===\n")
+    
+    session_id = f"tokens-{uuid.uuid4()}"
+    print(f"テストセッションID: {session_id}")
+    
+    # 文字数をそのままトークン数とするカウンター
+    session = RedisSession(session_id, token_counter=lambda item: len(item["content"]))
+    await session.add_items([
+        {"role": "user", "content": "a" * 10},
+        {"role": "assistant", "content": "b" * 50},
+        {"role": "user", "content": "c" * 20},
+        {"role": "assistant", "content": "d" * 30},
+    ])
+    
+    # 1. 予算内に収まる直近のアイテムのみ取得
+    print("\n1. 予算60トークンで取得")
+    items = await session.get_items(max_tokens=60)
+    print(f"   取得したアイテム: {[item['content'][0] for item in items]}")
+    assert [item["content"][0] for item in items] == ["c", "d"], "直近の2件(50トークン)のみ取得されるべき"
+    
+    # 2. 予算が十分なら全件
+    items = await session.get_items(max_tokens=1000)
+    assert len(items) == 4, "すべて取得されるべき"
+    
+    # 3. pop後もトークン数の対応が保たれる
+    print("\n2. pop後に予算40トークンで取得")
+    await session.pop_item()
+    items = await session.get_items(max_tokens=40)
+    assert [item["content"][0] for item in items] == ["c"], "popしたアイテムのトークン数も除かれるべき"
+    
+    # 4. デフォルト予算付きのビュー（Runner.run用）
+    budget_view = session.with_token_budget(75)
+    items = await budget_view.get_items()
+    assert [item["content"][0] for item in items] == ["b", "c"], "ビューの予算が適用されるべき"
+    
+    # 接続前のセッションから作ったビューは元のセッションの接続を使う（閉じるのは元のセッション）
+    fresh = RedisSession(session_id)
+    fresh_view = fresh.with_token_budget(75)
+    assert len(await fresh_view.get_items()) == 2
+    assert fresh._client is not None and fresh_view._client is fresh._client, "ビューは元のセッションの接続を使うべき"
+    await fresh.close()
+    
+    # クリーンアップ
+    await session.clear_session()
+    await session.close()
+    
+    print("\n✅ トークン予算テスト完了")
+
+
+async def test_ttl_policy():
+    """TTLポリシー（更新の間引き、バッチ更新、最大寿命）のテスト"""
+    print("\n\n=== TTLポリシーテスト ===\n")
+    
+    session_id = f"ttl-{uuid.uuid4()}"
+    print(f"テストセッションID: {session_id}")
+    
+    # 1. 書き込み直後のextend_ttlはRedisに送られない
+    print("\n1. 書き込み直後のTTL延長")
+    policy = TTLPolicy(ttl_seconds=600, touch_interval=60)
+    refresher = TTLRefresher(flush_interval=0.05)
+    session = RedisSession(session_id, ttl_policy=policy, ttl_refresher=refresher)
+    await session.add_items([{"role": "user", "content": "こんにちは"}])
+    await session.extend_ttl()
+    await asyncio.sleep(0.1)
+    assert refresher.touches == 0, "書き込みでTTLが更新済みなので延長は不要"
+    
+    # 2. 間隔が過ぎたら、同じ接続を使う複数セッションの延長をまとめて1回で送る
+    print("\n2. 複数セッションのバッチ更新")
+    client = await session._get_client()
+    other = RedisSession(f"{session_id}-other", client=client, ttl_policy=policy, ttl_refresher=refresher)
+    await other.add_items([{"role": "user", "content": "こんにちは"}])
+    policy.touch_interval = 0
+    await client.expire(session._key, 100)
+    await session.extend_ttl()
+    await other.extend_ttl()
+    await session.extend_ttl()
+    await asyncio.sleep(0.1)
+    print(f"   送信回数: {refresher.flushes}, 延長したセッション数: {refresher.touches}")
+    assert refresher.flushes == 1 and refresher.touches == 2, "同じセッションの延長はまとめられるべき"
+    info = await session.get_session_info()
+    assert info["ttl_seconds"] > 100, "TTLが延長されるべき"
+    
+    # 3. ハイブリッドでは最大寿命を超えない
+    print("\n3. ハイブリッドの最大寿命")
+    hybrid = RedisSession(
+        f"{session_id}-hybrid",
+        ttl_policy=TTLPolicy(mode="hybrid", ttl_seconds=600, max_lifetime_seconds=120, touch_interval=0)
+    )
+    await hybrid.add_items([{"role": "user", "content": "こんにちは"}])
+    await hybrid.extend_ttl()
+    info = await hybrid.get_session_info()
+    print(f"   TTL: {info['ttl_seconds']}秒")
+    assert 0 < info["ttl_seconds"] <= 120, "最大寿命でTTLが打ち切られるべき"
+    
+    # 4. 存在しないセッションの延長でキーは作られない
+    print("\n4. 存在しないセッションの延長")
+    missing = RedisSession(f"{session_id}-missing", ttl_policy=TTLPolicy(touch_interval=0))
+    await missing.extend_ttl()
+    assert not (await missing.get_session_info())["exists"]
+    
+    # 5. 送信に失敗した接続の延長は失われず、他の接続の延長は送られる
+    print("\n5. 送信失敗時の延長")
+    
+    class BrokenClient:
+        def register_script(self, script):
+            raise RedisConnectionError("テスト用の障害")
+    
+    broken = BrokenClient()
+    failing = TTLRefresher(flush_interval=3600)
+    failing.schedule(broken, ["broken-session"], policy.script_args())
+    failing.schedule(client, [session._key], policy.script_args())
+    try:
+        await failing.flush()
+        assert False, "送信の失敗は例外になるべき"
+    except RedisConnectionError:
+        pass
+    assert failing.touches == 1, "正常な接続の延長は送られるべき"
+    assert list(failing._pending[id(broken)][1]) == ["broken-session"], "失敗した延長は次の送信に残るべき"
+    failing._pending.clear()
+    
+    # 間隔が過ぎたセッションの記録は古いものから捨てる
+    touched = TTLPolicy(touch_interval=60)
+    for key in ("a", "b", "c"):
+        touched.mark_touched(key)
+    touched._touched["a"] -= 120
+    touched.mark_touched("b")
+    assert list(touched._touched) == ["c", "b"], "間隔が過ぎた記録は捨てるべき"
+    
+    # クリーンアップ
+    for s in (other, hybrid, missing, session):
+        await s.clear_session()
+        await s.close()
+    
+    print("\n✅ TTLポリシーテスト完了")
+
+
+async def test_answer_cache():
+    """専門家の回答キャッシュのテスト"""
+    print("\n\n=== 回答キャッシュテスト ===\n")
+    
+    manager = RedisSessionManager()
+    expert = f"Expert-{uuid.uuid4()}"
+    instructions = "あなたはテスト用の専門家です。"
+    cache = AnswerCache(manager.get_client(), max_entries=2, similarity=0.6)
+    
+    # 1. 未保存の質問はミス
+    print("\n1. 保存前の検索")
+    assert await cache.get(expert, instructions, "Dockerとは") is None, "保存前はミスであるべき"
+    
+    # 2. 表記ゆれ（全角/半角、記号）は同じ質問として扱う
+    print("\n2. 保存して表記ゆれで検索")
+    await cache.put(expert, instructions, "Dockerとは？", "コンテナ技術です。", latency_ms=1500)
+    cached = await cache.get(expert, instructions, "ｄｏｃｋｅｒとは")
+    assert cached is not None and cached.answer == "コンテナ技術です。", "正規化した質問でヒットするべき"
+    assert cached.similarity == 1.0
+    
+    # 3. 似た質問は類似度でヒット、インストラクションが変わればミス
+    print("\n3. 類似質問とインストラクション変更")
+    cached = await cache.get(expert, instructions, "Dockerとは何")
+    print(f"   類似度: {cached.similarity if cached else None}")
+    assert cached is not None and cached.similarity < 1.0, "類似した質問はヒットするべき"
+    assert await cache.get(expert, instructions + "更新", "Dockerとは") is None, "インストラクションが変われば別のキャッシュ"
+    
+    # 4. 上限を超えると古い回答から削除
+    print("\n4. 上限による削除")
+    await cache.put(expert, instructions, "Kubernetesとは", "オーケストレーターです。", latency_ms=800)
+    await cache.put(expert, instructions, "Terraformとは", "IaCツールです。", latency_ms=900)
+    assert await cache.get(expert, instructions, "Dockerとは") is None, "最も古い回答は削除されるべき"
+    assert await cache.get(expert, instructions, "Terraformとは") is not None
+    
+    stats = cache.stats()
+    print(f"   統計: {stats}")
+    assert stats["hits"] == 2 and stats["near_hits"] == 1
+    assert stats["evictions"] == 1
+    assert stats["latency_saved_ms"] == 1500 * 2 + 900
+    
+    # 5. 類似度の比較は新しい質問から上限件数まで
+    print("\n5. 類似度を比較する件数の上限")
+    capped = AnswerCache(manager.get_client(), similarity=0.6, max_candidates=1)
+    assert await capped.get(expert, instructions, "Kubernetesとは何") is None, "上限より古い質問とは比較しないべき"
+    assert await capped.get(expert, instructions, "Terraformとは何") is not None, "最新の質問とは比較するべき"
+    
+    # クリーンアップ
+    client = manager.get_client()
+    await client.delete(*await client.keys(f"openai_agent_answer:{{{expert}:*"))
+    await manager.close()
+    
+    print("\n✅ 回答キャッシュテスト完了")
+
+
+async def test_instrumentation():
+    """Redis操作の計測（サンプリング、アイテム数、バイト数）のテスト"""
+    print("\n\n=== Redis操作の計測テスト ===\n")
+    
+    session_id = f"trace-{uuid.uuid4()}"
+    print(f"テストセッションID: {session_id}")
+    
+    # 1. 全件サンプリングで各操作のアイテム数とバイト数が記録される
+    print("\n1. 全件サンプリング")
+    instrumentation = SessionInstrumentation(sample_rate=1.0, spans=False)
+    manager = RedisSessionManager(instrumentation=instrumentation)
+    session = manager.session(session_id)
+    await session.add_items([
+        {"role": "user", "content": "こんにちは"},
+        {"role": "assistant", "content": "こんにちは！"}
+    ])
+    await session.get_items()
+    await session.pop_item()
+    await session.get_session_info()
+    
+    stats = instrumentation.stats()
+    print(f"   統計: {stats}")
+    assert stats["add_items"]["calls"] == 1 and stats["add_items"]["items"] == 2
+    assert stats["get_items"]["items"] == 2 and stats["get_items"]["bytes"] > 0
+    assert stats["pop_item"]["items"] == 1
+    assert stats["get_session_info"]["items"] == 0, "アイテムを読まない操作は0件"
+    assert all(totals["duration_ms"] > 0 for totals in stats.values())
+    
+    # 2. サンプリング率0では何も記録されない
+    print("\n2. サンプリング率0")
+    instrumentation.sample_rate = 0
+    await session.get_items()
+    assert instrumentation.stats()["get_items"]["calls"] == 1, "サンプリングされない操作は記録されない"
+    
+    # クリーンアップ
+    await session.clear_session()
+    await session.close()
+    await manager.close()
+    
+    print("\n✅ Redis操作の計測テスト完了")
+
+
+async def test_session_admin():
+    """SCANによるセッションの一括管理（絞り込み、有効期限の設定、削除）のテスト"""
+    print("\n\n=== セッション一括管理テスト ===\n")
+    
+    prefix = f"admin-{uuid.uuid4().hex[:8]}-"
+    manager = RedisSessionManager()
+    for index in range(6):
+        session = manager.session(f"{prefix}{index}")
+        await session.add_items([{"role": "user", "content": f"質問{n}"} for n in range(index + 1)])
+    
+    client = manager.get_client()
+    admin = SessionAdmin(client, batch_size=2, rate=0)
+    
+    # 1. 接頭辞とアイテム数で絞り込む（補助キーは数えない）
+    print("1. 絞り込み")
+    records = []
+    async for batch in admin.scan(SessionFilter(prefix=prefix, min_items=4)):
+        records.extend(batch)
+    print(f"   該当: {sorted(record.session_id for record in records)}")
+    assert sorted(record.items for record in records) == [4, 5, 6]
+    assert all(record.ttl_seconds is not None for record in records)
+    
+    # 2. 有効期限の一括設定
+    print("\n2. 有効期限の設定")
+    assert await admin.expire(records, 60) == 3
+    for record in records:
+        assert 0 < await client.ttl(f"openai_agent_session:{record.session_id}") <= 60
+    
+    # 3. 補助キーごと一括削除
+    print("\n3. 削除")
+    assert await admin.delete(records) == 3
+    remaining = []
+    async for batch in admin.scan(SessionFilter(prefix=prefix)):
+        remaining.extend(batch)
+    assert sorted(record.items for record in remaining) == [1, 2, 3]
+    assert not await client.exists(f"openai_agent_session:{records[0].session_id}:meta")
+    
+    # クリーンアップ
+    await admin.delete(remaining)
+    await manager.close()
+    
+    print("\n✅ セッション一括管理テスト完了")
+
+
+async def test_stream_session():
+    """Redis Streamsのセッション（安定したエントリID、差分読み込み）のテスト"""
+    print("\n\n=== Redis Streamsセッションテスト ===\n")
+    
+    session_id = f"stream-{uuid.uuid4()}"
+    session = await create_redis_stream_session(session_id, max_items=1000)
+    
+    # 1. 追加したアイテムにIDが振られ、その後のアイテムだけを読める
+    print("1. 差分読み込み")
+    first_ids = await session.add_items([
+        {"role": "user", "content": "こんにちは"},
+        {"role": "assistant", "content": "こんにちは！"}
+    ])
+    new_ids = await session.add_items([{"role": "user", "content": "天気は？"}])
+    print(f"   エントリID: {first_ids + new_ids}")
+    since = await session.get_items_since(first_ids[-1])
+    assert [entry_id for entry_id, _ in since] == new_ids
+    assert since[0][1]["content"] == "天気は？"
+    assert await session.get_items_since(new_ids[-1]) == [], "新しいエントリがなければ空"
+    assert [item["content"] for item in await session.get_items(limit=2)] == ["こんにちは！", "天気は？"]
+    
+    # 2. pop_itemとclear_sessionの後もIDは再利用されない
+    print("\n2. IDの単調増加")
+    popped = await session.pop_item()
+    assert popped["content"] == "天気は？"
+    await session.clear_session()
+    assert await session.get_items() == []
+    later_ids = await session.add_items([{"role": "user", "content": "もう一度"}])
+    assert later_ids[0] != new_ids[0]
+    since = await session.get_items_since(new_ids[-1])
+    assert [item["content"] for _, item in since] == ["もう一度"], "削除後に追加したエントリも差分として読める"
+    
+    info = await session.get_session_info()
+    print(f"   セッション情報: {info}")
+    assert info["item_count"] == 1 and info["last_entry_id"] == later_ids[0]
+    assert info["ttl_seconds"] is not None
+    
+    # クリーンアップ
+    await session.clear_session()
+    await session.close()
+    
+    print("\n✅ Redis Streamsセッションテスト完了")
+
+
+async def test_tiered_session():
+    """ローカルの書き込みログ経由のセッション（障害中の書き込み、順序、復旧）のテスト"""
+    print("\n\n=== 階層セッションテスト ===\n")
+    
+    manager = RedisSessionManager()
+    log_path = os.path.join(tempfile.mkdtemp(), "session_log.sqlite3")
+    # 自動の反映は止め、flush()を明示的に呼ぶ
+    store = TieredSessionStore(manager, log_path=log_path, flush_interval=3600)
+    session_id = f"tiered-{uuid.uuid4()}"
+    session = await create_redis_session(session_id, restore_existing=False, manager=manager, tiered=store)
+    redis_session = session.redis_session
+    
+    # 1. 書き込みはローカルで確定し、Redisにはflushで届く
+    print("1. 書き込みの遅延反映")
+    await session.add_items([{"role": "user", "content": "こんにちは"}])
+    await session.add_items([{"role": "assistant", "content": "こんにちは！"}])
+    assert [item["content"] for item in await session.get_items()] == ["こんにちは", "こんにちは！"]
+    assert store.pending_ops(session_id) == 3, "clear_sessionと2回の追加が未反映"
+    assert await redis_session.get_items() == []
+    print(f"   反映: {await store.flush()}件")
+    assert [item["content"] for item in await redis_session.get_items()] == ["こんにちは", "こんにちは！"]
+    
+    # 2. Redisの障害中も書き込みとローカルの読み込みは成功する
+    print("\n2. 障害中の書き込み")
+    add_items = redis_session.add_items
+    
+    async def unavailable(items, authors=None):
+        raise RedisConnectionError("テスト用の障害")
+    
+    redis_session.add_items = unavailable
+    await session.add_items([{"role": "user", "content": "天気は？"}])
+    await store.flush()
+    assert not store.redis_available
+    await session.add_items([{"role": "assistant", "content": "晴れです"}])
+    popped = await session.pop_item()
+    assert popped["content"] == "晴れです"
+    await session.add_items([{"role": "assistant", "content": "曇りです"}])
+    info = await session.get_session_info()
+    print(f"   セッション情報: {info}")
+    assert info["item_count"] == 4 and info["pending_ops"] == 4
+    
+    # 3. 復旧後は記録した順に反映され、Redisとローカルが一致する
+    print("\n3. 復旧と順序")
+    redis_session.add_items = add_items
+    await store.flush()
+    assert store.redis_available and store.pending_ops() == 0
+    assert await store.reconcile() == 0
+    expected = ["こんにちは", "こんにちは！", "天気は？", "曇りです"]
+    assert [item["content"] for item in await redis_session.get_items()] == expected
+    assert [item["content"] for item in await session.get_items()] == expected
+    print(f"   統計: {store.stats()}")
+    
+    # 4. 返したアイテムを変更してもローカルの履歴は変わらない
+    print("\n4. 返したアイテムの変更")
+    (await session.get_items())[0]["content"] = "変更"
+    authored, _ = await session.get_authored_items()
+    authored[1]["content"] = "変更"
+    assert [item["content"] for item in await session.get_items()] == expected
+    
+    # クリーンアップ
+    await redis_session.clear_session()
+    await session.close()
+    await store.close()
+    await manager.close()
+    
+    print("\n✅ 階層セッションテスト完了")
+
+
+async def test_session_turn():
+    """ターン単位の書き込み（まとめて保存、ターン中の読み込み、失敗時の破棄）のテスト"""
+    print("\n\n=== ターン単位の書き込みテスト ===\n")
+    
+    session_id = f"turn-{uuid.uuid4()}"
+    session = await create_redis_session(session_id, restore_existing=False)
+    other = RedisSession(session_id)
+    await session.add_items([{"role": "user", "content": "以前の質問"}])
+    
+    # 1. ターン中の書き込みはRedisに送られず、同じセッションとビューからは読める
+    print("1. ターン中の読み込み")
+    async with session.turn():
+        view = session.with_token_budget(None)
+        await view.add_items([{"role": "user", "content": "天気は？"}])
+        await view.add_items([{"role": "assistant", "content": "晴れです"}])
+        assert [item["content"] for item in await session.get_items()] == ["以前の質問", "天気は？", "晴れです"]
+        assert [item["content"] for item in await session.get_items(limit=2)] == ["天気は？", "晴れです"]
+        assert [item["content"] for item in await session.get_items(limit=3)] == ["以前の質問", "天気は？", "晴れです"]
+        assert len(await session.get_items(max_tokens=10**6)) == 3
+        assert len(await other.get_items()) == 1, "コミット前は他の接続から見えない"
+    
+    # 2. コミットは1回の書き込み
+    print("\n2. まとめて保存")
+    client = await other._get_client()
+    version = await client.hget(other._meta_key, "version")
+    print(f"   version: {version}")
+    assert version == b"2", "初回の追加とターンの1回"
+    assert [item["content"] for item in await other.get_items()] == ["以前の質問", "天気は？", "晴れです"]
+    
+    # 3. 失敗したターンは何も保存しない
+    print("\n3. 失敗時の破棄")
+    try:
+        async with session.turn():
+            await session.add_items([{"role": "user", "content": "途中で失敗"}])
+            raise RuntimeError("テスト用のエラー")
+    except RuntimeError:
+        pass
+    assert not session.in_turn
+    assert len(await other.get_items()) == 3
+    
+    # クリーンアップ
+    await session.clear_session()
+    await session.close()
+    await other.close()
+    
+    print("\n✅ ターン単位の書き込みテスト完了")
+
+
+async def test_blob_offload():
+    """大きな値を内容のハッシュで別キーに保存するテスト（重複排除、読み込み、有効期限）"""
+    print("\n\n=== 大きな値の分離テスト ===\n")
+    
+    manager = RedisSessionManager()
+    client = manager.get_client()
+    blobs = BlobOffload(threshold=1024)
+    answer = "キャッシュされた長い回答です。" * 200
+    output = {"type": "function_call_output", "call_id": "call_1", "output": "x" * 5000}
+    message = {
+        "type": "message",
+        "role": "assistant",
+        "content": [{"type": "output_text", "text": answer, "annotations": []}]
+    }
+    sessions = [manager.session(f"blob-{uuid.uuid4()}", blobs=blobs) for _ in range(2)]
+    for session in sessions:
+        await session.add_items([{"role": "user", "content": "質問"}, message, output])
+    
+    # 1. 取得したアイテムは元のまま
+    print("1. 読み込み")
+    for session in sessions:
+        items = await session.get_items()
+        assert items[1] == message and items[2] == output
+        assert (await session.get_items(limit=1))[0] == output
+    assert await sessions[0].pop_item() == output
+    
+    # 2. リストには参照だけが残り、同じ内容は1つのキーを共有する
+    print("\n2. 重複排除")
+    stored = await client.lrange(sessions[1]._key, 0, -1)
+    print(f"   リストのサイズ: {sum(len(entry) for entry in stored)}バイト")
+    assert sum(len(entry) for entry in stored) < 1024
+    digests = await client.smembers(sessions[1]._blobs_key)
+    assert len(digests) == 2
+    assert digests == await client.smembers(sessions[0]._blobs_key)
+    
+    # 3. セッションの有効期限を延ばすと参照している値も延びる
+    print("\n3. 有効期限")
+    await sessions[1].extend_ttl(sessions[1].ttl_seconds * 2)
+    for digest in digests:
+        ttl = await client.ttl(sessions[1]._blob_prefix + digest.decode())
+        print(f"   {digest.decode()[:12]}...: {ttl}秒")
+        assert ttl > sessions[1].ttl_seconds
+    
+    # 分離しない設定のセッションからも読める
+    plain = RedisSession(sessions[1].session_id, client=client)
+    assert (await plain.get_items())[1] == message
+    
+    # クリーンアップ
+    for session in sessions:
+        await session.clear_session()
+    await manager.close()
+    
+    print("\n✅ 大きな値の分離テスト完了")
+
+
+async def test_session_views():
+    """発言者を記録し、専門家ごとに絞り込んだ履歴を返すテスト"""
+    print("\n\n=== 専門家ごとの会話履歴テスト ===\n")
+    
+    manager = RedisSessionManager()
+    session = manager.session(f"views-{uuid.uuid4()}")
+    
+    # 1. 発言者なしの古いアイテムと発言者付きのアイテムが混在しても読める
+    print("1. 発言者の記録")
+    await session.add_items([{"role": "user", "content": "以前の質問"}, {"role": "assistant", "content": "以前の回答"}])
+    facilitator = SessionView(session, "Facilitator")
+    async with session.turn():
+        await facilitator.add_items([{"role": "user", "content": "質問"}, {"role": "assistant", "content": "司会者の発言"}])
+        await session.add_items(
+            [{"role": "user", "content": "DBへの質問"}, {"role": "assistant", "content": "DBの回答"}],
+            ["Database Expert", "Database Expert"]
+        )
+        # ターン中は未保存のアイテムも発言者付きで返る
+        items, authors = await session.get_authored_items()
+        assert authors[-4:] == [USER_AUTHOR, "Facilitator", "Database Expert", "Database Expert"]
+    items, authors = await session.get_authored_items()
+    print(f"   発言者: {authors}")
+    assert len(items) == 6
+    assert authors == [None, None, USER_AUTHOR, "Facilitator", "Database Expert", "Database Expert"]
+    
+    # 2. 発言者付きのトークン数でもトークン予算で読める
+    print("\n2. トークン予算")
+    budget = sum(session.token_counter(item) for item in items[-2:])
+    assert await session.get_items(max_tokens=budget) == items[-2:]
+    
+    # 3. 専門家のビューは規則に合う発言だけを返す
+    print("\n3. 絞り込み")
+    view = SessionView(session, "Python Expert", HistoryRule(user_turns=1, include=frozenset(["Facilitator"])))
+    projected = [item["content"] for item in await view.get_items()]
+    print(f"   Python Expertの履歴: {projected}")
+    assert projected == ["質問", "司会者の発言"]
+    assert await view.get_items(limit=0) == []
+    
+    # ローカルキャッシュがあっても同じ発言者を返し、トークン予算はセッションのカウンターで数える
+    cached = RedisSession(
+        session.session_id, client=await session._get_client(),
+        cache=SessionItemCache(max_bytes=1024 * 1024), token_counter=lambda item: 10
+    )
+    assert await cached.get_authored_items() == (items, authors)
+    await cached.get_items()
+    assert await cached.get_authored_items() == (items, authors), "キャッシュから読んでも一致するべき"
+    budgeted = SessionView(cached, "Database Expert", HistoryRule(include=frozenset(), max_tokens=25))
+    assert [item["content"] for item in await budgeted.get_items()] == ["DBへの質問", "DBの回答"]
+    
+    # 4. 階層セッションでもローカルのコピーとRedisで発言者が一致する
+    print("\n4. 階層セッション")
+    store = TieredSessionStore(
+        manager, log_path=os.path.join(tempfile.mkdtemp(), "session_log.sqlite3"), flush_interval=3600
+    )
+    tiered = await create_redis_session(session.session_id, manager=manager, tiered=store)
+    await tiered.add_items([{"role": "assistant", "content": "Pythonの回答"}], ["Python Expert"])
+    assert (await tiered.get_authored_items())[1][-1] == "Python Expert"
+    await store.flush()
+    assert (await session.get_authored_items())[1][-1] == "Python Expert"
+    await tiered.close()
+    await store.close()
+    
+    # クリーンアップ
+    await session.clear_session()
+    await manager.close()
+    
+    print("\n✅ 専門家ごとの会話履歴テスト完了")
+
+
 async def main():
     """すべてのテストを実行"""
     print("RedisSessionテストを開始します...\n")
@@ -175,6 +963,48 @@ async def main():
         # 並行アクセステスト
         await test_concurrent_access()
         
+        # 最大アイテム数トリムテスト
+        await test_max_items_trim()
+        
+        # 共有接続プールテスト
+        await test_session_manager_pool()
+        
+        # ローカルキャッシュテスト
+        await test_item_cache()
+        
+        # 履歴要約置き換えテスト
+        await test_summary_replacement()
+        
+        # トークン予算テスト
+        await test_token_budget()
+        
+        # TTLポリシーテスト
+        await test_ttl_policy()
+        
+        # 回答キャッシュテスト
+        await test_answer_cache()
+        
+        # Redis操作の計測テスト
+        await test_instrumentation()
+        
+        # セッション一括管理テスト
+        await test_session_admin()
+        
+        # Redis Streamsセッションテスト
+        await test_stream_session()
+        
+        # 階層セッションテスト
+        await test_tiered_session()
+        
+        # ターン単位の書き込みテスト
+        await test_session_turn()
+        
+        # 大きな値の分離テスト
+        await test_blob_offload()
+        
+        # 専門家ごとの会話履歴テスト
+        await test_session_views()
+        
         print("\n\n🎉 すべてのテストが成功しました！")
         
     except AssertionError as e:
@@ -0,0 +1,66 @@
+"""
+セッションアイテムのコーデックのテスト
+"""
+import json
+from session_codec import CODECS, ItemCodec, decode_item, zstandard
+
+
+SAMPLE_ITEMS = [
+    {"role": "user", "content": "Pythonのデコレータについて教えて"},
+    {"role": "assistant", "content": [{"type": "output_text", "text": "Python Expertです。" + "デコレータは関数を受け取る関数です。" * 200}]},
+]
+
+
+def available_codecs():
+    """インストールされているパッケージで使えるコーデック"""
+    codecs = []
+    for codec_class in CODECS.values():
+        try:
+            codecs.append(codec_class(compress_threshold=0))
+            if zstandard is not None:
+                codecs.append(codec_class(compress_threshold=256))
+        except RuntimeError:
+            continue
+    return codecs
+
+
+def test_round_trip():
+    """すべてのコーデックでエンコード/デコードが一致するか"""
+    print("=== コーデック往復テスト ===\n")
+    for codec in available_codecs():
+        for item in SAMPLE_ITEMS:
+            assert decode_item(codec.encode(item)) == item, f"{codec.name}で内容が一致するべき"
+        print(f"   {codec.name} (圧縮閾値: {codec.compress_threshold}): ✓")
+    print("\n✅ コーデック往復テスト完了")
+
+
+def test_legacy_entries():
+    """コーデック導入前のJSON文字列も読めるか"""
+    print("\n=== 旧形式互換テスト ===\n")
+    for item in SAMPLE_ITEMS:
+        legacy = json.dumps(item, ensure_ascii=False)
+        assert decode_item(legacy) == item, "旧形式(str)を読めるべき"
+        assert decode_item(legacy.encode("utf-8")) == item, "旧形式(bytes)を読めるべき"
+        # JSONコーデックは旧形式と同じ形式で書き込む
+        assert ItemCodec().encode(item) == legacy.encode("utf-8")
+    print("\n✅ 旧形式互換テスト完了")
+
+
+def test_compression_threshold():
+    """閾値未満のアイテムは圧縮されないか"""
+    print("\n=== 圧縮閾値テスト ===\n")
+    if zstandard is None:
+        print("   zstandard未インストールのためスキップ")
+        return
+    codec = ItemCodec(compress_threshold=256)
+    small, large = SAMPLE_ITEMS
+    assert codec.encode(small)[:1] != b"Z", "小さいアイテムは圧縮しないべき"
+    assert codec.encode(large)[:1] == b"Z", "大きいアイテムは圧縮するべき"
+    assert len(codec.encode(large)) < len(ItemCodec().encode(large))
+    print("\n✅ 圧縮閾値テスト完了")
+
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_legacy_entries()
+    test_compression_threshold()
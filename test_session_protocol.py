@@ -4,6 +4,7 @@ Session protocolの互換性をテスト
 import asyncio
 from typing import Protocol, List, Dict, Any, runtime_checkable
 from redis_session import RedisSession, create_redis_session
+from redis_stream_session import RedisStreamSession, create_redis_stream_session
 from agents import Session, Agent, Runner
 import uuid
 
@@ -85,6 +86,53 @@ async def test_protocol_compliance():
     print(f"   add_items: {add_items_sig}")
 
 
+async def test_stream_protocol_compliance():
+    """RedisStreamSessionもRedisSessionと同じSession protocolで使えるかテスト"""
+    print("\n\n=== RedisStreamSession Protocol互換性テスト ===\n")
+    
+    session_id = f"test-stream-protocol-{uuid.uuid4()}"
+    stream_session = await create_redis_stream_session(session_id)
+    
+    # 1. Protocolチェック
+    is_compliant = isinstance(stream_session, SessionProtocol)
+    print(f"1. RedisStreamSessionはSessionProtocolに準拠？: {is_compliant}")
+    assert is_compliant
+    
+    # 2. RedisSessionと同じ呼び出し方ができるか
+    print("\n2. シグネチャの比較:")
+    import inspect
+    for method in ['get_items', 'add_items', 'pop_item', 'clear_session']:
+        list_params = list(inspect.signature(getattr(RedisSession, method)).parameters)
+        stream_params = list(inspect.signature(getattr(RedisStreamSession, method)).parameters)
+        print(f"   - {method}: {stream_params}")
+        assert stream_params[:len(list_params)] == list_params[:len(stream_params)]
+    
+    # 3. 実際の使用テスト
+    print("\n3. 実際の使用テスト:")
+    test_agent = Agent(
+        name="Test Agent",
+        instructions="You are a test agent. Just respond with 'Test response'."
+    )
+    
+    try:
+        result = await Runner.run(
+            test_agent,
+            "Test message",
+            session=stream_session
+        )
+        print(f"   Runner.run成功: {result.final_output[:50]}...")
+        
+        entries = await stream_session.get_entries()
+        print(f"   セッション内のアイテム数: {len(entries)}（最新のID: {entries[-1][0] if entries else None}）")
+        
+    except Exception as e:
+        print(f"   エラー: {type(e).__name__}: {e}")
+    
+    finally:
+        await stream_session.clear_session()
+        await stream_session.close()
+
+
 async def test_with_typing():
     """型チェックでの互換性テスト"""
     print("\n\n=== 型チェック互換性テスト ===\n")
@@ -107,4 +155,5 @@ async def test_with_typing():
 
 if __name__ == "__main__":
     asyncio.run(test_protocol_compliance())
+    asyncio.run(test_stream_protocol_compliance())
     asyncio.run(test_with_typing())
\ No newline at end of file
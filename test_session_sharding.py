@@ -0,0 +1,70 @@
+"""
+セッションのキー配置とシャーディングのテスト
+"""
+from redis.crc import key_slot
+
+from redis_session import session_id_from_key, session_keys
+from session_blobs import blob_key_prefix
+from session_sharding import HashRing, ShardedSessionManager
+
+NODES = ["redis://a:6379", "redis://b:6379", "redis://c:6379"]
+SESSION_IDS = [f"user-{index}" for index in range(3000)]
+
+
+def test_hash_tag_keys_share_slot():
+    """ハッシュタグ付きのキーはセッションのすべてのキーが同じスロットになるか"""
+    print("=== キー配置テスト ===\n")
+    for session_id in ["user-1", "会話:42", "a}b"]:
+        keys = session_keys(session_id, hash_tag=True) + [blob_key_prefix(session_id, hash_tag=True) + "0" * 64]
+        slots = {key_slot(key.encode()) for key in keys}
+        print(f"   {keys[0]}: スロット {slots}")
+        assert len(slots) == 1
+        assert session_id_from_key(keys[0], hash_tag=True) == session_id
+
+    # 従来のキーは変わらない
+    assert session_keys("user-1")[0] == "openai_agent_session:user-1"
+    assert session_id_from_key("openai_agent_session:user-1") == "user-1"
+    print("\n✅ キー配置テスト完了")
+
+
+def test_hash_ring_distribution():
+    """セッションがシャードにおおよそ均等に割り当てられ、常に同じシャードになるか"""
+    print("\n=== ハッシュリング分散テスト ===\n")
+    ring = HashRing(NODES)
+    counts = {node: 0 for node in NODES}
+    for session_id in SESSION_IDS:
+        counts[ring.node_for(session_id)] += 1
+    print(f"   割り当て: {counts}")
+    expected = len(SESSION_IDS) / len(NODES)
+    assert all(abs(count - expected) < expected * 0.25 for count in counts.values())
+    assert all(HashRing(NODES).node_for(session_id) == ring.node_for(session_id) for session_id in SESSION_IDS[:100])
+    print("\n✅ ハッシュリング分散テスト完了")
+
+
+def test_adding_node_moves_few_sessions():
+    """シャードを追加したときに移動するのは新しいシャードへのセッションだけか"""
+    print("\n=== シャード追加テスト ===\n")
+    before = HashRing(NODES)
+    after = HashRing(NODES + ["redis://d:6379"])
+    moved = [session_id for session_id in SESSION_IDS if before.node_for(session_id) != after.node_for(session_id)]
+    print(f"   移動: {len(moved)} / {len(SESSION_IDS)}")
+    assert all(after.node_for(session_id) == "redis://d:6379" for session_id in moved)
+    assert len(moved) < len(SESSION_IDS) * 0.35
+    print("\n✅ シャード追加テスト完了")
+
+
+def test_sharded_manager_places_sessions():
+    """ShardedSessionManagerはハッシュリングのシャードにセッションを作るか"""
+    manager = ShardedSessionManager(NODES)
+    for session_id in SESSION_IDS[:20]:
+        session = manager.session(session_id)
+        assert session.redis_url == manager.ring.node_for(session_id)
+        assert session._client is manager.get_client(session.redis_url)
+    assert manager.session("user-1", redis_url=NODES[0]).redis_url == NODES[0], "明示したURLを優先"
+
+
+if __name__ == "__main__":
+    test_hash_tag_keys_share_slot()
+    test_hash_ring_distribution()
+    test_adding_node_moves_few_sessions()
+    test_sharded_manager_places_sessions()
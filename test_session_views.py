@@ -0,0 +1,133 @@
+"""
+専門家ごとの会話履歴の絞り込み（session_views）のテスト
+"""
+import pytest
+
+from session_views import USER_AUTHOR, HistoryProjection, HistoryRule, item_authors, project
+
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+def assistant(text):
+    return {"role": "assistant", "content": text}
+
+
+# 2ターン分の会議: ユーザー → 司会者 → 専門家2人（質問と回答）
+ITEMS = [
+    user("1つ目の質問"),
+    assistant("司会者の発言1"),
+    user("Pythonへの質問1"),
+    assistant("Pythonの回答1"),
+    user("DBへの質問1"),
+    assistant("DBの回答1"),
+    user("2つ目の質問"),
+    assistant("司会者の発言2"),
+    user("Pythonへの質問2"),
+    assistant("Pythonの回答2"),
+]
+AUTHORS = [
+    USER_AUTHOR, "Facilitator", "Python Expert", "Python Expert", "Database Expert", "Database Expert",
+    USER_AUTHOR, "Facilitator", "Python Expert", "Python Expert",
+]
+
+
+def contents(items):
+    return [item["content"] for item in items]
+
+
+def test_unrestricted_rule_keeps_everything():
+    """規則がなければ共有の履歴をそのまま渡すか"""
+    print("=== 制限なしテスト ===\n")
+    assert project(ITEMS, AUTHORS, "Database Expert", HistoryRule()) == ITEMS
+    print("\n✅ 制限なしテスト完了")
+
+
+def test_include_filters_other_experts():
+    """自分・ユーザー・includeの発言者だけを渡すか"""
+    print("\n=== 発言者の絞り込みテスト ===\n")
+    rule = HistoryRule(include=frozenset(["Facilitator"]))
+    projected = contents(project(ITEMS, AUTHORS, "Database Expert", rule))
+    print(projected)
+    assert projected == [
+        "1つ目の質問", "司会者の発言1", "DBへの質問1", "DBの回答1", "2つ目の質問", "司会者の発言2",
+    ]
+    print("\n✅ 発言者の絞り込みテスト完了")
+
+
+def test_user_turns_window():
+    """直近のユーザー発言N回分以降だけを渡すか（専門家への質問はターンの区切りにしない）"""
+    print("\n=== ターン数の制限テスト ===\n")
+    projected = contents(project(ITEMS, AUTHORS, "Python Expert", HistoryRule(user_turns=1)))
+    print(projected)
+    assert projected == ["2つ目の質問", "司会者の発言2", "Pythonへの質問2", "Pythonの回答2"]
+    print("\n✅ ターン数の制限テスト完了")
+
+
+def test_summary_and_token_budget():
+    """要約は範囲外でも残し、トークン上限は絞り込んだ後に適用するか"""
+    print("\n=== 要約とトークン上限テスト ===\n")
+    summary = assistant("【これまでの会話の要約】\n以前の会議")
+    items = [summary] + ITEMS
+    authors = [None] + AUTHORS
+
+    projected = project(items, authors, "Python Expert", HistoryRule(user_turns=1), summary=True)
+    assert projected[0] is summary
+    assert len(projected) == 5
+
+    # 各アイテムを10トークンとして数え、直近の2つだけが収まる
+    budgeted = project(items, authors, "Python Expert", HistoryRule(max_tokens=25), token_counter=lambda item: 10)
+    assert contents(budgeted) == ["Pythonへの質問2", "Pythonの回答2"]
+    print("\n✅ 要約とトークン上限テスト完了")
+
+
+def test_legacy_items_without_authors():
+    """発言者のない古いアイテムはユーザーの発言だけを残すか"""
+    print("\n=== 発言者のないアイテムテスト ===\n")
+    rule = HistoryRule(include=frozenset(["Facilitator"]))
+    authors = [None] * 4 + AUTHORS[4:]
+    projected = contents(project(ITEMS, authors, "Database Expert", rule))
+    print(projected)
+    assert projected[:3] == ["1つ目の質問", "Pythonへの質問1", "DBへの質問1"]
+    assert "Pythonの回答1" not in projected
+    print("\n✅ 発言者のないアイテムテスト完了")
+
+
+def test_item_authors():
+    """エージェントの実行で追加されたアイテムに発言者を付けるか"""
+    items = [user("質問"), {"type": "function_call", "name": "search"}, assistant("回答")]
+    assert item_authors(items, "Facilitator") == [USER_AUTHOR, "Facilitator", "Facilitator"]
+
+
+def test_projection_from_config():
+    """settings.historyを既定とし、専門家のhistoryで項目ごとに上書きするか"""
+    print("\n=== 設定の読み込みテスト ===\n")
+    config = {
+        "experts": [
+            {"name": "Python Expert"},
+            {"name": "Security Expert", "history": {"include": ["Facilitator", "Python Expert"]}},
+        ],
+        "settings": {"history": {"user_turns": 3, "include": ["Facilitator"]}},
+    }
+    projection = HistoryProjection.from_config(config)
+    assert projection.configured
+    assert projection.rule_for("Python Expert") == HistoryRule(user_turns=3, include=frozenset(["Facilitator"]))
+    assert projection.rule_for("Security Expert") == HistoryRule(
+        user_turns=3, include=frozenset(["Facilitator", "Python Expert"])
+    )
+    assert not HistoryProjection.from_config({"experts": [{"name": "Python Expert"}]}).configured
+    print("\n✅ 設定の読み込みテスト完了")
+
+
+@pytest.mark.parametrize("history", [
+    ["Facilitator"],
+    {"user_turns": 0},
+    {"max_tokens": "1000"},
+    {"include": "Facilitator"},
+    {"turns": 3},
+])
+def test_invalid_history_config(history):
+    """不正なhistoryはValueErrorになるか"""
+    with pytest.raises(ValueError):
+        HistoryRule.from_config(history)
@@ -0,0 +1,672 @@
+"""
+Tiered session storage: in-process LRU and a local SQLite log in front of Redis
+
+A TieredSession acknowledges writes once they are appended to a local
+SQLite write-behind log and applied to the in-process copy of the session.
+A background flusher replays the log to Redis in batches, so a slow or
+briefly unavailable Redis does not fail conversation turns. Reads of hot
+sessions are served from the LRU while they are fresh or have unflushed
+writes.
+
+Ordering: operations of a session are applied to Redis in the order they
+were logged, and an operation is removed from the log only after Redis
+acknowledged it. If Redis fails part-way, the rest of that session's
+operations wait for the next flush, so later writes never overtake earlier
+ones. Delivery is at-least-once: if the process dies between a Redis write
+and the log update, that write is replayed on the next start. The
+guarantee holds per log file, so every process needs its own log.
+
+Reconciliation: after an outage the flusher first drains the backlog, then
+compares every hot session with Redis and drops local copies that
+disagree (e.g. because another process wrote the session meanwhile), so
+the next read reloads them from Redis.
+"""
+import asyncio
+import contextlib
+import copy
+import json
+import os
+import sqlite3
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+from redis_session import RedisSession, RedisSessionManager, _TurnBuffer, _copy_items, _drop_orphaned_outputs
+
+if TYPE_CHECKING:
+    from agents.items import TResponseInputItem
+else:
+    TResponseInputItem = Dict[str, Any]
+
+# Errors that mean Redis is unreachable rather than that an operation is invalid
+REDIS_UNAVAILABLE_ERRORS = (RedisConnectionError, RedisTimeoutError, asyncio.TimeoutError, OSError)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    op TEXT NOT NULL,
+    payload TEXT
+);
+CREATE INDEX IF NOT EXISTS pending_session ON pending (session_id, seq);
+"""
+
+
+class _HotSession:
+    """Local copy of a session's items"""
+
+    __slots__ = ("items", "authors", "summary", "loaded_at")
+
+    def __init__(
+        self,
+        items: List[TResponseInputItem],
+        summary: bool = False,
+        authors: Optional[List[Optional[str]]] = None
+    ):
+        self.items = items
+        self.authors = authors if authors is not None else [None] * len(items)
+        self.summary = summary
+        # Monotonic time of the last load from Redis (0 forces a reload)
+        self.loaded_at = time.monotonic()
+
+
+class TieredSessionStore:
+    """Hot-session LRU, write-behind log and flusher shared by all tiered sessions of a process"""
+
+    def __init__(
+        self,
+        manager: RedisSessionManager,
+        log_path: Optional[str] = None,
+        max_sessions: Optional[int] = None,
+        fresh_seconds: Optional[float] = None,
+        flush_interval: Optional[float] = None,
+        batch_size: int = 500
+    ):
+        """
+        Initialize tiered store
+
+        Args:
+            manager: Manager of the Redis sessions the log is flushed to
+            log_path: SQLite file of the write-behind log, one per process
+                (defaults to TIERED_SESSION_LOG env var, .cache/session_log.sqlite3)
+            max_sessions: Hot sessions kept in memory; sessions with unflushed
+                writes are never evicted (defaults to TIERED_SESSION_HOT_SESSIONS
+                env var, 1000)
+            fresh_seconds: How long a clean local copy is served without
+                re-reading Redis (defaults to TIERED_SESSION_FRESH_SECONDS env
+                var, 30)
+            flush_interval: Seconds between flushes; doubles up to 30s while
+                Redis is unavailable (defaults to TIERED_SESSION_FLUSH_INTERVAL
+                env var, 0.2)
+            batch_size: Maximum log entries replayed per flush
+        """
+        self.manager = manager
+        self.log_path = log_path or os.getenv("TIERED_SESSION_LOG", os.path.join(".cache", "session_log.sqlite3"))
+        self.max_sessions = max_sessions or int(os.getenv("TIERED_SESSION_HOT_SESSIONS", "1000"))
+        self.fresh_seconds = (
+            fresh_seconds if fresh_seconds is not None
+            else float(os.getenv("TIERED_SESSION_FRESH_SECONDS", "30"))
+        )
+        self.flush_interval = (
+            flush_interval if flush_interval is not None
+            else float(os.getenv("TIERED_SESSION_FLUSH_INTERVAL", "0.2"))
+        )
+        self.batch_size = batch_size
+
+        if os.path.dirname(self.log_path):
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+        self._db = sqlite3.connect(self.log_path)
+        # WAL without fsync per commit: survives process crashes, not power loss
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        # Unflushed operations per session, including those left by a previous run
+        self._pending: Dict[str, int] = dict(
+            self._db.execute("SELECT session_id, COUNT(*) FROM pending GROUP BY session_id").fetchall()
+        )
+
+        self._hot: "OrderedDict[str, _HotSession]" = OrderedDict()
+        # Open Redis sessions, so flushes go through their compactor
+        self._sessions: Dict[str, RedisSession] = {}
+        # Lock stripes serializing flushes and cold loads of the same session
+        self._locks = [asyncio.Lock() for _ in range(64)]
+        self._task: Optional[asyncio.Task] = None
+
+        self.redis_available = True
+        self._needs_reconcile = False
+        self.outages = 0
+        self.flushes = 0
+        self.flushed_ops = 0
+        self.failed_ops = 0
+        self.local_reads = 0
+        self.redis_reads = 0
+        self.stale_reads = 0
+        self.reconciled = 0
+        self.diverged = 0
+
+    def _lock(self, session_id: str) -> asyncio.Lock:
+        return self._locks[zlib.crc32(session_id.encode("utf-8")) % len(self._locks)]
+
+    def session(self, redis_session: RedisSession) -> "TieredSession":
+        """Put a Redis session behind the local tiers"""
+        self._sessions[redis_session.session_id] = redis_session
+        self._ensure_flusher()
+        return TieredSession(self, redis_session)
+
+    def release(self, redis_session: RedisSession) -> None:
+        """Forget a closed session; its remaining writes are flushed through the manager"""
+        if self._sessions.get(redis_session.session_id) is redis_session:
+            del self._sessions[redis_session.session_id]
+
+    def _redis_session(self, session_id: str) -> RedisSession:
+        return self._sessions.get(session_id) or self.manager.session(session_id)
+
+    # Write-behind log
+
+    def log(
+        self,
+        session_id: str,
+        op: str,
+        items: Optional[List[TResponseInputItem]] = None,
+        authors: Optional[List[Optional[str]]] = None
+    ) -> Optional[str]:
+        """
+        Durably record an operation before acknowledging it
+
+        Returns:
+            The logged payload
+        """
+        payload = None
+        if items is not None:
+            # Adds without authors keep the plain list format of older logs
+            payload = json.dumps({"items": items, "authors": authors} if authors else items, ensure_ascii=False)
+        with self._db:
+            self._db.execute(
+                "INSERT INTO pending (session_id, op, payload) VALUES (?, ?, ?)",
+                (session_id, op, payload)
+            )
+        self._pending[session_id] = self._pending.get(session_id, 0) + 1
+        self._ensure_flusher()
+        return payload
+
+    def pending_ops(self, session_id: Optional[str] = None) -> int:
+        if session_id is None:
+            return sum(self._pending.values())
+        return self._pending.get(session_id, 0)
+
+    def _logged_ops(self, session_id: str) -> List[Tuple[int, str, Optional[str]]]:
+        return self._db.execute(
+            "SELECT seq, op, payload FROM pending WHERE session_id = ? ORDER BY seq",
+            (session_id,)
+        ).fetchall()
+
+    def _forget_ops(self, session_id: str, seqs: List[int]) -> None:
+        with self._db:
+            self._db.executemany("DELETE FROM pending WHERE seq = ?", [(seq,) for seq in seqs])
+        remaining = self._pending.get(session_id, 0) - len(seqs)
+        if remaining > 0:
+            self._pending[session_id] = remaining
+        else:
+            self._pending.pop(session_id, None)
+
+    # Hot sessions
+
+    def get_hot(self, session_id: str) -> Optional[_HotSession]:
+        hot = self._hot.get(session_id)
+        if hot is not None:
+            self._hot.move_to_end(session_id)
+        return hot
+
+    def put_hot(self, session_id: str, hot: _HotSession) -> None:
+        self._hot[session_id] = hot
+        self._hot.move_to_end(session_id)
+        if len(self._hot) > self.max_sessions:
+            # Sessions with unflushed writes stay, their copy is the only complete one
+            for candidate in list(self._hot):
+                if len(self._hot) <= self.max_sessions:
+                    break
+                if not self._pending.get(candidate):
+                    del self._hot[candidate]
+
+    def is_fresh(self, session_id: str, hot: _HotSession) -> bool:
+        return bool(self._pending.get(session_id)) or time.monotonic() - hot.loaded_at < self.fresh_seconds
+
+    async def load(self, session_id: str) -> _HotSession:
+        """Read a session from Redis and replay the operations that have not reached it yet"""
+        if not self.redis_available:
+            # Fail fast instead of waiting for the socket timeout
+            raise RedisConnectionError("Redis is unavailable; serving only locally cached sessions")
+        redis_session = self._redis_session(session_id)
+        async with self._lock(session_id):
+            try:
+                # The whole list, regardless of the session's token budget
+                items, authors = await redis_session.get_authored_items()
+            except REDIS_UNAVAILABLE_ERRORS:
+                self._mark_unavailable()
+                raise
+            hot = _HotSession(items, redis_session.summary_present, authors)
+            for _, op, payload in self._logged_ops(session_id):
+                _apply_local(hot, op, payload, redis_session.max_items)
+        self.redis_reads += 1
+        self.put_hot(session_id, hot)
+        return hot
+
+    # Flushing
+
+    def _ensure_flusher(self) -> None:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+
+    def _mark_unavailable(self) -> None:
+        if self.redis_available:
+            self.redis_available = False
+            self._needs_reconcile = True
+            self.outages += 1
+            print("Redisに接続できないため、セッションへの書き込みをローカルに保存します")
+
+    def _mark_available(self) -> None:
+        if not self.redis_available:
+            self.redis_available = True
+            print(f"Redisに再接続しました（未反映の書き込み: {self.pending_ops()}件）")
+
+    async def _flush_loop(self) -> None:
+        backoff = self.flush_interval
+        while True:
+            # Writes of the interval are flushed together
+            await asyncio.sleep(backoff)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"セッションの書き込みの反映に失敗しました: {e}")
+            if not self.redis_available:
+                backoff = min(max(backoff, self.flush_interval) * 2, 30.0)
+                continue
+            backoff = self.flush_interval
+            if self._needs_reconcile and not self.pending_ops():
+                await self.reconcile()
+
+    async def flush(self) -> int:
+        """
+        Replay logged operations to Redis, oldest first
+
+        Returns:
+            Number of operations applied
+        """
+        rows = self._db.execute(
+            "SELECT seq, session_id, op, payload FROM pending ORDER BY seq LIMIT ?",
+            (self.batch_size,)
+        ).fetchall()
+        if not rows:
+            if not self.redis_available:
+                await self._probe()
+            return 0
+
+        by_session: "OrderedDict[str, List[Tuple[int, str, Optional[str]]]]" = OrderedDict()
+        for seq, session_id, op, payload in rows:
+            by_session.setdefault(session_id, []).append((seq, op, payload))
+
+        applied = 0
+        for session_id, ops in by_session.items():
+            async with self._lock(session_id):
+                try:
+                    applied += await self._flush_session(session_id, ops)
+                except REDIS_UNAVAILABLE_ERRORS:
+                    self._mark_unavailable()
+                    break
+                except Exception as e:
+                    # Retried on the next flush; later operations of the session wait
+                    self.failed_ops += 1
+                    print(f"セッション {session_id} の書き込みを反映できませんでした: {e}")
+        else:
+            self._mark_available()
+        self.flushes += 1
+        self.flushed_ops += applied
+        return applied
+
+    async def _probe(self) -> None:
+        try:
+            await self.manager.get_client().ping()
+        except REDIS_UNAVAILABLE_ERRORS:
+            return
+        self._mark_available()
+
+    async def _flush_session(self, session_id: str, ops: List[Tuple[int, str, Optional[str]]]) -> int:
+        redis_session = self._redis_session(session_id)
+        applied = 0
+        index = 0
+        while index < len(ops):
+            seq, op, payload = ops[index]
+            if op == "add":
+                # Consecutive appends become one write
+                seqs, items, authors = [], [], []
+                while index < len(ops) and ops[index][1] == "add":
+                    seqs.append(ops[index][0])
+                    added, added_authors = _added_items(ops[index][2])
+                    items.extend(added)
+                    authors.extend(added_authors)
+                    index += 1
+                await redis_session.add_items(items, authors)
+            else:
+                seqs = [seq]
+                index += 1
+                if op == "pop":
+                    await redis_session.pop_item()
+                elif op == "clear":
+                    await redis_session.clear_session()
+                else:
+                    raise ValueError(f"Unknown logged operation '{op}'")
+            self._forget_ops(session_id, seqs)
+            applied += len(seqs)
+        return applied
+
+    async def reconcile(self) -> int:
+        """
+        Compare hot sessions with Redis after an outage
+
+        Local copies whose length differs from Redis are dropped and clean
+        copies are marked stale, so the next read reloads them.
+
+        Returns:
+            Number of local copies dropped
+        """
+        self._needs_reconcile = False
+        dropped = 0
+        for session_id in list(self._hot):
+            if self._pending.get(session_id):
+                continue
+            try:
+                info = await self._redis_session(session_id).get_session_info()
+            except REDIS_UNAVAILABLE_ERRORS:
+                self._mark_unavailable()
+                break
+            hot = self._hot.get(session_id)
+            if hot is None:
+                continue
+            if info["item_count"] != len(hot.items):
+                del self._hot[session_id]
+                dropped += 1
+            else:
+                hot.loaded_at = 0.0
+        self.reconciled += 1
+        self.diverged += dropped
+        if dropped:
+            print(f"Redisと内容が異なる{dropped}件のセッションをRedisから読み直します")
+        return dropped
+
+    async def close(self) -> None:
+        """Stop the flusher after a last flush; unflushed operations stay in the log"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.redis_available = True
+        try:
+            while self.pending_ops() and await self.flush():
+                pass
+        except Exception as e:
+            print(f"セッションの書き込みの反映に失敗しました: {e}")
+        if self.pending_ops():
+            print(f"{self.pending_ops()}件の書き込みは次回の起動時にRedisに反映します（{self.log_path}）")
+        self._db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "redis_available": self.redis_available,
+            "hot_sessions": len(self._hot),
+            "pending_ops": self.pending_ops(),
+            "outages": self.outages,
+            "flushes": self.flushes,
+            "flushed_ops": self.flushed_ops,
+            "failed_ops": self.failed_ops,
+            "local_reads": self.local_reads,
+            "redis_reads": self.redis_reads,
+            "stale_reads": self.stale_reads,
+            "reconciled": self.reconciled,
+            "diverged": self.diverged
+        }
+
+
+def _added_items(payload: str) -> Tuple[List[TResponseInputItem], List[Optional[str]]]:
+    """Items and authors of a logged add"""
+    added = json.loads(payload)
+    if isinstance(added, dict):
+        return added["items"], added["authors"]
+    return added, [None] * len(added)
+
+
+def _apply_local(hot: _HotSession, op: str, payload: Optional[str], max_items: int) -> None:
+    """Apply a logged operation to a local copy, mirroring what Redis will do"""
+    if op == "add":
+        items, authors = _added_items(payload)
+        hot.items.extend(items)
+        hot.authors.extend(authors)
+        if max_items and len(hot.items) > max_items:
+            del hot.items[:len(hot.items) - max_items]
+            del hot.authors[:len(hot.authors) - max_items]
+            hot.summary = False
+    elif op == "pop":
+        if hot.items:
+            hot.items.pop()
+            hot.authors.pop()
+    elif op == "clear":
+        hot.items, hot.authors = [], []
+        hot.summary = False
+
+
+class TieredSession:
+    """Session that reads and writes locally first and reaches Redis in the background"""
+
+    def __init__(self, store: TieredSessionStore, redis_session: RedisSession):
+        self.store = store
+        self.redis_session = redis_session
+        self.session_id = redis_session.session_id
+        self.history_token_budget = redis_session.history_token_budget
+        self.token_counter = redis_session.token_counter
+        self.summary_present = False
+        self._turn = _TurnBuffer()
+
+    async def _items(self) -> _HotSession:
+        store = self.store
+        hot = store.get_hot(self.session_id)
+        if hot is not None and store.is_fresh(self.session_id, hot):
+            store.local_reads += 1
+            return hot
+        try:
+            return await store.load(self.session_id)
+        except REDIS_UNAVAILABLE_ERRORS:
+            if hot is None:
+                raise
+            # A stale copy is better than a failed turn
+            store.stale_reads += 1
+            return hot
+
+    async def get_items(
+        self,
+        limit: Optional[int] = None,
+        max_tokens: Optional[int] = None
+    ) -> List[TResponseInputItem]:
+        """
+        Retrieve conversation items, locally when the hot copy is fresh
+
+        Args:
+            limit: Maximum number of items to retrieve (None for all)
+            max_tokens: Longest recent suffix within this token budget
+                (defaults to history_token_budget when limit is None)
+
+        Returns:
+            List of conversation items
+        """
+        hot = await self._items()
+        if max_tokens is None and limit is None:
+            max_tokens = self.history_token_budget
+        items = hot.items if self._turn.items is None else hot.items + self._turn.items
+        if max_tokens is not None:
+            count_tokens = self.token_counter
+            total = 0
+            start = len(items)
+            while start > 0:
+                tokens = count_tokens(items[start - 1])
+                if total + tokens > max_tokens:
+                    break
+                total += tokens
+                start -= 1
+            result = _drop_orphaned_outputs(items[start:])
+        else:
+            result = items[max(len(items) - limit, 0):] if limit is not None else items
+        self.summary_present = hot.summary and len(result) == len(items)
+        # Callers may modify the list and the items they get
+        return _copy_items(result)
+
+    def with_token_budget(self, max_tokens: Optional[int]) -> "TieredSession":
+        """View of this session whose get_items() defaults to a token budget (summary_present is per view)"""
+        view = copy.copy(self)
+        view.history_token_budget = max_tokens
+        return view
+
+    async def get_authored_items(self) -> Tuple[List[TResponseInputItem], List[Optional[str]]]:
+        """Full history with the author of each item, see RedisSession.get_authored_items"""
+        hot = await self._items()
+        self.summary_present = hot.summary
+        items, authors = _copy_items(hot.items), list(hot.authors)
+        if self._turn.items is not None:
+            items += self._turn.items
+            authors += self._turn.authors
+        return items, authors
+
+    async def add_items(
+        self,
+        items: List[TResponseInputItem],
+        authors: Optional[List[Optional[str]]] = None
+    ) -> None:
+        """Append items; acknowledged once they are in the local log (buffered inside a turn)"""
+        if not items:
+            return
+        if self._turn.items is not None:
+            self._turn.add(items, authors)
+            return
+        payload = self.store.log(self.session_id, "add", items, authors)
+        hot = self.store.get_hot(self.session_id)
+        if hot is not None:
+            _apply_local(hot, "add", payload, self.redis_session.max_items)
+
+    async def pop_item(self) -> Optional[TResponseInputItem]:
+        """Remove and return the most recent item"""
+        if self._turn.items:
+            return self._turn.pop()
+        hot = await self._items()
+        if not hot.items:
+            return None
+        self.store.log(self.session_id, "pop")
+        hot.authors.pop()
+        return hot.items.pop()
+
+    async def clear_session(self) -> None:
+        """Remove all items; the session is known to be empty from now on"""
+        if self._turn.items is not None:
+            self._turn.open()
+        self.store.log(self.session_id, "clear")
+        self.store.put_hot(self.session_id, _HotSession([]))
+
+    async def get_session_info(self) -> Dict[str, Any]:
+        """Get session metadata, with the item count including unflushed writes"""
+        hot = self.store.get_hot(self.session_id)
+        info = None
+        if self.store.redis_available or hot is None:
+            try:
+                info = await self.redis_session.get_session_info()
+            except REDIS_UNAVAILABLE_ERRORS:
+                self.store._mark_unavailable()
+                if hot is None:
+                    raise
+        if info is None:
+            info = {
+                "session_id": self.session_id,
+                "item_count": len(hot.items),
+                "ttl_seconds": None,
+                "summary_present": hot.summary,
+                "archived_count": 0
+            }
+        elif hot is not None and self.store.pending_ops(self.session_id):
+            info["item_count"] = len(hot.items)
+        info["exists"] = info["item_count"] > 0
+        info["pending_ops"] = self.store.pending_ops(self.session_id)
+        return info
+
+    async def extend_ttl(self, seconds: Optional[int] = None) -> None:
+        """Extend the Redis TTL; skipped while Redis is unavailable (flushed writes refresh it)"""
+        if not self.store.redis_available:
+            return
+        try:
+            await self.redis_session.extend_ttl(seconds)
+        except REDIS_UNAVAILABLE_ERRORS:
+            self.store._mark_unavailable()
+
+    @property
+    def in_turn(self) -> bool:
+        return self._turn.items is not None
+
+    def begin_turn(self) -> None:
+        """Buffer add_items() calls until commit_turn(), see RedisSession.begin_turn"""
+        if self._turn.items is not None:
+            raise RuntimeError(f"Session {self.session_id} already has an open turn")
+        self._turn.open()
+
+    async def commit_turn(self) -> None:
+        """Log the items buffered in the turn as one operation"""
+        items, authors = self._turn.items, self._turn.authors
+        if items is None:
+            raise RuntimeError(f"Session {self.session_id} has no open turn")
+        self._turn.close()
+        try:
+            await self.add_items(items, authors if any(authors) else None)
+        except BaseException:
+            self._turn.items, self._turn.authors = items, authors
+            raise
+
+    def rollback_turn(self) -> None:
+        """Discard the items buffered in the turn"""
+        self._turn.close()
+
+    @contextlib.asynccontextmanager
+    async def turn(self) -> AsyncIterator["TieredSession"]:
+        """Buffer the writes of a turn, committing them if the block succeeds"""
+        self.begin_turn()
+        try:
+            yield self
+            await self.commit_turn()
+        finally:
+            self.rollback_turn()
+
+    async def close(self) -> None:
+        """Release the Redis session (the store keeps flushing its writes)"""
+        self.store.release(self.redis_session)
+        await self.redis_session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+_default_store: Optional[TieredSessionStore] = None
+
+
+def create_tiered_store(manager: RedisSessionManager) -> Optional[TieredSessionStore]:
+    """Create the process-wide TieredSessionStore if TIERED_SESSION is enabled"""
+    global _default_store
+    if os.getenv("TIERED_SESSION", "").lower() not in ("1", "true"):
+        return None
+    if _default_store is None:
+        _default_store = TieredSessionStore(manager)
+    return _default_store
@@ -0,0 +1,65 @@
+"""
+Token estimation for session items
+
+The default estimator is a cheap heuristic that needs no tokenizer: roughly
+four ASCII characters per token, and one token per non-ASCII character
+(Japanese text is close to that). Use make_tiktoken_counter() for exact
+counts when tiktoken is installed.
+"""
+from typing import Any, Callable, Dict
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency
+    tiktoken = None
+
+TokenCounter = Callable[[Dict[str, Any]], int]
+
+# Fixed cost of an item's role/type framing in the model input
+ITEM_OVERHEAD_TOKENS = 4
+
+# Fields that carry identifiers or enum values rather than prompt text
+_METADATA_KEYS = frozenset({"id", "type", "role", "status", "call_id", "annotations"})
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Estimate the token count of a string"""
+    chars = len(text)
+    # Each non-ASCII character in the BMP takes 2-3 bytes in UTF-8
+    non_ascii = (len(text.encode("utf-8")) - chars) // 2
+    ascii_chars = chars - non_ascii
+    return ascii_chars // 4 + non_ascii + 1
+
+
+def _iter_text(value: Any):
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for key, child in value.items():
+            if key not in _METADATA_KEYS:
+                yield from _iter_text(child)
+    elif isinstance(value, list):
+        for child in value:
+            yield from _iter_text(child)
+
+
+def estimate_item_tokens(item: Dict[str, Any]) -> int:
+    """Estimate the token count of a session item (the default TokenCounter)"""
+    return ITEM_OVERHEAD_TOKENS + sum(estimate_text_tokens(text) for text in _iter_text(item))
+
+
+def make_tiktoken_counter(encoding_name: str = "o200k_base") -> TokenCounter:
+    """
+    Create an exact TokenCounter backed by tiktoken
+
+    Args:
+        encoding_name: tiktoken encoding (o200k_base for GPT-4o family models)
+    """
+    if tiktoken is None:
+        raise RuntimeError("make_tiktoken_counter requires the 'tiktoken' package")
+    encoding = tiktoken.get_encoding(encoding_name)
+
+    def count(item: Dict[str, Any]) -> int:
+        return ITEM_OVERHEAD_TOKENS + sum(len(encoding.encode(text)) for text in _iter_text(item))
+
+    return count